@@ -0,0 +1,88 @@
+"""Memory of N worker processes holding the dataset and a model privately vs through the shared store.
+
+Each worker loads the dataset and a model and scores a few rows, either the private way (a pandas
+copy of the data and an unpickled model) or by attaching to the memory-mapped Arrow cache and the
+shared compiled engine. Reports the memory each worker dirtied while loading and the proportional
+set size summed over all workers, read from /proc (Linux only).
+
+Usage: python -m benchmarks.bench_shared_memory [--workers 1 2 4] [--rows 500000] [--model LightGBMClassifier]
+"""
+import os
+import argparse
+import tempfile
+import multiprocessing
+
+from benchmarks.synthetic import make_transactions
+from utils.data_loader import FEATURES
+
+
+def memory_counters(pid="self"):
+    """Proportional set size and private dirty bytes of a process, from /proc/<pid>/smaps_rollup."""
+    counters = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ("Pss:", "Private_Dirty:"):
+                counters[parts[0][:-1]] = int(parts[1]) * 1024
+    return counters
+
+
+def _worker(mode, csv_path, model_name, ready, done):
+    import joblib
+    import pyarrow.feather as feather
+
+    from utils.data_loader import convert_to_arrow, load_dataset
+    from utils.model_registry import registry
+
+    before = memory_counters()["Private_Dirty"]
+    if mode == "shared":
+        data = load_dataset(csv_path)
+        model = registry.attach(model_name)
+    else:
+        data = feather.read_table(convert_to_arrow(csv_path)).to_pandas()
+        model = joblib.load(registry.path(model_name))
+    model.predict_proba(data[FEATURES].iloc[:1000].to_numpy())
+    ready.put(memory_counters()["Private_Dirty"] - before)
+    done.wait()
+
+
+def measure(mode, n_workers, csv_path, model_name):
+    context = multiprocessing.get_context("spawn")
+    ready, done = context.Queue(), context.Event()
+    workers = [context.Process(target=_worker, args=(mode, csv_path, model_name, ready, done)) for _ in range(n_workers)]
+    for worker in workers:
+        worker.start()
+    dirtied = [ready.get() for _ in workers]
+    pss = sum(memory_counters(worker.pid)["Pss"] for worker in workers)
+    done.set()
+    for worker in workers:
+        worker.join()
+    return sum(dirtied) / n_workers, pss
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--model", default="LightGBMClassifier")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="fraud_shm_") as tmp:
+        csv_path = os.path.join(tmp, "transactions.csv")
+        make_transactions(args.rows, with_id=True, with_class=True).to_csv(csv_path, index=False)
+
+        # Build the Arrow cache and the shared engine up front so every run measures attaching only
+        from utils.data_loader import convert_to_arrow
+        from utils.model_registry import registry
+        convert_to_arrow(csv_path)
+        registry.attach(args.model)
+
+        print(f"{'mode':<8} {'workers':>7} {'dirtied/worker MiB':>19} {'total PSS MiB':>14}")
+        for mode in ("private", "shared"):
+            for n_workers in args.workers:
+                dirtied, pss = measure(mode, n_workers, csv_path, args.model)
+                print(f"{mode:<8} {n_workers:>7} {dirtied / 2**20:19,.1f} {pss / 2**20:14,.1f}")
+
+
+if __name__ == "__main__":
+    main()
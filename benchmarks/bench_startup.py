@@ -0,0 +1,62 @@
+"""Cold-start time of the Streamlit app: time to the first rendered page in a fresh interpreter.
+
+Every measurement runs in a new Python process, so nothing is already imported or cached in memory,
+and renders one page of ``streamlit_app.py`` headlessly with Streamlit's ``AppTest``. It reports the
+render time, the interpreter's import time and which heavy libraries the page pulled in. Point
+``--app`` at an older copy of the script (e.g. ``git show <rev>:streamlit_app.py > old_app.py``) to
+compare before and after.
+
+Usage: python -m benchmarks.bench_startup [--pages about conclusion dashboard prediction] [--repeat 3] [--app streamlit_app.py]
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+HEAVY_MODULES = ["pandas", "pyarrow", "matplotlib", "seaborn", "sklearn", "joblib", "lightgbm", "xgboost"]
+
+# Runs in the child process: import Streamlit's test harness first so its own (unavoidable) import
+# cost is excluded, then time a single first render of the page
+_CHILD = """
+import sys
+import json
+import time
+from streamlit.testing.v1 import AppTest
+already = set(sys.modules)
+app = AppTest.from_file({app!r}, default_timeout=600)
+app.session_state["page_selection"] = {page!r}
+start = time.perf_counter()
+app.run()
+seconds = time.perf_counter() - start
+loaded = [name for name in {heavy!r} if name in sys.modules and name not in already]
+print(json.dumps({{"seconds": seconds, "imported": loaded, "errors": [e.message for e in app.exception]}}))
+"""
+
+
+def first_render(app, page):
+    code = _CHILD.format(app=os.path.abspath(app), page=page, heavy=HEAVY_MODULES)
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", nargs="+", default=["about", "conclusion", "dashboard", "prediction"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--app", default="streamlit_app.py", help="app script to start (default: %(default)s)")
+    args = parser.parse_args()
+
+    print(f"{'page':<18} {'median s':>9} {'min s':>7}  heavy imports")
+    for page in args.pages:
+        runs = [first_render(args.app, page) for _ in range(args.repeat)]
+        for run in runs:
+            if run["errors"]:
+                print(f"{page}: {run['errors'][0]}", file=sys.stderr)
+        seconds = [run["seconds"] for run in runs]
+        print(f"{page:<18} {statistics.median(seconds):9.2f} {min(seconds):7.2f}  {', '.join(runs[-1]['imported']) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
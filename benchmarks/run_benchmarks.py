@@ -0,0 +1,173 @@
+"""Benchmark harness for the app's hot paths on synthetic data.
+
+Times CSV loading, preprocessing, predict/predict_proba for every pickled model, the dashboard
+aggregates and distribution plot generation, reporting throughput, latency percentiles and peak RSS.
+Results can be saved as a baseline and later runs compared against it.
+
+Usage:
+    python -m benchmarks.run_benchmarks --rows 100000 --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run_benchmarks --rows 100000 --compare benchmarks/baseline.json
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import make_transactions
+from benchmarks.bench_preprocess import legacy_preprocess
+from utils.data_loader import FEATURES, frame_from_table, load_table
+from utils.dashboard_stats import build_dashboard_stats
+from utils.ingestion import read_chunks
+from utils.model_registry import registry
+from utils.plot_summaries import draw_boxplot, draw_histogram, summarize_feature
+from utils.profiling import ResourceMonitor
+from utils.transform import WinsorScaler
+
+
+def measure(fn, rows, repeat, setup=None):
+    """Run ``fn`` ``repeat`` times and summarize latency, throughput and peak RSS."""
+    timings = []
+    with ResourceMonitor(interval=0.01) as monitor:
+        for _ in range(repeat):
+            args = setup() if setup else ()
+            start = time.perf_counter()
+            fn(*args)
+            timings.append(time.perf_counter() - start)
+    timings = np.array(timings)
+    return {
+        "rows": rows,
+        "repeat": repeat,
+        "p50_ms": float(np.percentile(timings, 50) * 1000),
+        "p95_ms": float(np.percentile(timings, 95) * 1000),
+        "max_ms": float(timings.max() * 1000),
+        "rows_per_second": float(rows / np.median(timings)) if timings.min() > 0 else 0.0,
+        "peak_rss_mb": monitor.peak_rss / 2**20,
+    }
+
+
+def run_suite(rows, repeat, models=None, log=print):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    results = {}
+
+    def bench(name, fn, n=rows, setup=None, times=repeat):
+        results[name] = measure(fn, n, times, setup)
+        r = results[name]
+        log(f"{name:<42} p50 {r['p50_ms']:9.1f} ms  p95 {r['p95_ms']:9.1f} ms  "
+            f"{r['rows_per_second']:14,.0f} rows/s  peak {r['peak_rss_mb']:7,.0f} MiB")
+
+    df = make_transactions(rows, with_id=True, with_class=True)
+    bounds = registry.get("winsorization_bounds")
+    scaler = registry.get("scaler")
+    transformer = WinsorScaler.from_artifacts(bounds, scaler)
+    features = df[FEATURES]
+
+    with tempfile.TemporaryDirectory(prefix="fraud_bench_") as tmp:
+        csv_path = os.path.join(tmp, "creditcard.csv")
+        df.to_csv(csv_path, index=False)
+        cache_dir = os.path.join(tmp, "cache")
+
+        # Data loading: the original pandas parse, a cold Arrow conversion and a warm memory-mapped load
+        bench("load.read_csv (pandas)", lambda: pd.read_csv(csv_path))
+        bench("load.arrow_cold (convert + mmap)",
+              lambda: frame_from_table(load_table(csv_path, cache_dir=cache_dir)),
+              setup=lambda: shutil.rmtree(cache_dir, ignore_errors=True) or ())
+        load_table(csv_path, cache_dir=cache_dir)
+        bench("load.arrow_warm (mmap)", lambda: frame_from_table(load_table(csv_path, cache_dir=cache_dir)))
+        # Upload parsing: streamed, schema-typed chunks as batch scoring reads them
+        bench("load.ingest (typed chunks)", lambda: sum(len(chunk) for chunk in read_chunks(csv_path)))
+
+    # Preprocessing
+    bench("preprocess.legacy", lambda frame: legacy_preprocess(frame, bounds, scaler), setup=lambda: (features.copy(),))
+    bench("preprocess.fused", lambda: transformer.transform(features))
+    block = transformer.transform(features)
+
+    # Model inference
+    for name in models or registry.classifiers():
+        model = registry.get(name)
+        model.predict_proba(block[:1])
+        bench(f"predict.{name}", lambda m=model: m.predict(block))
+        bench(f"predict_proba.{name}", lambda m=model: m.predict_proba(block))
+
+    # Dashboard aggregates: the original per-render pandas calls and the single-pass engine
+    def legacy_aggregates():
+        df.describe(), df.isnull().sum(), df.corr(), df["Class"].value_counts()
+        df[df["Class"] == 1].shape, df[df["Class"] == 0].shape
+
+    bench("dashboard.legacy_aggregates", legacy_aggregates)
+    bench("dashboard.stats_engine", lambda: build_dashboard_stats(df))
+
+    # Distribution plots rendered to PNG: seaborn over every row vs cached summaries
+    def render(draw):
+        fig, ax = plt.subplots(figsize=(5, 3))
+        draw(ax)
+        fig.savefig(io.BytesIO(), format="png")
+        plt.close(fig)
+
+    plot_repeat = max(1, min(repeat, 3))
+    bench("plot.seaborn_hist_kde", lambda: render(lambda ax: sns.histplot(df["V1"], kde=True, ax=ax)), times=plot_repeat)
+    bench("plot.seaborn_boxplot", lambda: render(lambda ax: sns.boxplot(x=df["V1"], ax=ax)), times=plot_repeat)
+    bench("plot.summary_build", lambda: summarize_feature(df["V1"].to_numpy()), times=plot_repeat)
+    summary = summarize_feature(df["V1"].to_numpy())
+    bench("plot.summary_hist_kde", lambda: render(lambda ax: draw_histogram(ax, summary)), times=plot_repeat)
+    bench("plot.summary_boxplot", lambda: render(lambda ax: draw_boxplot(ax, summary)), times=plot_repeat)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Return the benchmarks whose median latency regressed by more than ``tolerance`` (a fraction)."""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get("results", {}).get(name)
+        if before is None or before["rows"] != result["rows"]:
+            continue
+        change = result["p50_ms"] / before["p50_ms"] - 1 if before["p50_ms"] else 0.0
+        flag = "REGRESSION" if change > tolerance else ""
+        print(f"{name:<42} {before['p50_ms']:9.1f} ms -> {result['p50_ms']:9.1f} ms  {change:+7.1%} {flag}")
+        if change > tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000, help="synthetic rows per benchmark (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per benchmark (default: %(default)s)")
+    parser.add_argument("--models", nargs="+", help="models to benchmark (default: every pickle under models/)")
+    parser.add_argument("--save-baseline", metavar="PATH", help="write the results as a baseline JSON file")
+    parser.add_argument("--compare", metavar="PATH", help="compare against a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p50 slowdown before failing (default: 0.2)")
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.rows, args.repeat, args.models)
+    document = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "results": results,
+    }
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(document, f, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} benchmark(s) regressed by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+import numpy as np
+import pandas as pd
+
+from utils.data_loader import FEATURES
+
+
+def make_transactions(n_rows, seed=0, with_id=False, with_class=False, fraud_rate=0.5):
+    """Synthetic transactions matching the 29-feature schema (V1-V28, Amount).
+
+    PCA components are drawn from a standard normal with a few heavy-tailed outliers so that
+    winsorization has something to clip; Amount is uniform over the dataset's observed range.
+    """
+    rng = np.random.default_rng(seed)
+    values = rng.standard_normal((n_rows, len(FEATURES) - 1), dtype=np.float32)
+    outliers = rng.random(values.shape) < 0.01
+    values[outliers] *= 8.0
+    df = pd.DataFrame(values, columns=FEATURES[:-1])
+    df["Amount"] = rng.uniform(50.0, 24000.0, n_rows).round(2).astype(np.float32)
+    if with_id:
+        df.insert(0, "id", np.arange(n_rows, dtype=np.int64))
+    if with_class:
+        labels = (rng.random(n_rows) < fraud_rate).astype(np.int64)
+        # Shift a few components for fraud rows so models have signal to learn
+        df.loc[labels == 1, FEATURES[:4]] += 1.5
+        df["Class"] = labels
+    return df
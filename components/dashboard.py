@@ -4,19 +4,74 @@ import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 
-def dashboard(data):
+from utils.dashboard_stats import build_dashboard_stats
+from utils.drift import PSI_ALERT, PSI_WARNING, load_profile, monitor_for, monitored_models
+from utils.plot_summaries import draw_histogram, feature_summary
+
+def drift_monitor():
+    """Drift of the data scored on the Prediction page and by fraud_score, against the training profile."""
+    st.header("🚨 Drift Monitor")
+    models = monitored_models()
+    if load_profile() is None:
+        st.info("No reference profile yet. Run `python -m train` or `python -m utils.drift build` to create `models/drift_profile.json`.")
+        return
+    if not models:
+        st.info("No transactions scored yet. Drift is measured on the rows scored from the Prediction page or `fraud_score`.")
+        return
+
+    model_name = st.selectbox("Monitored Model:", models)
+    monitor = monitor_for(model_name)
+    report = monitor.report()
+    alerts = monitor.alerts(report)
+    st.write(f"**{report['rows']:,}** transactions scored since the reference profile was built.")
+    if not alerts:
+        st.success("✅ No drift detected.")
+    for level, message in alerts:
+        (st.error if level == "error" else st.warning)(f"⚠️ {message}")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        table = pd.DataFrame(report["features"]).set_index("feature").sort_values("psi", ascending=False)
+        st.dataframe(
+            table[["psi", "ks", "clip_rate", "reference_clip_rate", "missing_rate"]].style
+            .format({"psi": "{:.4f}", "ks": "{:.4f}", "clip_rate": "{:.2%}", "reference_clip_rate": "{:.2%}", "missing_rate": "{:.2%}"})
+            .highlight_between(subset=["psi"], left=PSI_WARNING, right=PSI_ALERT, color="#8a6d00")
+            .highlight_between(subset=["psi"], left=PSI_ALERT, right=None, color="#8b0000"),
+            use_container_width=True,
+        )
+    with col2:
+        scores = report["scores"]
+        if scores is not None:
+            st.write(f"**Fraud probability distribution** (PSI {scores['psi']:.4f}, KS {scores['ks']:.4f})")
+            centres = (np.arange(len(scores["reference"])) + 0.5) / len(scores["reference"])
+            fig, ax = plt.subplots(figsize=(5, 3))
+            ax.bar(centres, scores["reference"], width=1 / len(centres), alpha=0.5, label="Training")
+            ax.bar(centres, scores["histogram"], width=1 / len(centres), alpha=0.5, label="Scored")
+            ax.set_xlabel("Fraud probability")
+            ax.set_ylabel("Share of transactions")
+            ax.legend()
+            st.pyplot(fig)
+
+def dashboard(data, order=None, stats=None):
     st.title("📊 Fraud Detection Dashboard")
     st.markdown("---")
 
+    # Aggregates are precomputed once per dataset version; fall back to computing them here
+    if stats is None:
+        stats = build_dashboard_stats(data)
+    class_counts = stats["class_counts"]
+
     # Key Metrics
     st.header("🔑 Key Metrics")
     col1, col2, col3 = st.columns(3)
     with col1:
-        st.metric("Total Transactions", data.shape[0])
+        st.metric("Total Transactions", stats["n_rows"])
     with col2:
-        st.metric("Fraudulent Transactions", data[data["Class"] == 1].shape[0])
+        st.metric("Fraudulent Transactions", int(class_counts.get(1, 0)))
     with col3:
-        st.metric("Non-Fraudulent Transactions", data[data["Class"] == 0].shape[0])
+        st.metric("Non-Fraudulent Transactions", int(class_counts.get(0, 0)))
+
+    drift_monitor()
 
     # Dataset Overview
     st.header("📂 Dataset Overview")
@@ -24,17 +79,17 @@ def dashboard(data):
     This section provides a quick overview of the dataset, including its structure and basic statistics.
     """)
     st.write("**Preview of the Dataset:**")
-    st.dataframe(data.head())
+    st.dataframe(data.iloc[order[:5]] if order is not None else data.head())
 
 
     col1, col2, col3 = st.columns(3)
     with col1:
         st.write("**Dataset Shape:**")
-        st.write(f"Number of Rows: {data.shape[0]}")
-        st.write(f"Number of Columns: {data.shape[1]}")
+        st.write(f"Number of Rows: {stats['n_rows']}")
+        st.write(f"Number of Columns: {stats['n_columns']}")
 
     with col2:
-        missing_values = data.isnull().sum().to_frame().T 
+        missing_values = stats["missing"].to_frame().T 
         st.write("**Missing Values per Column:**")
         st.dataframe(missing_values)
 
@@ -49,7 +104,7 @@ def dashboard(data):
     This section provides descriptive statistics for the numerical features in the dataset.
     """)
     st.write("**Summary Statistics:**")
-    st.dataframe(data.describe())
+    st.dataframe(stats["describe"])
 
     # Class Distribution
     st.header("📉 Class Distribution")
@@ -61,14 +116,14 @@ def dashboard(data):
     # Two Plots in a Row: Class Distribution and Feature Distribution
     col1, col2 = st.columns(2)
     with col1:
-        class_counts = data["Class"].value_counts()
         st.write("**Class Counts:**")
         st.write(class_counts)
         
 
     with col2:
         fig, ax = plt.subplots(figsize=(5, 3))  # Smaller plot size
-        sns.countplot(x="Class", data=data, ax=ax)
+        ordered_counts = class_counts.sort_index()
+        sns.barplot(x=ordered_counts.index.astype(str), y=ordered_counts.values, ax=ax)
         ax.set_title("Distribution of Transactions")
         ax.set_xlabel("Class (0: Non-Fraud, 1: Fraud)")
         ax.set_ylabel("Count")
@@ -83,9 +138,11 @@ def dashboard(data):
         This section allows you to explore the distribution of individual features.
         """)
         feature = st.selectbox("Select a Feature to Visualize", data.columns)
-        if feature:
+        summary = feature_summary(data, feature) if feature else None
+        if summary:
+            # Drawn from cached bins and a grid-evaluated KDE instead of every row
             fig, ax = plt.subplots()
-            sns.histplot(data[feature], kde=True, ax=ax)
+            draw_histogram(ax, summary)
             ax.set_title(f"Distribution of {feature}")
             ax.set_xlabel(feature)
             ax.set_ylabel("Frequency")
@@ -98,7 +155,7 @@ def dashboard(data):
         This section displays the correlation matrix for the numerical features in the dataset. 
         Correlation helps identify relationships between features.
         """)
-        corr = data.corr()
+        corr = stats["corr"]
         fig, ax = plt.subplots(figsize=(8, 6))  # Smaller plot size
         sns.heatmap(corr, annot=False, cmap="coolwarm", ax=ax)
         ax.set_title("Correlation Matrix")
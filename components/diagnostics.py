@@ -0,0 +1,59 @@
+import os
+import streamlit as st
+import pandas as pd
+
+from utils.model_registry import registry
+from utils.profiling import PROFILE_DIR, instrumentation, rss_bytes
+
+def diagnostics():
+    st.title("🩺 Diagnostics")
+    st.markdown("---")
+    st.write("""
+    Timing and memory of every instrumented stage since the server started, aggregated over all sessions.
+    Durations are in milliseconds; RSS growth is the increase of the process's resident memory while a stage ran.
+    """)
+
+    summary = pd.DataFrame(instrumentation.summary())
+    st.metric("Resident Memory", f"{rss_bytes() / 2**20:,.0f} MiB")
+    if summary.empty:
+        st.info("No spans recorded yet. Open another page and come back.")
+        return
+
+    # Per-stage latency histogram summaries
+    st.header("⏱️ Stages")
+    table = summary.copy()
+    for column in ["total_seconds", "mean_seconds", "p50_seconds", "p95_seconds", "max_seconds"]:
+        table[column.replace("_seconds", "_ms")] = table.pop(column) * 1000
+    table["rss_growth_mib"] = table.pop("rss_growth_bytes") / 2**20
+    st.dataframe(table.set_index("span").sort_values("total_ms", ascending=False), use_container_width=True)
+    st.bar_chart(table.set_index("span")["total_ms"])
+
+    # The most recent individual spans, newest first
+    st.header("🕒 Recent Spans")
+    recent = pd.DataFrame(instrumentation.recent_spans())
+    recent["ms"] = recent.pop("seconds") * 1000
+    recent["rss_delta_mib"] = recent.pop("rss_delta_bytes") / 2**20
+    recent["rss_mib"] = recent.pop("rss_bytes") / 2**20
+    st.dataframe(recent, use_container_width=True)
+
+    with st.expander("Loaded Models"):
+        st.dataframe(pd.DataFrame(registry.stats()))
+
+    # Same numbers as the metrics file written after every rerun
+    with st.expander("Prometheus Metrics"):
+        text = instrumentation.prometheus_text()
+        st.code(text, language="text")
+        st.download_button("📥 Download Metrics", text, "metrics.prom", "text/plain")
+
+    # cProfile dumps of slow reruns (enabled with FRAUD_PROFILE_SLOW_SECONDS)
+    with st.expander("Slow Rerun Profiles"):
+        profiles = sorted(os.listdir(PROFILE_DIR), reverse=True) if os.path.isdir(PROFILE_DIR) else []
+        if not profiles:
+            st.write("No profiles yet. Set `FRAUD_PROFILE_SLOW_SECONDS` to keep a cProfile dump of reruns slower than that.")
+        for name in profiles[:20]:
+            with open(os.path.join(PROFILE_DIR, name), "rb") as f:
+                st.download_button(f"📥 {name}", f, name, "application/octet-stream", key=f"profile-{name}")
+
+    if st.button("Reset Statistics"):
+        instrumentation.reset()
+        st.rerun()
@@ -1,11 +1,12 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
-import joblib  # For loading the saved model
 
-def machine_Learning(data):
+from utils.evaluation import evaluate_models
+from utils.model_registry import registry
+
+def machine_Learning():
     st.title("🤖 Machine Learning Workflow")
     st.markdown("---")
 
@@ -22,7 +23,7 @@ def machine_Learning(data):
         st.subheader("1. Model Selection")
         st.write("""
         - **Algorithms Used**: XGBoost, Random Forest, and LightGBM were selected for their ability to handle imbalanced datasets and high-dimensional data.
-        - **Hyperparameters**: Default hyperparameters were used for initial training, with plans for future optimization.
+        - **Hyperparameters**: Default hyperparameters were used for initial training; tuned variants are searched with successive halving (`python -m utils.tuning`).
         """)
 
         st.subheader("2. Model Training")
@@ -46,19 +47,29 @@ def machine_Learning(data):
         - **Scaler and Bounds**: The scaler and winsorization bounds were also saved for consistent preprocessing of new data.
         """)
 
-    # Model Performance Metrics
+    # Model Performance Metrics, computed from the held-out test split (once per model and data version)
     st.header("📊 Model Performance Metrics")
     st.write("""
-    Below are the performance metrics for the trained models:
+    Below are the performance metrics of every trained model on the held-out test set, at the 0.5 probability threshold:
     """)
 
-    col1, col2, col3 = st.columns(3)
-    with col1:
-        st.metric("XGBoost Accuracy", "0.9997")
-    with col2:
-        st.metric("Random Forest Accuracy", "0.9999")
-    with col3:
-        st.metric("LightGBM Accuracy", "0.9997")
+    try:
+        with st.spinner("Evaluating models on the test set..."):
+            results = evaluate_models(registry)
+    except FileNotFoundError:
+        st.error("Test split not found. Ensure 'data/processed/X_test.csv' and 'y_test.csv' are available.")
+        return
+
+    models = [name for name in results if "-" not in name]
+    for column, name in zip(st.columns(len(models) or 1), models):
+        with column:
+            st.metric(f"{name} Accuracy", f"{results[name]['accuracy']:.4f}")
+
+    metrics = pd.DataFrame([
+        {"model": name, **{key: result[key] for key in ["accuracy", "precision", "recall", "f1", "roc_auc", "average_precision", "rows_per_second"]}}
+        for name, result in results.items()
+    ]).set_index("model")
+    st.dataframe(metrics.style.format("{:.4f}").format("{:,.0f}", subset=["rows_per_second"]), use_container_width=True)
 
     # Visualizations
     st.header("📈 Visualizations")
@@ -66,45 +77,39 @@ def machine_Learning(data):
     This section provides an overview of the performance of the trained models.
     """)
 
+    name = st.selectbox("Model:", list(results), format_func=lambda n: n.replace("-", " (", 1) + ")" if "-" in n else n)
+    result = results[name]
+
     col1, col2, col3 = st.columns(3)
 
     with col1:
-        st.write("**Confusion Matrix for Random Forest:**")
-        confusion_matrix = np.array([[56700, 12], [0, 56987]])
+        st.write(f"**Confusion Matrix for {name}:**")
         fig, ax = plt.subplots(figsize=(5, 3))  # Smaller plot size
-        sns.heatmap(confusion_matrix, annot=True, fmt="d", cmap="Blues", ax=ax)
+        sns.heatmap(result["confusion"], annot=True, fmt="d", cmap="Blues", ax=ax)
         ax.set_title("Confusion Matrix")
         ax.set_xlabel("Predicted")
         ax.set_ylabel("Actual")
         st.pyplot(fig)
 
-        st.write("**Confusion Matrix for XGBoost:**")
-        confusion_matrix = np.array([[56678, 34], [0, 56987]])
+        st.write(f"**Precision-Recall Curve for {name}:**")
         fig, ax = plt.subplots(figsize=(5, 3))
-        sns.heatmap(confusion_matrix, annot=True, fmt="d", cmap="Blues", ax=ax)
-        ax.set_title("Confusion Matrix")
-        ax.set_xlabel("Predicted")
-        ax.set_ylabel("Actual")
+        ax.plot(result["pr"]["recall"], result["pr"]["precision"], label=f"AP = {result['average_precision']:.4f}")
+        ax.set_title("Precision-Recall Curve")
+        ax.set_xlabel("Recall")
+        ax.set_ylabel("Precision")
+        ax.legend()
         st.pyplot(fig)
 
     with col2:
-        st.write("**ROC Curve for Random Forest (Placeholder):**")
+        st.write(f"**ROC Curve for {name}:**")
         fig, ax = plt.subplots(figsize=(5, 3))
+        ax.plot(result["roc"]["fpr"], result["roc"]["tpr"], label=f"AUC = {result['roc_auc']:.4f}")
         ax.plot([0, 1], [0, 1], linestyle="--", label="Random Guess")
         ax.set_title("ROC Curve")
         ax.set_xlabel("False Positive Rate")
         ax.set_ylabel("True Positive Rate")
         ax.legend()
         st.pyplot(fig)
-
-        st.write("**Confusion Matrix for LightGBM:**")
-        confusion_matrix = np.array([[56685, 27], [3, 56984]])
-        fig, ax = plt.subplots(figsize=(5, 3))
-        sns.heatmap(confusion_matrix, annot=True, fmt="d", cmap="Blues", ax=ax)
-        ax.set_title("Confusion Matrix")
-        ax.set_xlabel("Predicted")
-        ax.set_ylabel("Actual")
-        st.pyplot(fig)
     
     with col3:
         st.write("**Learning Curve for Random Forest :**")
@@ -1,32 +1,182 @@
+import os
+import time
+import uuid
 import streamlit as st
 import pandas as pd
-import joblib
+import numpy as np
+
+from utils.drift import new_monitor, record
+from utils.jobs import ACTIVE, get_job_queue
+from utils.model_registry import registry
+from utils.operating_point import (DEFAULT_FALSE_ALARM_COST, DEFAULT_MISSED_FRAUD_COST, best_point, point_at,
+                                   cascade_threshold, save_operating_point, sweep, threshold_for)
+from utils.profiling import span
+from utils.transform import get_transformer
 
 def preprocess_data(df):
     """Apply the same preprocessing as used during model training, including Winsorization and scaling."""
-    # Load Winsorization bounds and apply outlier removal
-    winsorization_bounds = joblib.load("models/winsorization_bounds.pkl")  # Load the saved bounds
-    
-    # Apply Winsorization to each numerical feature
-    num_features = df.select_dtypes(include=['float64', 'int64']).columns.tolist()
-    for col in num_features:
-        lower, upper = winsorization_bounds[col]  # Get the bounds for the column
-        df[col] = df[col].clip(lower=lower, upper=upper)  # Apply Winsorization
-    
-    # Load the scaler and apply it
-    scaler = joblib.load("models/scaler.pkl")  # Load the same scaler used in training
-    df_scaled = scaler.transform(df)  # Apply transformation
-    
-    return df_scaled
-
-def prediction(data):
-    # Load the trained model
-    model = joblib.load("models/RandomForestClassifier.pkl")
+    # Winsorization and scaling run as one fused in-place pass over a float32 copy of the features,
+    # using the bounds and scaler loaded once per process by the model registry
+    with span("preprocess"):
+        return get_transformer().transform(df)
+
+def operating_point(model_name, threshold):
+    """Cost sweep over the model's test-set scores and a control to save the chosen threshold."""
+    from utils.evaluation import evaluate_models
+
+    st.write("""
+    Choose the probability threshold from the costs of the two kinds of error. Every candidate threshold
+    is evaluated on the held-out test set's scores, which are computed once per model.
+    """)
+    col1, col2 = st.columns(2)
+    with col1:
+        missed_fraud_cost = st.number_input("Cost of a Missed Fraud", min_value=0.0, value=DEFAULT_MISSED_FRAUD_COST)
+    with col2:
+        false_alarm_cost = st.number_input("Cost of a False Alarm", min_value=0.0, value=DEFAULT_FALSE_ALARM_COST)
+
+    try:
+        with st.spinner("Scoring the test set..."):
+            counts = evaluate_models(registry, [model_name])[model_name]["counts"]
+    except FileNotFoundError:
+        st.error("Test split not found. Ensure 'data/processed/X_test.csv' and 'y_test.csv' are available.")
+        return
+    table = sweep(counts, missed_fraud_cost, false_alarm_cost)
+    best = best_point(table)
+
+    chosen = st.slider("Threshold", 0.0, 1.0, value=float(threshold), step=0.001, format="%.3f")
+    point = point_at(table, chosen)
+    st.dataframe(pd.DataFrame([point, best], index=["Selected", "Lowest Cost"]).style.format("{:.4f}"), use_container_width=True)
+
+    curve = pd.DataFrame(table).iloc[::max(len(table["threshold"]) // 1000, 1)]
+    st.line_chart(curve.set_index("threshold")[["precision", "recall"]])
+    st.line_chart(curve.set_index("threshold")["expected_cost"])
+
+    if cascade_threshold(model_name) is not None:
+        st.info(f"This cascade's band is calibrated for threshold {threshold:.4f}. To flag at another threshold, "
+                f"recalibrate it with `python -m utils.cascade --threshold <value>`.")
+        return
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button("Save Selected Threshold"):
+            save_operating_point(model_name, point, missed_fraud_cost, false_alarm_cost)
+            st.rerun()
+    with col2:
+        if st.button(f"Save Lowest-Cost Threshold ({best['threshold']:.4f})"):
+            save_operating_point(model_name, best, missed_fraud_cost, false_alarm_cost)
+            st.rerun()
+
+def job_label(job):
+    created = time.strftime("%H:%M:%S", time.localtime(job["created_at"]))
+    return f"{created} · {job['input_name']} · {job['model']}"
+
+
+def batch_jobs(queue, owner):
+    """This session's jobs with their progress, drawn as a fragment that refreshes itself while any is active."""
+    st.subheader("🗂️ Batch Jobs")
+    jobs = queue.jobs(owner)
+    for job in jobs:
+        columns = st.columns([3, 4, 1])
+        columns[0].write(f"`{job['id']}` {job_label(job)}")
+        if job["status"] == "queued":
+            ahead = queue.position(job["id"])
+            columns[1].progress(0.0, text=f"Queued ({ahead} job(s) ahead)" if ahead else "Queued")
+        elif job["status"] == "running":
+            columns[1].progress(job["progress"]["fraction"], text=f"Scored {job['progress']['rows']:,} rows")
+        elif job["status"] == "done":
+            result = job["result"]
+            columns[1].progress(1.0, text=f"Scored {result['rows']:,} rows in {result['seconds']:.1f}s")
+        elif job["status"] == "failed":
+            columns[1].error(f"⚠️ {job['error']}")
+        else:
+            columns[1].write("Cancelled")
+        if job["status"] in ("queued", "running"):
+            columns[2].button("Cancel", key=f"cancel_{job['id']}", on_click=queue.cancel, args=(job["id"],))
+
+    # When a job finishes, rerun the whole page: it shows the results and stops refreshing once nothing is active
+    active = {job["id"] for job in jobs if job["status"] in ACTIVE}
+    finished = st.session_state.get("jobs_active", set()) - active
+    st.session_state.jobs_active = active
+    if finished:
+        st.rerun()
+
+
+def batch_results(job):
+    """Preview, downloads and counts of a finished job, read back from the job store."""
+    result = job["result"]
+    job_dir = os.path.dirname(result["output_path"])
+
+    st.subheader("🔹 Prediction Results")
+    preview_path = os.path.join(job_dir, "preview.parquet")
+    if os.path.exists(preview_path):
+        st.write(pd.read_parquet(preview_path))  # Show first few rows of the scored data
 
+    # Provide a download link for predictions (served from the job's results file)
+    with open(result["output_path"], "rb") as f:
+        if job["options"]["output_format"] == "parquet":
+            st.download_button("📥 Download Predictions", f, "predictions.parquet", "application/octet-stream", key=f"download_{job['id']}")
+        else:
+            st.download_button("📥 Download Predictions", f, "predictions.csv", "text/csv", key=f"download_{job['id']}")
+
+    # Display summary counts
+    st.write(f"✅ **Normal Transactions**: {result['normal']}")
+    st.write(f"⚠️ **Fraudulent Transactions**: {result['fraud']}")
+    cache_stats = result["cache"]
+    if cache_stats is not None:
+        st.write(f"♻️ **Score Cache**: {cache_stats['hit_rate']:.1%} of rows answered without the model "
+                 f"({cache_stats['duplicate_rows']:,} duplicates in the batch, {cache_stats['memory_hits'] + cache_stats['disk_hits']:,} "
+                 f"previously scored); about {cache_stats['seconds_saved']:.2f}s of model time saved")
+    ingest = result["ingest"]
+    st.write(f"📄 **Parsed**: {result['rows']:,} rows at {ingest['rows_per_second']:,.0f} rows/s ({ingest['mb_per_second']:,.0f} MB/s)"
+             + (" — features matched by position" if ingest["positional"] else ""))
+    if ingest["extra_columns"]:
+        st.write(f"Ignored columns: {', '.join(ingest['extra_columns'])}")
+    if ingest["bad_rows"]:
+        st.warning(f"{ingest['bad_rows']:,} malformed rows were skipped and not scored.")
+        st.dataframe(pd.DataFrame(ingest["quarantine"], columns=["line", "reason", "text"]), hide_index=True)
+        with open(ingest["quarantine_path"], "rb") as f:
+            st.download_button("📥 Download Skipped Rows", f, "skipped_rows.csv", "text/csv", key=f"skipped_{job['id']}")
+    if result["forwarded_fraction"] is not None:
+        # Cascades (utils/cascade.py) only send uncertain rows to the heavy model
+        st.write(f"⏩ **Decided by the fast stage**: {1 - result['forwarded_fraction']:.1%} of the rows in this job")
+
+def prediction(data_path):
     # Streamlit UI
     st.title("🔍 Credit Card Fraud Detection")
     st.markdown("---")
 
+    # Pick one of the trained models; each is deserialized once per process, not on every rerun
+    model_variants = registry.variants()
+    model_names = list(model_variants)
+    if not model_names:
+        st.error("No trained model found in the `models/` directory.")
+        return
+    default_model = "RandomForestClassifier"
+    selected_model = st.selectbox(
+        "Select Model:",
+        model_names,
+        index=model_names.index(default_model) if default_model in model_names else 0
+    )
+
+    # Compiled and compressed variants (see utils/compression.py) are listed under their model
+    variants = model_variants[selected_model]
+    model_name = variants[0]
+    if len(variants) > 1:
+        model_name = st.selectbox(
+            "Model Variant:",
+            variants,
+            format_func=lambda name: name[len(selected_model) + 1:] or "original"
+        )
+    model = registry.classifier(model_name)
+
+    with st.expander("Loaded Models"):
+        st.dataframe(pd.DataFrame(registry.stats()))
+
+    # Rows are flagged at the model's saved operating point rather than a fixed 0.5
+    threshold = threshold_for(model_name)
+    st.write(f"🎯 **Fraud Threshold**: probability ≥ {threshold:.4f}")
+    if st.toggle("Tune Operating Point"):
+        operating_point(model_name, threshold)
+
     # Toggle between Batch Prediction and Manual Prediction
     prediction_mode = st.radio(
         "Select Prediction Mode:",
@@ -38,48 +188,62 @@ def prediction(data):
         st.header("📂 Batch Prediction")
         st.write("""
         Upload a CSV file with 29 features to detect fraudulent transactions, or use the default dataset.
+        Batches are scored in the background: you can keep using the app while they run.
         """)
 
         # Use default dataset or upload a new one
         use_default_data = st.checkbox("Use Default Dataset", value=True)
         if use_default_data:
-            df = data.drop(columns=["Class"], errors='ignore')
+            if not os.path.exists(data_path):
+                st.error(f"Dataset not found. Ensure '{os.path.basename(data_path)}' is available in the app directory.")
+                return
+            source, input_name = data_path, os.path.basename(data_path)
         else:
             uploaded_file = st.file_uploader("Upload CSV File", type=["csv"])
             if uploaded_file:
-                df = pd.read_csv(uploaded_file)
+                source, input_name = uploaded_file, uploaded_file.name
             else:
-                st.warning("Please upload a CSV file or use the default dataset.")
-                return
+                source = None
 
-        # Check if columns match expected features
-        expected_features = 29
-        if df.shape[1] != expected_features:
-            st.error(f"⚠️ The uploaded file must have {expected_features} columns. Found {df.shape[1]}!")
-        else:
-            # Preprocess data (Winsorization + scaling)
-            # df_processed = preprocess_data(df)
-            df_processed = df
+        # The default dataset is already preprocessed; raw uploads usually are not
+        preprocess = st.checkbox("Apply Preprocessing (Winsorization + Scaling)", value=not use_default_data)
+        output_format = st.radio("Output Format:", ["CSV", "Parquet"], horizontal=True).lower()
+        # Re-submitted and duplicate transactions are answered from the score cache instead of the model
+        use_cache = st.checkbox("Reuse Cached Scores", value=True)
+        skip_malformed = True
+        if not use_default_data:
+            # Rows that do not match the schema are set aside with their line numbers instead of failing the file
+            skip_malformed = st.checkbox("Skip Malformed Rows", value=True)
 
-            # Make predictions
-            predictions = model.predict(df_processed)
+        # Jobs live in the process-wide queue; the session only remembers which ones it submitted
+        queue = get_job_queue()
+        owner = st.session_state.setdefault("job_owner", uuid.uuid4().hex)
+        if source is None:
+            st.warning("Please upload a CSV file or use the default dataset.")
+        elif st.button("🚀 Score in Background"):
+            options = {"preprocess": preprocess, "output_format": output_format, "threshold": threshold,
+                       "use_cache": use_cache, "skip_malformed": skip_malformed}
+            # Identical input, model and options return the existing job instead of scoring again
+            st.session_state.selected_job = queue.submit(owner, source, model_name, registry.path(model_name), options, input_name)
 
-            # Add predictions to DataFrame
-            df["Fraud Prediction"] = predictions
+        jobs = queue.jobs(owner)
+        if not jobs:
+            return
+        refresh = 1.0 if any(job["status"] in ACTIVE for job in jobs) else None
+        st.fragment(batch_jobs, run_every=refresh)(queue, owner)
 
-            # Show results
-            st.subheader("🔹 Prediction Results")
-            st.write(df.head(20))  # Show first few rows of the DataFrame
-
-            # Provide a download link for predictions
-            csv_result = df.to_csv(index=False).encode("utf-8")
-            st.download_button("📥 Download Predictions", csv_result, "predictions.csv", "text/csv")
-
-            # Display summary counts
-            fraud_count = (predictions == 1).sum()
-            normal_count = (predictions == 0).sum()
-            st.write(f"✅ **Normal Transactions**: {normal_count}")
-            st.write(f"⚠️ **Fraudulent Transactions**: {fraud_count}")
+        finished = [job for job in jobs if job["status"] == "done"]
+        if not finished:
+            return
+        ids = [job["id"] for job in finished]
+        selected = st.session_state.get("selected_job")
+        job_id = st.selectbox(
+            "Show Results Of:",
+            ids,
+            index=ids.index(selected) if selected in ids else 0,
+            format_func=lambda i: job_label(queue.get(i)),
+        )
+        batch_results(queue.get(job_id))
 
     elif prediction_mode == "Manual Prediction":
         st.header("✍️ Manual Prediction")
@@ -106,9 +270,17 @@ def prediction(data):
             # Preprocess the input data
             input_processed = preprocess_data(input_df)
 
-            # Make prediction
-            prediction = model.predict(input_processed)
-            prediction_proba = model.predict_proba(input_processed)[:, 1]
+            # Make prediction (label and probability from a single ensemble traversal)
+            with span("predict"):
+                prediction_proba = model.predict_proba(input_processed)[:, 1]
+
+            # Manual inputs count towards drift like batch rows
+            drift = new_monitor(model_name)
+            if drift is not None:
+                drift.observe_features(input_df[required_features].to_numpy(dtype=np.float32))
+                drift.observe_scores(prediction_proba)
+                record(drift)
+            prediction = (prediction_proba >= threshold).astype(int)
 
             # Display results
             st.subheader("🔹 Prediction Results")
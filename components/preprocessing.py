@@ -2,7 +2,8 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-import seaborn as sns
+
+from utils.plot_summaries import draw_boxplot, draw_histogram, feature_summary
 
 
 def preprocessing(data):
@@ -51,38 +52,39 @@ def preprocessing(data):
     st.write("""
     Below are some visualizations of the preprocessing steps:
     """)
-    numeric_features = data.select_dtypes(include=["float64", "int64"]).columns
+    numeric_features = data.select_dtypes(include="number").columns
     feature = st.selectbox("Select a Feature for Visualize", numeric_features)
 
+    # Histograms, KDEs, quantiles and box statistics are precomputed once per feature and cached
+    summary = feature_summary(data, feature) if feature else None
+
     col1, col2, col3 = st.columns(3)
 
     with col1:
-        if feature:
+        if summary:
             st.write("**Before Winsorization:**")
-            # Placeholder for a plot showing data before winsorization
             fig, ax = plt.subplots(figsize=(5, 3))
-            sns.histplot(data[feature], kde=True, ax=ax)
+            draw_histogram(ax, summary)
             ax.set_title(f"Distribution of {feature} (Before Winsorization)")
             ax.set_xlabel(feature)
             ax.set_ylabel("Frequency")
             st.pyplot(fig)
 
     with col2:
-        if feature:
+        if summary:
             st.write("**After Winsorization:**")
-            # Placeholder for a plot showing data after winsorization
             fig, ax = plt.subplots(figsize=(5, 3))
-            sns.histplot(data[feature].clip(lower=data[feature].quantile(0.01), upper=data[feature].quantile(0.99)), kde=True, ax=ax)
+            draw_histogram(ax, summary, kind="winsorized")
             ax.set_title(f"Distribution of {feature} (After Winsorization)")
             ax.set_xlabel(feature)
             ax.set_ylabel("Frequency")
             st.pyplot(fig)
 
     with col3:
-        if feature:
+        if summary:
             st.write(f"**Outlier Detection of {feature}:**")
             fig, ax = plt.subplots(figsize=(5, 3))
-            sns.boxplot(x=data[feature], ax=ax)
+            draw_boxplot(ax, summary)
             ax.set_title(f"Boxplot of {feature}")
             ax.set_xlabel(feature)
             st.pyplot(fig)
@@ -0,0 +1,294 @@
+"""Headless batch scorer for the trained fraud detection models.
+
+Splits a CSV into byte-range shards aligned on line boundaries and scores them in a process pool.
+Each worker parses and scores its own shard, so parsing, preprocessing and prediction all run in
+parallel, and the shard outputs are stitched together in input order.
+
+Usage:
+    python -m fraud_score data/raw/creditcard_2023.csv -o predictions.csv --model LightGBMClassifier
+"""
+import os
+import sys
+import csv
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pyarrow.parquet as pq
+from threadpoolctl import threadpool_limits
+
+from utils.batch_scoring import iter_shard_chunks, plan_shards, score_stream
+from utils.drift import DriftMonitor, new_monitor, record
+from utils.ingestion import MAX_BAD_FRACTION, IngestionError, IngestReport
+from utils.model_registry import registry
+from utils.operating_point import check_threshold, threshold_for
+from utils.score_cache import cached_model
+from utils.transform import get_transformer
+
+DEFAULT_SHARD_MB = 64
+
+# Set in each worker process by _init_worker
+_worker = {}
+
+
+def _init_worker(model_name, shared, preprocess, threshold, use_cache, on_error, max_bad_fraction, threads_per_worker):
+    _worker["model_name"] = model_name
+    # Native models score fastest; shared tree engines are mapped read-only from one file, so workers
+    # add no private copy but traverse the trees more slowly
+    _worker["model"] = registry.attach(model_name) if shared else registry.get(model_name)
+    _worker["use_cache"] = use_cache
+    _worker["preprocess"] = preprocess
+    _worker["threshold"] = threshold
+    _worker["on_error"] = on_error
+    _worker["max_bad_fraction"] = max_bad_fraction
+    _worker["limits"] = threadpool_limits(limits=threads_per_worker)
+
+
+def _score_shard(index, path, start, end, header, output_path, output_format, chunk_rows, quarantine_path):
+    begin = time.perf_counter()
+    drift = new_monitor(_worker["model_name"])
+    model = cached_model(registry, _worker["model_name"], _worker["model"]) if _worker["use_cache"] else _worker["model"]
+    ingest = IngestReport(_worker["on_error"], _worker["max_bad_fraction"], quarantine_path)
+    try:
+        summary = score_stream(
+            iter_shard_chunks(path, header, start, end, chunk_rows, report=ingest),
+            model,
+            output_path=output_path,
+            output_format=output_format,
+            preprocess=_worker["preprocess"],
+            threshold=_worker["threshold"],
+            drift=drift,
+        )
+    except IngestionError as e:
+        if index == 0:
+            raise
+        raise IngestionError(f"{e} (lines counted from byte {start:,} of the file)") from None
+    return {
+        "shard": index,
+        "rows": summary.rows,
+        "fraud": summary.fraud_count,
+        "normal": summary.normal_count,
+        "seconds": time.perf_counter() - begin,
+        "drift": drift.state() if drift is not None else None,
+        "cache": model.stats() if _worker["use_cache"] else None,
+        # Line numbers are relative to the shard until _merge_quarantine offsets them
+        "ingest": {"bad_rows": ingest.bad_rows, "lines": ingest.lines, "bytes": ingest.bytes, "seconds": ingest.seconds,
+                   "headerless": ingest.headerless, "extra_columns": ingest.extra_columns, "examples": ingest.quarantine[:5]},
+    }
+
+
+def _merge_outputs(part_paths, output_path, output_format):
+    """Concatenate shard outputs in order, keeping only the first CSV header.
+
+    A shard that scored no rows (e.g. all of them were quarantined) leaves an empty part, which is skipped.
+    """
+    part_paths = [part for part in part_paths if os.path.exists(part) and os.path.getsize(part)]
+    if output_format == "parquet":
+        writer = None
+        for part in part_paths:
+            table = pq.read_table(part)
+            if writer is None:
+                writer = pq.ParquetWriter(output_path, table.schema)
+            writer.write_table(table.cast(writer.schema))
+        if writer is not None:
+            writer.close()
+        return
+
+    with open(output_path, "wb") as out:
+        for i, part in enumerate(part_paths):
+            with open(part, "rb") as f:
+                if i > 0:
+                    f.readline()
+                shutil.copyfileobj(f, out)
+
+
+def _merge_quarantine(results, part_paths, quarantine_path):
+    """Write the shards' malformed rows to ``quarantine_path`` with line numbers counted from the top of the file.
+
+    Returns the first few bad rows, renumbered the same way.
+    """
+    results = sorted(results, key=lambda r: r["shard"])
+    offsets, offset = [], 0
+    for i, result in enumerate(results):
+        ingest = result["ingest"]
+        # Shard 0 counts its own lines from the top; later shards count from 1
+        offsets.append(offset + (1 if i and not ingest["headerless"] else 0))
+        offset += ingest["lines"]
+    renumber = lambda line, shift: line + shift if line not in (None, "") else line
+    examples = [(renumber(line, shift), reason, text) for result, shift in zip(results, offsets)
+                for line, reason, text in result["ingest"]["examples"]][:5]
+    if quarantine_path is None:
+        return examples
+
+    with open(quarantine_path, "w", newline="") as out:
+        writer = csv.writer(out)
+        writer.writerow(["line", "reason", "text"])
+        for result, shift in zip(results, offsets):
+            part = part_paths[result["shard"]]
+            if not os.path.exists(part) or not os.path.getsize(part):
+                continue
+            with open(part, newline="") as f:
+                reader = csv.reader(f)
+                next(reader)
+                for line, reason, text in reader:
+                    writer.writerow([renumber(int(line), shift) if line else line, reason, text])
+    return examples
+
+
+def score_file(input_path, output_path, model_name, workers=None, shard_mb=DEFAULT_SHARD_MB,
+               output_format="csv", preprocess=True, chunk_rows=100_000, threshold=None, use_cache=False,
+               on_error="quarantine", max_bad_fraction=MAX_BAD_FRACTION, quarantine_path=None, shared=None, log=print):
+    """Score ``input_path`` across a process pool and write the predictions to ``output_path``.
+
+    ``threshold`` defaults to the model's saved operating point (0.5 if none was chosen). Rows that
+    do not match the schema are skipped and, with ``quarantine_path``, written there with their line
+    numbers; ``on_error="reject"`` fails on the first one instead (see :mod:`utils.ingestion`).
+
+    Workers score with the native model unless ``shared`` (default: the registry's
+    ``FRAUD_SHARED_MODELS`` setting) maps one compiled tree engine into all of them instead.
+    """
+    shared = registry.shared if shared is None else shared
+    threshold = threshold_for(model_name) if threshold is None else threshold
+    check_threshold(model_name, threshold)
+    workers = workers or os.cpu_count() or 1
+    header, shards = plan_shards(input_path, shard_mb * 1024 * 1024)
+    threads_per_worker = max((os.cpu_count() or 1) // workers, 1)
+
+    # A shared engine is compiled before the pool starts so workers only attach to it. With fork, the
+    # model and preprocessing are loaded once in the parent too and workers share their pages copy-on-write
+    if shared:
+        registry.attach(model_name)
+    context = multiprocessing.get_context()
+    if context.get_start_method() == "fork":
+        if not shared:
+            registry.get(model_name)
+        if preprocess:
+            get_transformer()
+
+    start = time.perf_counter()
+    results = []
+    with tempfile.TemporaryDirectory(prefix="fraud_score_") as tmp_dir:
+        suffix = ".parquet" if output_format == "parquet" else ".csv"
+        part_paths = [os.path.join(tmp_dir, f"part-{i:05d}{suffix}") for i in range(len(shards))]
+        quarantine_parts = [os.path.join(tmp_dir, f"quarantine-{i:05d}.csv") if quarantine_path else None for i in range(len(shards))]
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(model_name, shared, preprocess, threshold, use_cache, on_error, max_bad_fraction,
+                                           threads_per_worker)) as pool:
+            futures = [
+                pool.submit(_score_shard, i, input_path, s, e, header, part_paths[i], output_format, chunk_rows, quarantine_parts[i])
+                for i, (s, e) in enumerate(shards)
+            ]
+            try:
+                for future in as_completed(futures):
+                    result = future.result()
+                    results.append(result)
+                    log(f"shard {result['shard']:>4}: {result['rows']:>10,} rows in {result['seconds']:7.2f}s "
+                        f"({result['rows'] / max(result['seconds'], 1e-9):,.0f} rows/s)")
+            except IngestionError:
+                # A malformed file fails as soon as one shard notices, without scoring the rest
+                pool.shutdown(cancel_futures=True)
+                raise
+        _merge_outputs(part_paths, output_path, output_format)
+        examples = _merge_quarantine(results, quarantine_parts, quarantine_path)
+    elapsed = time.perf_counter() - start
+
+    # Add the shards' drift counts to the model's monitor, shown on the Dashboard
+    drift = new_monitor(model_name)
+    for result in results:
+        state = result.pop("drift")
+        if drift is not None and state is not None:
+            drift.merge(DriftMonitor.from_state(drift.profile, state))
+    record(drift)
+
+    latencies = sorted(r["seconds"] for r in results)
+    rows = sum(r["rows"] for r in results)
+    cache = [r["cache"] for r in results if r["cache"] is not None]
+    ingest = [r.pop("ingest") for r in results]
+    parse_seconds = sum(i["seconds"] for i in ingest)
+    return {
+        "input": input_path,
+        "output": output_path,
+        "model": model_name,
+        "threshold": threshold,
+        "workers": workers,
+        "shared": shared,
+        "shards": len(shards),
+        "rows": rows,
+        "fraud": sum(r["fraud"] for r in results),
+        "normal": sum(r["normal"] for r in results),
+        "seconds": elapsed,
+        "rows_per_second": rows / elapsed if elapsed else 0.0,
+        "shard_seconds_p50": latencies[len(latencies) // 2] if latencies else 0.0,
+        "shard_seconds_max": latencies[-1] if latencies else 0.0,
+        "cache_hit_rate": sum(c["rows"] - c["model_rows"] for c in cache) / rows if cache and rows else None,
+        "cache_seconds_saved": sum(c["seconds_saved"] for c in cache) if cache else None,
+        "bad_rows": sum(i["bad_rows"] for i in ingest),
+        "bad_row_examples": examples,
+        "quarantine": quarantine_path,
+        "ignored_columns": ingest[0]["extra_columns"] if ingest else [],
+        "parse_mb_per_second": sum(i["bytes"] for i in ingest) / 1e6 / parse_seconds if parse_seconds else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="fraud_score", description="Score a CSV of transactions with a trained fraud model.")
+    parser.add_argument("input", help="CSV with the 29 features (V1-V28, Amount) and optional id/Class; other columns are dropped")
+    parser.add_argument("-o", "--output", required=True, help="where to write the scored rows")
+    parser.add_argument("--model", default="LightGBMClassifier", help="artifact name under models/ (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--shard-mb", type=int, default=DEFAULT_SHARD_MB, help="input bytes per shard (default: %(default)s)")
+    parser.add_argument("--chunk-rows", type=int, default=100_000, help="rows scored at a time inside a shard")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv", help="output format")
+    parser.add_argument("--preprocessed", action="store_true", help="input is already winsorized and scaled")
+    parser.add_argument("--cache", action="store_true", help="answer previously scored and duplicate rows from the score cache")
+    parser.add_argument("--threshold", type=float, help="probability cut-off for the fraud label (default: the model's saved operating point, else 0.5)")
+    parser.add_argument("--quarantine", help="write rows that do not match the schema, with line numbers, to this CSV")
+    parser.add_argument("--reject", action="store_true", help="fail on the first malformed row instead of skipping it")
+    parser.add_argument("--max-bad-fraction", type=float, default=MAX_BAD_FRACTION, help="fail when a shard has more malformed rows than this (default: %(default)s)")
+    parser.add_argument("--shared", action="store_true",
+                        help="score with one memory-mapped tree engine shared by the workers: less memory, slower per row "
+                             "(default: on when FRAUD_SHARED_MODELS=1)")
+    parser.add_argument("--report", help="also write the run summary as JSON to this path")
+    args = parser.parse_args(argv)
+
+    if args.model not in registry.classifiers():
+        parser.error(f"unknown model {args.model!r}; available: {', '.join(registry.classifiers())}")
+    if args.threshold is not None:
+        try:
+            check_threshold(args.model, args.threshold)
+        except ValueError as e:
+            parser.error(str(e))
+
+    try:
+        report = score_file(args.input, args.output, args.model, workers=args.workers, shard_mb=args.shard_mb,
+                            output_format=args.format, preprocess=not args.preprocessed, chunk_rows=args.chunk_rows,
+                            threshold=args.threshold, use_cache=args.cache, on_error="reject" if args.reject else "quarantine",
+                            max_bad_fraction=args.max_bad_fraction, quarantine_path=args.quarantine, shared=args.shared or None,
+                            log=lambda line: print(line, file=sys.stderr))
+    except IngestionError as e:
+        parser.exit(1, f"fraud_score: error: {e}\n")
+
+    print(f"Scored {report['rows']:,} rows in {report['seconds']:.2f}s "
+          f"({report['rows_per_second']:,.0f} rows/s) across {report['shards']} shards / {report['workers']} workers")
+    print(f"Shard latency: p50 {report['shard_seconds_p50']:.2f}s, max {report['shard_seconds_max']:.2f}s")
+    print(f"Normal: {report['normal']:,}  Fraud: {report['fraud']:,}")
+    print(f"Parsing: {report['parse_mb_per_second']:,.0f} MB/s per worker")
+    if report["ignored_columns"]:
+        print(f"Ignored columns: {', '.join(report['ignored_columns'])}")
+    if report["bad_rows"]:
+        print(f"Skipped {report['bad_rows']:,} malformed rows" + (f" (written to {report['quarantine']})" if report["quarantine"] else ""))
+        for line, reason, _ in report["bad_row_examples"]:
+            print(f"  line {line}: {reason}")
+    if report["cache_hit_rate"] is not None:
+        print(f"Score cache: {report['cache_hit_rate']:.1%} of rows without the model, ~{report['cache_seconds_saved']:.2f}s saved")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+"""Low-latency HTTP/JSON scoring service for the trained fraud detection models.
+
+Requests arriving within a short window are coalesced into one micro-batch, preprocessed with the
+fused WinsorScaler and scored with a single ``predict_proba`` call on a thread or process pool, so
+concurrent callers share the cost of each ensemble traversal. The features and scores of every
+micro-batch are added to the model's drift counters (:mod:`utils.drift`), which are written out
+about once a second.
+
+Endpoints:
+    POST /score    {"V1": ..., "Amount": ...} or {"transactions": [{...}, ...]} (or lists of 29 values)
+    GET  /metrics  Prometheus-style text with request latency percentiles and batch sizes
+    GET  /healthz  liveness probe
+
+Usage:
+    python -m scoring_server --model LightGBMClassifier --port 8080 --window-ms 2 --max-batch 512
+"""
+import json
+import math
+import time
+import asyncio
+import argparse
+import collections
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from utils.data_loader import FEATURES
+from utils.drift import DriftMonitor, new_monitor, record
+from utils.model_registry import registry
+from utils.operating_point import check_threshold, threshold_for
+from utils.profiling import instrumentation
+from utils.transform import get_transformer
+
+DEFAULT_THRESHOLD = 0.5
+FLOAT32_MAX = float(np.finfo(np.float32).max)
+DRIFT_FLUSH_SECONDS = 1.0  # how often the drift counts of scored batches are recorded
+
+# Model and transformer used by score_block; set by load_scorer in every process that scores
+_scorer = {}
+
+
+def load_scorer(model_name, shared=False):
+    # The native model is fastest; a shared engine trades speed for one copy across pool processes
+    _scorer["model"] = registry.attach(model_name) if shared else registry.get(model_name)
+    _scorer["transformer"] = get_transformer()
+
+
+def score_block(block, threshold=DEFAULT_THRESHOLD):
+    """Preprocess a raw float32 block in place and return (labels, fraud probabilities) from one predict_proba."""
+    _scorer["transformer"].transform_array(block)
+    probabilities = _scorer["model"].predict_proba(block)[:, 1]
+    return (probabilities >= threshold).astype(np.int8), probabilities
+
+
+class LatencyTracker:
+    """Sliding window of recent observations with percentile summaries."""
+
+    def __init__(self, size=10_000):
+        self.values = collections.deque(maxlen=size)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.values.append(value)
+        self.count += 1
+        self.total += value
+
+    def percentile(self, q):
+        return float(np.percentile(np.fromiter(self.values, dtype=np.float64), q)) if self.values else 0.0
+
+
+class MicroBatcher:
+    """Coalesces concurrent scoring requests into batches of up to ``max_batch`` rows.
+
+    The first request of a batch waits at most ``window`` seconds for others to join. Scoring runs on
+    ``executor`` so the event loop keeps accepting requests while a batch is in flight. With a
+    ``drift`` monitor, every scored batch is counted in it and :meth:`flush_drift` records the counts.
+    """
+
+    def __init__(self, executor, window=0.002, max_batch=512, threshold=DEFAULT_THRESHOLD, drift=None):
+        self.executor = executor
+        self.window = window
+        self.max_batch = max_batch
+        self.threshold = threshold
+        self.drift = drift
+        self.queue = asyncio.Queue()
+        self.batch_rows = LatencyTracker()
+        self.batch_seconds = LatencyTracker()
+        self._task = None
+        self._drift_flushed = time.monotonic()
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def score(self, block):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((block, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = [await self.queue.get()]
+            rows = len(pending[0][0])
+            deadline = loop.time() + self.window
+            while rows < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                pending.append(item)
+                rows += len(item[0])
+            loop.create_task(self._dispatch(pending))
+
+    def flush_drift(self):
+        """Record the drift counts gathered since the last flush, off the event loop (None if there are none)."""
+        self._drift_flushed = time.monotonic()
+        if self.drift is None or not self.drift.rows:
+            return None
+        drift, self.drift = self.drift, DriftMonitor(self.drift.profile, self.drift.model_name)
+        return asyncio.get_running_loop().run_in_executor(None, record, drift)
+
+    async def _dispatch(self, pending):
+        block = np.concatenate([item[0] for item in pending]) if len(pending) > 1 else pending[0][0]
+        batch_drift = None
+        if self.drift is not None:
+            # Counted before scoring, which preprocesses the block in place on the thread backend
+            batch_drift = DriftMonitor(self.drift.profile, self.drift.model_name)
+            batch_drift.observe_features(block)
+        start = time.perf_counter()
+        try:
+            labels, probabilities = await asyncio.get_running_loop().run_in_executor(
+                self.executor, score_block, block, self.threshold
+            )
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.batch_seconds.observe(time.perf_counter() - start)
+        self.batch_rows.observe(len(block))
+        if batch_drift is not None:
+            batch_drift.observe_scores(probabilities)
+            self.drift.merge(batch_drift)
+            if time.monotonic() - self._drift_flushed >= DRIFT_FLUSH_SECONDS:
+                self.flush_drift()
+
+        offset = 0
+        for rows, future in pending:
+            n = len(rows)
+            if not future.done():
+                future.set_result((labels[offset:offset + n], probabilities[offset:offset + n]))
+            offset += n
+
+
+def parse_transactions(payload):
+    """Turn a JSON payload into a C-contiguous float32 ``(rows, 29)`` block.
+
+    Every value must be a finite JSON number; ``null``, booleans, strings and values beyond float32's
+    range are rejected rather than scored as missing.
+    """
+    records = payload.get("transactions", [payload]) if isinstance(payload, dict) else payload
+    if not isinstance(records, list) or not records:
+        raise ValueError("expected a transaction object, a list of transactions or {'transactions': [...]}")
+
+    block = np.empty((len(records), len(FEATURES)), dtype=np.float32)
+    for i, record in enumerate(records):
+        if isinstance(record, dict):
+            missing = [name for name in FEATURES if name not in record]
+            if missing:
+                raise ValueError(f"transaction {i} is missing features: {', '.join(missing)}")
+            values = [record[name] for name in FEATURES]
+        elif isinstance(record, list) and len(record) == len(FEATURES):
+            values = record
+        else:
+            raise ValueError(f"transaction {i} must be an object or a list of {len(FEATURES)} values")
+        bad = [name for name, value in zip(FEATURES, values)
+               if isinstance(value, bool) or not isinstance(value, (int, float))
+               or not math.isfinite(value) or abs(value) > FLOAT32_MAX]
+        if bad:
+            raise ValueError(f"transaction {i} needs finite numbers (within float32 range) for: {', '.join(bad)}")
+        block[i] = values
+    return block
+
+
+class ScoringServer:
+    """Minimal HTTP/1.1 front end (keep-alive, JSON bodies) around a :class:`MicroBatcher`."""
+
+    def __init__(self, batcher, model_name):
+        self.batcher = batcher
+        self.model_name = model_name
+        self.latency = LatencyTracker()
+        self.errors = 0
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                status, content_type, response = await self.route(method, path, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(response)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + response
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, path, body):
+        if method == "GET" and path == "/healthz":
+            return "200 OK", "text/plain", b"ok\n"
+        if method == "GET" and path == "/metrics":
+            return "200 OK", "text/plain; version=0.0.4", self.metrics().encode()
+        if method == "POST" and path == "/score":
+            return await self.score(body)
+        return "404 Not Found", "application/json", b'{"error": "not found"}'
+
+    async def score(self, body):
+        start = time.perf_counter()
+        try:
+            block = parse_transactions(json.loads(body))
+        except (ValueError, TypeError) as e:  # ValueError also covers malformed JSON
+            self.errors += 1
+            return "400 Bad Request", "application/json", json.dumps({"error": str(e)}).encode()
+
+        try:
+            labels, probabilities = await self.batcher.score(block)
+        except Exception as e:  # a model failure answers this request instead of dropping the connection
+            self.errors += 1
+            return "500 Internal Server Error", "application/json", json.dumps({"error": f"scoring failed: {e}"}).encode()
+        self.latency.observe(time.perf_counter() - start)
+        result = {
+            "model": self.model_name,
+            "predictions": [
+                {"fraud": bool(label), "probability": float(probability)}
+                for label, probability in zip(labels, probabilities)
+            ],
+        }
+        return "200 OK", "application/json", json.dumps(result).encode()
+
+    def metrics(self):
+        lines = [
+            "# TYPE fraud_score_request_seconds summary",
+            f'fraud_score_request_seconds{{quantile="0.5"}} {self.latency.percentile(50):.6f}',
+            f'fraud_score_request_seconds{{quantile="0.99"}} {self.latency.percentile(99):.6f}',
+            f"fraud_score_request_seconds_sum {self.latency.total:.6f}",
+            f"fraud_score_request_seconds_count {self.latency.count}",
+            "# TYPE fraud_score_batch_rows summary",
+            f'fraud_score_batch_rows{{quantile="0.5"}} {self.batcher.batch_rows.percentile(50):.1f}',
+            f'fraud_score_batch_rows{{quantile="0.99"}} {self.batcher.batch_rows.percentile(99):.1f}',
+            f"fraud_score_batch_rows_count {self.batcher.batch_rows.count}",
+            "# TYPE fraud_score_batch_seconds summary",
+            f'fraud_score_batch_seconds{{quantile="0.5"}} {self.batcher.batch_seconds.percentile(50):.6f}',
+            f'fraud_score_batch_seconds{{quantile="0.99"}} {self.batcher.batch_seconds.percentile(99):.6f}',
+            "# TYPE fraud_score_request_errors_total counter",
+            f"fraud_score_request_errors_total {self.errors}",
+        ]
+        # Model load spans recorded by the registry in this process
+        return "\n".join(lines) + "\n" + instrumentation.prometheus_text(prefix="fraud_score")
+
+
+async def serve(args):
+    shared = args.shared or registry.shared
+    if args.backend == "process":
+        if shared:
+            registry.attach(args.model)  # compile the shared engine once; workers then only map it
+        executor = ProcessPoolExecutor(max_workers=args.workers, initializer=load_scorer, initargs=(args.model, shared))
+    else:
+        load_scorer(args.model, shared)
+        executor = ThreadPoolExecutor(max_workers=args.workers)
+
+    # Warm the model (and every pool worker) before accepting traffic
+    dummy = np.zeros((1, len(FEATURES)), dtype=np.float32)
+    await asyncio.gather(*[
+        asyncio.get_running_loop().run_in_executor(executor, score_block, dummy.copy(), args.threshold)
+        for _ in range(args.workers)
+    ])
+
+    batcher = MicroBatcher(executor, window=args.window_ms / 1000.0, max_batch=args.max_batch, threshold=args.threshold,
+                           drift=new_monitor(args.model))
+    batcher.start()
+    app = ScoringServer(batcher, args.model)
+    server = await asyncio.start_server(app.handle, args.host, args.port)
+    print(f"Scoring with {args.model} on http://{args.host}:{args.port} ({args.backend} pool, {args.workers} workers)")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        flushed = batcher.flush_drift()
+        if flushed is not None:
+            await flushed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="scoring_server", description="Serve fraud predictions over HTTP/JSON.")
+    parser.add_argument("--model", default="LightGBMClassifier", help="artifact name under models/ (default: %(default)s)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--window-ms", type=float, default=2.0, help="how long a request waits for others to batch with")
+    parser.add_argument("--max-batch", type=int, default=512, help="maximum rows per micro-batch")
+    parser.add_argument("--backend", choices=["thread", "process"], default="thread", help="pool that runs predict_proba")
+    parser.add_argument("--workers", type=int, default=2, help="concurrent micro-batches in flight")
+    parser.add_argument("--shared", action="store_true",
+                        help="score with the memory-mapped tree engine (one copy across process workers, slower per row; "
+                             "default: on when FRAUD_SHARED_MODELS=1)")
+    parser.add_argument("--threshold", type=float, help="probability cut-off for the fraud label (default: the model's saved operating point, else 0.5)")
+    args = parser.parse_args(argv)
+
+    if args.model not in registry.classifiers():
+        parser.error(f"unknown model {args.model!r}; available: {', '.join(registry.classifiers())}")
+    if args.threshold is None:
+        args.threshold = threshold_for(args.model, default=DEFAULT_THRESHOLD)
+    try:
+        check_threshold(args.model, args.threshold)
+    except ValueError as e:
+        parser.error(str(e))
+    asyncio.run(serve(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import os
 import streamlit as st
 
 st.set_page_config(
@@ -6,36 +7,46 @@ st.set_page_config(
     layout="wide",
     initial_sidebar_state="expanded"
 ) 
-import pandas as pd
-import altair as alt
-from components.about import about
-from components.preprocessing import preprocessing
-from components.prediction import prediction
-from components.dashboard import dashboard
-from components.machine_learning import machine_Learning
-from components.conclusion import conclusion
-from sklearn.utils import shuffle
+# Page modules (and pandas, matplotlib, seaborn and the models they use) are imported the first time
+# their page is shown, so a cold start on the About page only pays for Streamlit itself
+from utils.profiling import instrumentation, profile_if_slow, span
 # from tensorflow import ts
 
 
-alt.themes.enable("dark")
+RAW_DATA_PATH = 'data/raw/creditcard_2023.csv'
+TEST_DATA_PATH = 'data/processed/X_test.csv'
+PAGES = ('dashboard', 'about', 'data_cleaning', 'machine_learning', 'prediction', 'conclusion', 'diagnostics')
+
+# Optionally load every model and run a dummy prediction when the server starts (FRAUD_WARMUP=1)
+if os.environ.get("FRAUD_WARMUP") == "1":
+    from utils.model_registry import registry
+    if not registry.warmed_up:
+        registry.warm_up()
 
 if 'page_selection' not in st.session_state:
-    st.session_state.page_selection = 'about' 
+    # Pages without a sidebar button (the Diagnostics page) are opened with ?page=<name>. Unknown names
+    # fall back to About, since the page name also labels metrics and names profile dumps
+    requested_page = st.query_params.get('page', 'about')
+    st.session_state.page_selection = requested_page if requested_page in PAGES else 'about'
 
 def set_page_selection(page):
     st.session_state.page_selection = page
 
-# Load data
-try:
-    dataset = pd.read_csv('data/raw/creditcard_2023.csv', delimiter=',')
-    dataset_Test = pd.read_csv('data/processed/X_test.csv', delimiter=',')
-    df = shuffle(dataset)
-    df = df.reset_index(drop=True)
-    
-except FileNotFoundError:
-    st.error("Dataset not found. Ensure 'creditcard_2023.csv' is available in the app directory.")
-    st.stop()
+def load_data(path):
+    """Load a dataset for the pages that use one (converted once to a memory-mapped Arrow cache shared across sessions)."""
+    from utils.data_loader import load_dataset
+    try:
+        with span("load_data"):
+            return load_dataset(path, delimiter=',')
+    except FileNotFoundError:
+        st.error(f"Dataset not found. Ensure '{os.path.basename(path)}' is available in the app directory.")
+        st.stop()
+
+def enable_chart_theme():
+    # Only the native Streamlit charts (the Prediction page's operating-point curves and the Diagnostics
+    # page) are drawn with altair; the other pages plot with matplotlib
+    import altair as alt
+    alt.themes.enable("dark")
 
 with st.sidebar:
 
@@ -57,21 +68,47 @@ with st.sidebar:
     st.markdown("🐙 [GitHub Repository](https://github.com/BoubaAhmed/Credit-Card-Fraud-Detection-ML)")
     st.markdown("by: [`Bouba Ahmed`]")
 
-# Render pages based on session state
-if st.session_state.page_selection == 'dashboard':
-    dashboard(df)
+# Every rerun is timed per stage (data load, page render, preprocessing, model load and predict); the
+# aggregates are on the hidden Diagnostics page (?page=diagnostics) and in a Prometheus text file.
+# FRAUD_PROFILE_SLOW_SECONDS=N also keeps a cProfile dump of every rerun slower than N seconds.
+page = st.session_state.page_selection
+slow_rerun_seconds = float(os.environ["FRAUD_PROFILE_SLOW_SECONDS"]) if os.environ.get("FRAUD_PROFILE_SLOW_SECONDS") else None
+with profile_if_slow(page, slow_rerun_seconds), span("rerun"):
+    # Render pages based on session state; only the dataset a page needs is loaded
+    with span(f"page.{page}"):
+        if page == 'dashboard':
+            from components.dashboard import dashboard
+            from utils.dashboard_stats import load_dashboard_stats
+            from utils.data_loader import shuffled_index
+            df = load_data(RAW_DATA_PATH)
+            with span("load_data"):
+                dashboard_stats = load_dashboard_stats(RAW_DATA_PATH, delimiter=',')
+            dashboard(df, shuffled_index(len(df)), dashboard_stats)
+
+        elif page == 'about':
+            from components.about import about
+            about()
+
+        elif page == 'data_cleaning':
+            from components.preprocessing import preprocessing
+            preprocessing(load_data(RAW_DATA_PATH))
+
+        elif page == 'machine_learning':
+            from components.machine_learning import machine_Learning
+            machine_Learning()
 
-if st.session_state.page_selection == 'about':
-    about()
-    
-elif st.session_state.page_selection == 'data_cleaning':
-    preprocessing(df)
+        elif page == 'prediction':
+            from components.prediction import prediction
+            enable_chart_theme()
+            prediction(TEST_DATA_PATH)
 
-elif st.session_state.page_selection == 'machine_learning':
-    machine_Learning(df)
+        elif page == 'conclusion':
+            from components.conclusion import conclusion
+            conclusion()
 
-elif st.session_state.page_selection == 'prediction':
-    prediction(dataset_Test)
+        elif page == 'diagnostics':
+            from components.diagnostics import diagnostics
+            enable_chart_theme()
+            diagnostics()
 
-elif st.session_state.page_selection == 'conclusion':
-    conclusion()
\ No newline at end of file
+instrumentation.write_prometheus()
\ No newline at end of file
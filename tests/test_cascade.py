@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from utils.cascade import calibrate_band
+
+
+def _disagreements(fast, heavy, low, high, threshold):
+    heavy = heavy >= threshold
+    below = np.count_nonzero(heavy & (fast <= low))
+    above = np.count_nonzero(~heavy & (fast >= high))
+    return below, above
+
+
+@pytest.mark.parametrize("threshold", [0.5, 0.3])
+@pytest.mark.parametrize("tolerance", [0.0, 0.001, 0.01])
+def test_band_keeps_disagreement_within_tolerance_and_is_narrowest(tolerance, threshold):
+    rng = np.random.default_rng(0)
+    heavy = rng.beta(0.5, 0.5, 20_000)
+    fast = np.clip(heavy + rng.normal(0, 0.15, len(heavy)), 0, 1)
+    low, high = calibrate_band(fast, heavy, tolerance, threshold)
+
+    assert low <= threshold <= high
+    budget = int(tolerance * len(fast) / 2)
+    below, above = _disagreements(fast, heavy, low, high, threshold)
+    assert below <= budget and above <= budget
+    # Widening by the next score on either side would break the budget
+    step_low = np.min(fast[fast > low])
+    step_high = np.max(fast[fast < high])
+    assert _disagreements(fast, heavy, step_low, high, threshold)[0] > budget
+    assert _disagreements(fast, heavy, low, step_high, threshold)[1] > budget
+
+
+def test_band_collapses_to_threshold_when_models_agree():
+    scores = np.linspace(0, 1, 101)
+    assert calibrate_band(scores, scores, 0.0) == (0.5, 0.5)
@@ -0,0 +1,72 @@
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from utils import drift
+from utils.data_loader import FEATURES
+
+
+def _profile(path):
+    n = len(FEATURES)
+    profile = {
+        "features": FEATURES,
+        "rows": 1000,
+        "edges": np.tile(np.linspace(0.1, 0.9, 9), (n, 1)).tolist(),
+        "shares": np.full((n, 10), 0.1).tolist(),
+        "lower": [0.0] * n,
+        "upper": [1.0] * n,
+        "clip_rate": [0.0] * n,
+        "scores": {},
+    }
+    drift.save_profile(profile, path)
+    return drift.load_profile(path)
+
+
+def _record(profile_path, state_dir, seed, runs):
+    profile = drift.load_profile(profile_path)
+    rng = np.random.default_rng(seed)
+    for _ in range(runs):
+        monitor = drift.DriftMonitor(profile, "Model")
+        monitor.observe_features(rng.random((10, len(FEATURES))))
+        drift.record(monitor, profile_path=profile_path, state_dir=state_dir)
+
+
+def test_psi_is_zero_for_identical_and_matches_formula():
+    shares = np.array([0.25, 0.25, 0.5])
+    assert drift.psi(shares, [25, 25, 50]) == pytest.approx(0.0)
+    actual = np.array([0.5, 0.25, 0.25])
+    expected = np.sum((actual - shares) * np.log(actual / shares))
+    assert drift.psi(shares, [50, 25, 25]) == pytest.approx(expected)
+
+
+def test_psi_stays_finite_for_empty_bins_and_no_rows():
+    assert np.isfinite(drift.psi([0.5, 0.5, 0.0], [10, 0, 0]))
+    assert np.isfinite(drift.psi([0.5, 0.5], [0, 0]))
+
+
+def test_binned_ks_is_largest_cumulative_gap():
+    assert drift.binned_ks([0.25, 0.25, 0.5], [25, 25, 50]) == pytest.approx(0.0)
+    assert drift.binned_ks([0.5, 0.5, 0.0], [0, 0, 10]) == pytest.approx(1.0)
+    assert drift.binned_ks([0.5, 0.25, 0.25], [25, 50, 25]) == pytest.approx(0.25)
+    rows = drift.binned_ks(np.array([[0.5, 0.5], [1.0, 0.0]]), np.array([[5, 5], [0, 10]]))
+    np.testing.assert_allclose(rows, [0.0, 1.0])
+
+
+def test_bin_counts_counts_missing_values_last():
+    counts = drift.bin_counts(np.array([[0.0], [0.5], [1.0], [np.nan]]), [[0.25, 0.75]])
+    np.testing.assert_array_equal(counts, [[1, 1, 1, 1]])
+
+
+def test_concurrent_records_keep_every_count(tmp_path):
+    profile_path = str(tmp_path / "profile.json")
+    state_dir = str(tmp_path / "state")
+    _profile(profile_path)
+    workers = [multiprocessing.Process(target=_record, args=(profile_path, state_dir, seed, 20)) for seed in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(120)
+    assert all(worker.exitcode == 0 for worker in workers)
+    assert drift.monitor_for("Model", profile_path, state_dir).rows == 4 * 20 * 10
+    assert drift.monitored_models(state_dir) == ["Model"]
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from sklearn import metrics
+
+from utils.evaluation import summarize
+
+
+def _data(seed, rows=5_000, ties=False):
+    rng = np.random.default_rng(seed)
+    y = rng.random(rows) < 0.1
+    scores = np.clip(rng.normal(0.3 + 0.4 * y, 0.2), 0, 1)
+    if ties:
+        scores = np.round(scores, 2)  # many tied scores, as tree ensembles produce
+    return y.astype(int), scores
+
+
+@pytest.mark.parametrize("ties", [False, True])
+@pytest.mark.parametrize("threshold", [0.5, 0.31, 0.9])
+def test_summarize_matches_sklearn(ties, threshold):
+    y, scores = _data(0, ties=ties)
+    result = summarize(y, scores, threshold)
+    predicted = (scores >= threshold).astype(int)
+
+    np.testing.assert_array_equal(result["confusion"], metrics.confusion_matrix(y, predicted))
+    assert result["accuracy"] == pytest.approx(metrics.accuracy_score(y, predicted))
+    assert result["precision"] == pytest.approx(metrics.precision_score(y, predicted, zero_division=0))
+    assert result["recall"] == pytest.approx(metrics.recall_score(y, predicted))
+    assert result["f1"] == pytest.approx(metrics.f1_score(y, predicted))
+    assert result["roc_auc"] == pytest.approx(metrics.roc_auc_score(y, scores))
+    assert result["average_precision"] == pytest.approx(metrics.average_precision_score(y, scores))
+
+
+def test_curves_match_sklearn_when_not_thinned():
+    y, scores = _data(1, rows=300, ties=True)
+    result = summarize(y, scores)
+    fpr, tpr, _ = metrics.roc_curve(y, scores, drop_intermediate=False)
+    np.testing.assert_allclose(result["roc"]["fpr"], fpr)
+    np.testing.assert_allclose(result["roc"]["tpr"], tpr)
+    precision, recall, _ = metrics.precision_recall_curve(y, scores)
+    np.testing.assert_allclose(result["pr"]["recall"], recall[::-1])
+    np.testing.assert_allclose(result["pr"]["precision"], precision[::-1])
+
+
+def test_nothing_flagged_above_every_score():
+    y, scores = _data(2, rows=100)
+    result = summarize(y, scores, threshold=2.0)
+    assert result["confusion"].tolist() == [[int((y == 0).sum()), 0], [int(y.sum()), 0]]
+    assert result["precision"] == result["recall"] == result["f1"] == 0.0
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import fraud_score
+from fraud_score import _merge_outputs, score_file
+from utils.batch_scoring import plan_shards
+from utils.data_loader import FEATURES
+
+
+def _parts(tmp_path, frames, suffix):
+    paths = []
+    for i, frame in enumerate(frames):
+        path = tmp_path / f"part-{i}{suffix}"
+        if frame is None:
+            path.write_bytes(b"")
+        elif suffix == ".csv":
+            frame.to_csv(path, index=False)
+        else:
+            pq.write_table(pa.Table.from_pandas(frame, preserve_index=False), path)
+        paths.append(str(path))
+    return paths
+
+
+def test_csv_merge_takes_the_header_from_the_first_non_empty_part(tmp_path):
+    frames = [None, pd.DataFrame({"a": [1, 2]}), None, pd.DataFrame({"a": [3]})]
+    output = tmp_path / "out.csv"
+    _merge_outputs(_parts(tmp_path, frames, ".csv"), str(output), "csv")
+    assert pd.read_csv(output)["a"].tolist() == [1, 2, 3]
+
+
+def test_parquet_merge_skips_empty_parts(tmp_path):
+    frames = [None, pd.DataFrame({"a": [1.0, 2.0]}), pd.DataFrame({"a": [3.0]}), None]
+    output = tmp_path / "out.parquet"
+    _merge_outputs(_parts(tmp_path, frames, ".parquet"), str(output), "parquet")
+    assert pq.read_table(output).column("a").to_pylist() == [1.0, 2.0, 3.0]
+
+
+def test_sharded_scoring_matches_row_order_when_the_first_shard_is_all_bad(tmp_path, monkeypatch):
+    monkeypatch.setattr(fraud_score, "plan_shards", lambda path, shard_bytes: plan_shards(path, 2000))
+    rng = np.random.default_rng(0)
+    good = pd.DataFrame(rng.normal(size=(300, len(FEATURES))), columns=FEATURES)
+    path = tmp_path / "input.csv"
+    with open(path, "w") as f:
+        f.write(",".join(FEATURES) + "\n")
+        f.write("1,2,x\n" * 400)
+        good.to_csv(f, index=False, header=False)
+    output = tmp_path / "out.csv"
+    report = score_file(str(path), str(output), "LightGBMClassifier", workers=2, log=lambda _: None)
+    assert report["shards"] > 2 and report["rows"] == 300 and report["bad_rows"] == 400
+    scored = pd.read_csv(output)
+    np.testing.assert_allclose(scored["Amount"], good["Amount"])
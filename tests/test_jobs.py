@@ -0,0 +1,94 @@
+import os
+import threading
+
+import pytest
+
+from utils import jobs
+
+OPTIONS = {"use_cache": False, "skip_malformed": True, "output_format": "csv", "preprocess": True, "threshold": 0.5}
+
+
+class _Worker:
+    """Stands in for a worker process: it "runs" until the test releases it."""
+
+    def __init__(self, args, **kwargs):
+        self.jobs_dir, self.job_id = os.path.split(args[-1])
+        self.done = threading.Event()
+        _Worker.started.append(self)
+
+    def wait(self):
+        self.done.wait(30)
+        return 0
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    _Worker.started = []
+    monkeypatch.setattr(jobs.subprocess, "Popen", _Worker)
+    model = tmp_path / "Model.pkl"
+    model.write_bytes(b"model")
+    queue = jobs.JobQueue(str(tmp_path / "jobs"), workers=1)
+    queue.model_path = str(model)
+    yield queue
+    for worker in _Worker.started:
+        worker.done.set()
+
+
+def _csv(tmp_path, name, text="V1\n1\n"):
+    path = tmp_path / name
+    path.write_text(text)
+    return str(path)
+
+
+def _started(queue):
+    return [worker for worker in _Worker.started if worker.jobs_dir == queue.store.jobs_dir]
+
+
+def _submit(queue, owner, path):
+    return queue.submit(owner, path, "Model", queue.model_path, OPTIONS)
+
+
+def test_identical_submission_is_shared_with_the_new_owner(queue, tmp_path):
+    path = _csv(tmp_path, "a.csv")
+    first = _submit(queue, "alice", path)
+    assert _submit(queue, "bob", path) == first
+    assert [job["id"] for job in queue.jobs("alice")] == [first]
+    assert [job["id"] for job in queue.jobs("bob")] == [first]
+    assert queue.get(first)["owners"] == ["alice", "bob"]
+    assert _submit(queue, "bob", _csv(tmp_path, "b.csv", "V1\n2\n")) != first
+
+
+def test_queued_jobs_are_taken_round_robin_across_owners(queue, tmp_path):
+    alice = [_submit(queue, "alice", _csv(tmp_path, f"a{i}.csv", f"V1\n{i}\n")) for i in range(3)]
+    bob = _submit(queue, "bob", _csv(tmp_path, "b.csv", "V1\n9\n"))
+    assert [worker.job_id for worker in _started(queue)] == [alice[0]]
+    # Bob has nothing running, so his job goes ahead of Alice's second and third
+    assert [queue.position(job_id) for job_id in (bob, alice[1], alice[2])] == [0, 1, 2]
+
+    _started(queue)[0].done.set()
+    for _ in range(100):
+        if len(_started(queue)) > 1:
+            break
+        threading.Event().wait(0.05)
+    assert _started(queue)[1].job_id == bob
+
+
+def test_recovery_skips_jobs_of_a_live_queue(queue, tmp_path):
+    first = _submit(queue, "alice", _csv(tmp_path, "a.csv"))
+    second = _submit(queue, "alice", _csv(tmp_path, "b.csv", "V1\n2\n"))
+    dead = queue.get(second)
+    dead["queue"] = {"pid": dead["queue"]["pid"], "created": 0.0}  # the same pid, reused by another process
+    queue.store.save(dead)
+
+    # A second queue on the same store takes over the orphaned job only
+    started = len(_started(queue))
+    jobs.JobQueue(queue.store.jobs_dir, workers=1)
+    assert [worker.job_id for worker in _started(queue)[started:]] == [second]
+    assert queue.get(second)["queue"] == jobs._process_identity()
+
+
+def test_dead_process_is_not_alive():
+    identity = jobs._process_identity()
+    assert jobs._alive(identity)
+    assert not jobs._alive({"pid": identity["pid"], "created": identity["created"] - 1})
+    assert not jobs._alive(None)
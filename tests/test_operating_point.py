@@ -0,0 +1,26 @@
+import json
+
+import pytest
+
+from utils.operating_point import base_model, threshold_for
+
+
+@pytest.mark.parametrize("name, base", [
+    ("XGBClassifier-compiled", "XGBClassifier"),
+    ("RandomForestClassifier-t40-d12-bins", "RandomForestClassifier"),
+    ("RandomForestClassifier-compact", "RandomForestClassifier"),
+    ("XGBClassifier-tuned", "XGBClassifier-tuned"),
+    ("LightGBMClassifier-ooc", "LightGBMClassifier-ooc"),
+    ("RandomForestClassifier-cascade", "RandomForestClassifier-cascade"),
+    ("XGBClassifier", "XGBClassifier"),
+])
+def test_base_model(name, base):
+    assert base_model(name) == base
+
+
+def test_threshold_for_only_shares_with_copies(tmp_path):
+    path = tmp_path / "operating_point.json"
+    path.write_text(json.dumps({"XGBClassifier": {"threshold": 0.2}}))
+    assert threshold_for("XGBClassifier", str(path)) == 0.2
+    assert threshold_for("XGBClassifier-compiled", str(path)) == 0.2
+    assert threshold_for("XGBClassifier-tuned", str(path)) == 0.5
@@ -0,0 +1,76 @@
+import multiprocessing
+
+import numpy as np
+
+from utils.score_cache import CachedModel, ScoreCache, row_hashes
+
+
+class _Model:
+    classes_ = np.array([0, 1])
+
+    def predict_proba(self, X):
+        p = 1.0 / (1.0 + np.exp(-X.sum(axis=1)))
+        return np.column_stack([1.0 - p, p])
+
+
+def _score(path, seed, rounds, errors):
+    try:
+        model = CachedModel(_Model(), "test:1", ScoreCache(path))
+        rng = np.random.default_rng(seed)
+        shared = np.random.default_rng(0).normal(size=(200, 29)).astype(np.float32)
+        for _ in range(rounds):
+            # Half the rows are seen by every writer, half are new to this one
+            block = np.vstack([shared[rng.choice(len(shared), 100)], rng.normal(size=(100, 29)).astype(np.float32)])
+            np.testing.assert_allclose(model.predict_proba(block), _Model().predict_proba(block))
+    except Exception as e:
+        errors.put(f"{type(e).__name__}: {e}")
+
+
+def test_row_hashes_ignore_zero_sign_and_nan_payload():
+    block = np.array([[0.0, np.nan], [-0.0, -np.nan]], dtype=np.float32)
+    h1, h2 = row_hashes(block)
+    assert h1[0] == h1[1] and h2[0] == h2[1]
+
+
+def test_lookup_returns_stored_scores(tmp_path):
+    cache = ScoreCache(str(tmp_path / "scores.sqlite"), memory_entries=0)
+    h1, h2 = row_hashes(np.arange(12, dtype=np.float32).reshape(4, 3))
+    cache.store("v", h1[:2], h2[:2], [0.1, 0.2])
+    probabilities, memory_hits, disk_hits = cache.lookup("v", h1, h2)
+    np.testing.assert_allclose(probabilities[:2], [0.1, 0.2])
+    assert np.isnan(probabilities[2:]).all() and (memory_hits, disk_hits) == (0, 2)
+    assert np.isnan(cache.lookup("other", h1, h2)[0]).all()
+
+
+def test_two_connections_write_after_lookup(tmp_path):
+    path = str(tmp_path / "scores.sqlite")
+    first, second = ScoreCache(path, memory_entries=0), ScoreCache(path, memory_entries=0)
+    h1, h2 = row_hashes(np.random.default_rng(0).normal(size=(10, 29)).astype(np.float32))
+    first.store("v", h1[:5], h2[:5], np.full(5, 0.5))
+    first.lookup("v", h1, h2)
+    second.store("v", h1[5:], h2[5:], np.full(5, 0.5))
+    # A lookup must not leave a transaction open that blocks this connection's next write
+    first.store("v", h1, h2, np.full(10, 0.5))
+    first.record_cost("v", 1.0, 10)
+
+
+def test_concurrent_writer_processes(tmp_path):
+    path = str(tmp_path / "scores.sqlite")
+    errors = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=_score, args=(path, seed, 20, errors)) for seed in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(120)
+    failures = []
+    while not errors.empty():
+        failures.append(errors.get())
+    assert not failures, failures
+    assert all(worker.exitcode == 0 for worker in workers)
+
+
+def test_predict_uses_the_threshold(tmp_path):
+    X = np.array([[0.1], [0.5], [2.0]], dtype=np.float32)  # p ~ 0.52, 0.62, 0.88
+    cache = ScoreCache(str(tmp_path / "scores.sqlite"))
+    assert CachedModel(_Model(), "v", cache).predict(X).tolist() == [1, 1, 1]
+    assert CachedModel(_Model(), "v", cache, threshold=0.8).predict(X).tolist() == [0, 0, 1]
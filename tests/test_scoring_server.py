@@ -0,0 +1,49 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+import scoring_server
+from scoring_server import MicroBatcher, parse_transactions
+from utils.data_loader import FEATURES
+from utils.drift import DriftMonitor
+from tests.test_drift import _profile
+
+
+def _record(**overrides):
+    return {name: overrides.get(name, 0.5) for name in FEATURES}
+
+
+def test_parse_accepts_objects_and_lists():
+    block = parse_transactions({"transactions": [_record(V1=1), [2] * len(FEATURES)]})
+    assert block.dtype == np.float32 and block.shape == (2, len(FEATURES))
+    assert block[0, 0] == 1 and block[1, 0] == 2
+
+
+@pytest.mark.parametrize("value", [None, True, "1.0", float("nan"), float("inf"), 1e39])
+def test_parse_rejects_missing_and_non_numeric_values(value):
+    with pytest.raises(ValueError):
+        parse_transactions(_record(V3=value))
+    with pytest.raises(ValueError):
+        parse_transactions([[value] + [0.0] * (len(FEATURES) - 1)])
+
+
+def test_every_scored_batch_reaches_the_drift_state(tmp_path, monkeypatch):
+    profile_path, state_dir = str(tmp_path / "profile.json"), str(tmp_path / "state")
+    profile = _profile(profile_path)
+    recorded = []
+    monkeypatch.setattr(scoring_server, "record", recorded.append)
+    monkeypatch.setattr(scoring_server, "score_block",
+                        lambda block, threshold: (np.zeros(len(block), dtype=np.int8), np.full(len(block), 0.25)))
+
+    async def run():
+        batcher = MicroBatcher(ThreadPoolExecutor(1), window=0.001, drift=DriftMonitor(profile, "Model"))
+        batcher.start()
+        for rows in (3, 5):
+            await batcher.score(np.full((rows, len(FEATURES)), 0.5, dtype=np.float32))
+        await batcher.flush_drift()
+
+    asyncio.run(run())
+    assert sum(monitor.rows for monitor in recorded) == 8
+    assert sum(int(monitor.score_counts.sum()) for monitor in recorded) == 8
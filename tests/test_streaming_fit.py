@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from utils.streaming_fit import TDigest, RunningMoments
+
+
+@pytest.mark.parametrize("q", [0.01, 0.05, 0.5, 0.95, 0.99])
+def test_tdigest_quantile_rank_error_is_bounded(q):
+    rng = np.random.default_rng(0)
+    values = rng.standard_t(3, 200_000)
+    digest = TDigest()
+    for chunk in np.array_split(values, 50):
+        digest.update(chunk)
+    estimate = digest.quantile(q)
+    # Rank error is what the arcsine scale bounds, and it tightens towards the tails
+    rank = np.mean(values <= estimate)
+    assert abs(rank - q) <= 0.005 * max(4 * q * (1 - q), 0.1)
+
+
+def test_tdigest_merged_shards_match_single_pass():
+    rng = np.random.default_rng(1)
+    values = rng.lognormal(size=100_000)
+    whole = TDigest()
+    whole.update(values)
+    merged = TDigest()
+    for shard in np.array_split(values, 8):
+        part = TDigest()
+        part.update(shard)
+        merged.merge(part)
+    assert merged.count == whole.count == len(values)
+    for q in (0.01, 0.99):
+        assert abs(np.mean(values <= merged.quantile(q)) - q) < 0.001
+        assert merged.quantile(q) == pytest.approx(whole.quantile(q), rel=0.02)
+
+
+def test_tdigest_is_exact_before_compressing_and_ignores_nans():
+    values = np.array([3.0, 1.0, np.nan, 2.0, 5.0])
+    digest = TDigest()
+    digest.update(values)
+    assert digest.count == 4
+    for q in (0.0, 0.3, 0.5, 1.0):
+        assert digest.quantile(q) == pytest.approx(np.nanquantile(values, q))
+    assert np.isnan(TDigest().quantile(0.5))
+
+
+def test_running_moments_match_numpy_across_blocks_and_merges():
+    rng = np.random.default_rng(2)
+    data = rng.normal(1e6, 3.0, size=(30_000, 4))  # large offset exercises cancellation
+    data[rng.random(data.shape) < 0.05] = np.nan
+    left, right = RunningMoments(4), RunningMoments(4)
+    for block in np.array_split(data[:10_000], 7):
+        left.update(block)
+    for block in np.array_split(data[10_000:], 3):
+        right.update(block)
+    left.merge(right)
+    np.testing.assert_array_equal(left.count, (~np.isnan(data)).sum(axis=0))
+    np.testing.assert_allclose(left.mean, np.nanmean(data, axis=0), rtol=1e-12)
+    np.testing.assert_allclose(left.variance(), np.nanvar(data, axis=0), rtol=1e-8)
+
+
+def test_running_moments_handle_empty_columns():
+    moments = RunningMoments(2)
+    moments.update(np.array([[1.0, np.nan], [3.0, np.nan]]))
+    moments.merge(RunningMoments(2))
+    assert moments.mean.tolist() == [2.0, 0.0]
+    assert moments.variance()[0] == pytest.approx(1.0)
+    assert np.isnan(moments.variance()[1])
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from utils.data_loader import FEATURES
+from utils.tree_engine import compile_model, load_engine
+
+
+def _data(rows=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(rows, len(FEATURES))).astype(np.float32)
+    y = (X[:, 0] + 0.5 * X[:, 1] * X[:, 2] + rng.normal(scale=0.5, size=rows) > 0).astype(np.int64)
+    X[rng.random(X.shape) < 0.05] = np.nan
+    return X, y
+
+
+def _xgboost(X, y):
+    xgboost = pytest.importorskip("xgboost")
+    return xgboost.XGBClassifier(n_estimators=30, max_depth=4, n_jobs=1).fit(X, y)
+
+
+def _lightgbm(X, y):
+    lightgbm = pytest.importorskip("lightgbm")
+    return lightgbm.LGBMClassifier(n_estimators=30, num_leaves=15, n_jobs=1, verbose=-1).fit(X, y)
+
+
+def _random_forest(X, y):
+    from sklearn.ensemble import RandomForestClassifier
+    return RandomForestClassifier(n_estimators=20, max_depth=8, random_state=0, n_jobs=1).fit(X, y)
+
+
+@pytest.mark.parametrize("fit", [_xgboost, _lightgbm, _random_forest])
+def test_engine_matches_native_predictions_with_missing_values(fit):
+    X, y = _data()
+    model = fit(X, y)
+    engine = compile_model(model)
+    X_test, _ = _data(500, seed=1)
+    np.testing.assert_allclose(engine.predict_proba(X_test), model.predict_proba(X_test), atol=1e-5)
+
+
+@pytest.mark.parametrize("fit", [_xgboost, _lightgbm])
+def test_saved_engine_is_memory_mapped_and_identical(fit, tmp_path):
+    X, y = _data()
+    engine = compile_model(fit(X, y))
+    path = str(tmp_path / "model.trees")
+    engine.save(path)
+    loaded = load_engine(path)
+    assert not loaded.value.flags.writeable
+    np.testing.assert_array_equal(loaded.predict_proba(X), engine.predict_proba(X))
+
+
+def test_small_blocks_give_the_same_leaves():
+    X, y = _data()
+    engine = compile_model(_random_forest(X, y))
+    leaves = engine.leaves(X)
+    engine.block_rows = 7
+    np.testing.assert_array_equal(engine.leaves(X), leaves)
@@ -0,0 +1,36 @@
+"""Reproducible training pipeline for the fraud detection models.
+
+Runs the notebook workflow (load, deduplicate, winsorize, split, scale, fit) as cached stages and
+writes the artifacts the app loads into models/ together with models/manifest.json.
+
+Usage:
+    python -m train [--models XGBClassifier LightGBMClassifier] [--jobs 8] [--force]
+"""
+import json
+import argparse
+
+from utils.training import MODEL_PARAMS, RAW_DATA_PATH, TrainingPipeline
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="train", description="Train the fraud detection models.")
+    parser.add_argument("--data", default=RAW_DATA_PATH, help="raw transactions CSV (default: %(default)s)")
+    parser.add_argument("--models", nargs="+", choices=list(MODEL_PARAMS), default=list(MODEL_PARAMS), help="models to train")
+    parser.add_argument("--jobs", type=int, default=None, help="total cores shared by the models (default: all)")
+    parser.add_argument("--force", action="store_true", help="rerun every stage even if its inputs are unchanged")
+    parser.add_argument("--report", help="also write the per-stage timings as JSON to this path")
+    args = parser.parse_args(argv)
+
+    pipeline = TrainingPipeline(raw_path=args.data, models=args.models, n_jobs=args.jobs, force=args.force)
+    report = pipeline.run()
+
+    print(f"{'stage':<32} {'cached':>6} {'seconds':>9} {'peak RSS MiB':>13}")
+    for row in report:
+        print(f"{row['stage']:<32} {str(row['cached']):>6} {row['seconds']:9.1f} {row['peak_rss'] / 2**20:13,.0f}")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import os
+import time
+import tempfile
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils.data_loader import FEATURES
+from utils.ingestion import read_chunks
+from utils.profiling import span
+from utils.transform import get_transformer
+
+DEFAULT_CHUNK_ROWS = 100_000
+PREDICTION_COLUMN = "Fraud Prediction"
+
+
+class BatchSummary:
+    """Running counters for a streamed batch-scoring job."""
+
+    def __init__(self, output_path, output_format):
+        self.output_path = output_path
+        self.output_format = output_format
+        self.rows = 0
+        self.chunks = 0
+        self.fraud_count = 0
+        self.normal_count = 0
+        self.seconds = 0.0
+        self.preview = None
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def iter_csv_chunks(source, chunk_rows=DEFAULT_CHUNK_ROWS, report=None):
+    """Read a CSV path or binary file object in chunks of about ``chunk_rows``, typed and checked against the schema.
+
+    Malformed rows are handled as ``report`` (a :class:`utils.ingestion.IngestReport`) says.
+    """
+    return read_chunks(source, report, chunk_rows=chunk_rows)
+
+
+def iter_frame_chunks(df, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Slice an in-memory DataFrame into chunks (views, no copies)."""
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+def feature_block(chunk, preprocess=True):
+    """Float32 feature matrix for a chunk, winsorized and scaled unless it is already preprocessed."""
+    if all(name in chunk.columns for name in FEATURES):
+        features = chunk[FEATURES]
+    elif chunk.shape[1] == len(FEATURES):
+        # Headerless or differently named files are accepted positionally, as before
+        features = chunk.set_axis(FEATURES, axis=1)
+    else:
+        raise ValueError(f"The uploaded file must have {len(FEATURES)} columns. Found {chunk.shape[1]}!")
+
+    if preprocess:
+        return get_transformer().transform(features)
+    return np.array(features, dtype=np.float32, order="C")
+
+
+def plan_shards(path, shard_bytes):
+    """Split a CSV into ``(start, end)`` byte ranges that begin and end on line boundaries.
+
+    Returns the header line and the list of ranges covering every data row exactly once.
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        header = f.readline()
+        shards = []
+        start = f.tell()
+        while start < size:
+            f.seek(min(start + shard_bytes, size))
+            f.readline()  # move to the end of the line the target offset fell into
+            end = min(f.tell(), size)
+            shards.append((start, end))
+            start = end
+    return header, shards
+
+
+def iter_shard_chunks(path, header, start, end, chunk_rows=DEFAULT_CHUNK_ROWS, report=None):
+    """Chunks of one byte-range shard from :func:`plan_shards`, parsed with the file's header.
+
+    Line numbers in ``report`` count from the start of the shard (see :func:`utils.ingestion.read_chunks`).
+    """
+    return read_chunks(path, report, chunk_rows=chunk_rows, header=header, start=start, end=end)
+
+
+def new_output_path(output_format):
+    suffix = ".parquet" if output_format == "parquet" else ".csv"
+    fd, path = tempfile.mkstemp(prefix="predictions_", suffix=suffix)
+    os.close(fd)
+    return path
+
+
+def score_stream(chunks, model, output_path=None, output_format="csv", preprocess=True, progress=None, preview_rows=20,
+                 threshold=0.5, drift=None):
+    """Score an iterable of DataFrame chunks, appending each scored chunk to ``output_path``.
+
+    Rows are labelled fraud when their predicted probability is at least ``threshold`` (the model's
+    operating point, see :mod:`utils.operating_point`). A :class:`utils.drift.DriftMonitor` passed
+    as ``drift`` counts every chunk's features and probabilities.
+
+    Input columns are written back as they are in the chunk. CSV chunks from :func:`iter_csv_chunks`
+    hold float64 features, so their values come out unchanged; frames loaded through the Arrow cache
+    (:mod:`utils.data_loader`) hold float32 features, which are written at float32 precision.
+
+    Only one chunk is held in memory at a time, so peak memory depends on the chunk size and not on
+    the size of the input. ``progress`` is called with the running :class:`BatchSummary` after every
+    chunk.
+    """
+    output_path = output_path or new_output_path(output_format)
+    summary = BatchSummary(output_path, output_format)
+    start = time.perf_counter()
+    writer = None
+
+    try:
+        with open(output_path, "wb") as out:
+            for chunk in chunks:
+                with span("batch.preprocess"):
+                    features = feature_block(chunk, preprocess=False)
+                    if drift is not None:
+                        # Raw values are counted before clipping, so out-of-range rows are seen
+                        drift.observe_features(features, transformer=None if preprocess else get_transformer())
+                    if preprocess:
+                        get_transformer().transform_array(features)
+                with span("batch.predict"):
+                    probabilities = model.predict_proba(features)[:, 1]
+                    predictions = (probabilities >= threshold).astype(np.int64)
+                if drift is not None:
+                    drift.observe_scores(probabilities)
+                scored = chunk.assign(**{PREDICTION_COLUMN: predictions})
+
+                if output_format == "parquet":
+                    table = pa.Table.from_pandas(scored, preserve_index=False)
+                    if writer is None:
+                        writer = pq.ParquetWriter(out, table.schema)
+                    writer.write_table(table.cast(writer.schema))
+                else:
+                    out.write(scored.to_csv(index=False, header=summary.chunks == 0).encode("utf-8"))
+
+                if summary.preview is None:
+                    summary.preview = scored.head(preview_rows)
+                fraud = int(np.count_nonzero(predictions == 1))
+                summary.fraud_count += fraud
+                summary.normal_count += len(predictions) - fraud
+                summary.rows += len(predictions)
+                summary.chunks += 1
+                summary.seconds = time.perf_counter() - start
+                if progress is not None:
+                    progress(summary)
+            if writer is not None:
+                writer.close()
+    except BaseException:
+        os.remove(output_path)
+        raise
+    return summary
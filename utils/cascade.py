@@ -0,0 +1,177 @@
+"""Two-stage scoring: a cheap model decides the obvious rows and only uncertain ones reach the heavy model.
+
+The fast stage is usually the first few trees of the LightGBM booster. It scores every row. Rows whose
+probability falls inside the band ``(low, high)`` are re-scored by the heavy ensemble, and all other rows
+keep the fast score. Calibration picks the narrowest band around the operating threshold that keeps the
+cascade's labels within a tolerance of the heavy model's on held-out rows. The band only holds at that
+threshold, so it is saved with the cascade and :func:`utils.operating_point.threshold_for` hands it to
+every scorer; flagging at another threshold needs a new calibration.
+
+A calibrated cascade is saved as ``models/<Heavy>-cascade.cascade`` (a small JSON file naming both
+stages), which the model registry loads like any other model.
+
+Usage:
+    python -m utils.cascade --heavy RandomForestClassifier --fast LightGBMClassifier --fast-trees 50 [--tolerance 0.001] [--threshold 0.5]
+"""
+import os
+import json
+import time
+import argparse
+import threading
+
+import numpy as np
+
+from utils.compression import evaluate, rebuild
+from utils.data_loader import FEATURES
+from utils.model_registry import CASCADE_SUFFIX
+
+DEFAULT_FAST_TREES = 50
+DEFAULT_TOLERANCE = 0.001
+
+
+class CascadeClassifier:
+    """``predict_proba`` that only runs ``heavy`` on rows where ``fast`` scores inside ``(low, high)``."""
+
+    def __init__(self, fast, heavy, low, high, spec=None):
+        self.fast = fast
+        self.heavy = heavy
+        self.low = float(low)
+        self.high = float(high)
+        self.spec = spec or {}
+        self.threshold = float(self.spec.get("threshold", 0.5))
+        self.classes_ = np.array([0, 1])
+        self._lock = threading.Lock()
+        self.rows = 0
+        self.forwarded = 0
+
+    @property
+    def forwarded_fraction(self):
+        return self.forwarded / self.rows if self.rows else 0.0
+
+    def predict_proba(self, X):
+        if hasattr(X, "columns"):
+            X = X[FEATURES].to_numpy(dtype=np.float32)
+        probabilities = np.asarray(self.fast.predict_proba(X)[:, 1], dtype=np.float64)
+        uncertain = np.flatnonzero((probabilities > self.low) & (probabilities < self.high))
+        if len(uncertain):
+            probabilities[uncertain] = self.heavy.predict_proba(X[uncertain])[:, 1]
+        with self._lock:
+            self.rows += len(probabilities)
+            self.forwarded += len(uncertain)
+        return np.column_stack([1.0 - probabilities, probabilities])
+
+    def predict(self, X):
+        return (self.predict_proba(X)[:, 1] >= self.threshold).astype(np.int64)
+
+
+def fast_stage(registry, name, n_trees=None):
+    """The first ``n_trees`` trees of a model, as a shared engine (boosting prefixes are valid models)."""
+    engine = registry.attach(name)
+    if n_trees and hasattr(engine, "roots") and n_trees < engine.n_trees:
+        engine = rebuild(engine, engine.roots[:n_trees])
+    return engine
+
+
+def load_cascade(path, registry):
+    with open(path) as f:
+        spec = json.load(f)
+    fast = fast_stage(registry, spec["fast"], spec.get("fast_trees"))
+    return CascadeClassifier(fast, registry.classifier(spec["heavy"]), spec["low"], spec["high"], spec)
+
+
+def calibrate_band(fast_probabilities, heavy_probabilities, tolerance=DEFAULT_TOLERANCE, threshold=0.5):
+    """Narrowest ``(low, high)`` around ``threshold`` keeping label disagreement with the heavy model within ``tolerance``.
+
+    Half the tolerance goes to each side: below ``low`` at most that share of rows may be ones the heavy
+    model flags, above ``high`` at most that share may be ones it clears.
+    """
+    fast = np.asarray(fast_probabilities, dtype=np.float64)
+    heavy = np.asarray(heavy_probabilities) >= threshold
+    budget = int(tolerance * len(fast) / 2)
+
+    # Rows at or below low keep the fast label 0: at most `budget` of the heavy positives may be among them
+    positives = np.sort(fast[heavy & (fast < threshold)])
+    low = np.nextafter(positives[budget], -np.inf) if budget < len(positives) else threshold
+    # Rows at or above high keep the fast label 1: at most `budget` of the heavy negatives may be among them
+    negatives = np.sort(fast[~heavy & (fast >= threshold)])[::-1]
+    high = np.nextafter(negatives[budget], np.inf) if budget < len(negatives) else threshold
+    return float(low), float(high)
+
+
+def main(argv=None):
+    import pandas as pd
+
+    from utils.compression import X_TEST_PATH, Y_TEST_PATH
+    from utils.model_registry import registry
+    from utils.operating_point import threshold_for
+    from utils.training import RANDOM_STATE
+
+    parser = argparse.ArgumentParser(description="Calibrate and save a fast/heavy cascade and report its cost.")
+    parser.add_argument("--heavy", default="RandomForestClassifier", help="model that scores the uncertain rows (default: %(default)s)")
+    parser.add_argument("--fast", default="LightGBMClassifier", help="model that scores every row (default: %(default)s)")
+    parser.add_argument("--fast-trees", type=int, default=DEFAULT_FAST_TREES, help="use only the first N trees of the fast model (default: %(default)s)")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="share of calibration rows allowed to disagree with the heavy model (default: %(default)s)")
+    parser.add_argument("--threshold", type=float,
+                        help="operating threshold the band is calibrated for (default: the heavy model's saved operating point, else 0.5)")
+    parser.add_argument("--x-test", default=X_TEST_PATH, help="processed test features (default: %(default)s)")
+    parser.add_argument("--y-test", default=Y_TEST_PATH, help="test labels (default: %(default)s)")
+    parser.add_argument("--report", help="also write the comparison as JSON to this path")
+    args = parser.parse_args(argv)
+
+    available = registry.classifiers()
+    for name in (args.heavy, args.fast):
+        if name not in available:
+            parser.error(f"unknown model {name!r}; available: {', '.join(available)}")
+
+    X = pd.read_csv(args.x_test)[FEATURES].to_numpy(np.float32)
+    y = pd.read_csv(args.y_test).iloc[:, 0].to_numpy()
+    order = np.random.default_rng(RANDOM_STATE).permutation(len(X))
+    calibration, holdout = order[:len(X) // 2], order[len(X) // 2:]
+
+    fast = fast_stage(registry, args.fast, args.fast_trees)
+    heavy = registry.classifier(args.heavy)
+    threshold = threshold_for(args.heavy) if args.threshold is None else args.threshold
+    low, high = calibrate_band(fast.predict_proba(X[calibration])[:, 1], heavy.predict_proba(X[calibration])[:, 1],
+                               args.tolerance, threshold)
+
+    spec = {"fast": args.fast, "fast_trees": args.fast_trees, "heavy": args.heavy, "low": low, "high": high,
+            "threshold": threshold, "tolerance": args.tolerance, "calibrated_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    cascade = CascadeClassifier(fast, heavy, low, high, spec)
+
+    rows = []
+    baseline = None
+    for label, model in (("heavy", heavy), ("fast", fast), ("cascade", cascade)):
+        cascade.rows = cascade.forwarded = 0
+        result = evaluate(model, X[holdout], y[holdout], threshold=threshold)
+        baseline = baseline or result
+        rows.append({
+            "model": label,
+            "rows_per_second": result["rows_per_second"],
+            "precision": result["precision"],
+            "recall": result["recall"],
+            "precision_delta": result["precision"] - baseline["precision"],
+            "recall_delta": result["recall"] - baseline["recall"],
+            "agreement": float(np.mean(result["predictions"] == baseline["predictions"])),
+            "forwarded_fraction": cascade.forwarded_fraction if model is cascade else (1.0 if model is heavy else 0.0),
+        })
+
+    path = os.path.join(registry.models_dir, f"{args.heavy}-cascade{CASCADE_SUFFIX}")
+    with open(path, "w") as f:
+        json.dump(spec, f, indent=2)
+
+    print(f"Band ({low:.4f}, {high:.4f}) around threshold {threshold:.4f} calibrated on {len(calibration):,} rows; compared on {len(holdout):,} held-out rows")
+    print(f"{'model':<8} {'rows/s':>12} {'precision':>10} {'recall':>8} {'dP':>8} {'dR':>8} {'agree':>8} {'forwarded':>10}")
+    for row in rows:
+        print(f"{row['model']:<8} {row['rows_per_second']:12,.0f} {row['precision']:10.4f} {row['recall']:8.4f} "
+              f"{row['precision_delta']:+8.4f} {row['recall_delta']:+8.4f} {row['agreement']:8.2%} {row['forwarded_fraction']:10.2%}")
+    speedup = rows[2]["rows_per_second"] / rows[0]["rows_per_second"]
+    print(f"{1 - rows[2]['forwarded_fraction']:.1%} of rows short-circuited, {speedup:.1f}x the heavy model's throughput")
+    print(f"Wrote {path}")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"spec": spec, "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
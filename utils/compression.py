@@ -0,0 +1,274 @@
+"""Smaller, faster variants of the compiled tree ensembles.
+
+Three reductions can be combined, each trading a little accuracy for size and speed:
+
+* tree selection: keep the ``n`` trees that, added one at a time, lower the validation log-loss most;
+* depth capping: cut every tree at a maximum depth, scoring with the value of the internal node;
+* quantization: float16 thresholds and leaf values, or thresholds replaced by one-byte bin indices.
+
+The tool writes the variant next to the original as ``models/<Model>-<settings>.trees``, where the
+model registry and the Prediction page pick it up, and reports size, load time, throughput and the
+precision/recall change against the original on the processed test split.
+
+Usage:
+    python -m utils.compression models/RandomForestClassifier.pkl --trees 40 --max-depth 12 --quantize bins
+"""
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+
+from utils.tree_engine import ENGINE_SUFFIX, TreeEnsemble, compile_model, engine_path, load_engine
+
+QUANTIZE_MODES = ("float16", "bins")
+MAX_BINS = 255
+SELECTION_ROWS = 20_000
+X_TEST_PATH = os.path.join("data", "processed", "X_test.csv")
+Y_TEST_PATH = os.path.join("data", "processed", "y_test.csv")
+
+
+def select_trees(engine, X, y, n_trees):
+    """Greedy forward selection of ``n_trees`` trees by their marginal drop in validation log-loss."""
+    values = engine.value.take(engine.leaves(X)).astype(np.float64)
+    y = np.asarray(y).astype(bool)
+    total = np.zeros(len(X))
+    chosen = []
+    available = np.ones(engine.n_trees, dtype=bool)
+    for k in range(min(n_trees, engine.n_trees)):
+        candidates = total[:, None] + values
+        if engine.aggregation == "mean":
+            p = np.clip(candidates / (k + 1), 1e-7, 1 - 1e-7)
+            losses = -np.where(y[:, None], np.log(p), np.log1p(-p)).mean(axis=0)
+        else:
+            margin = engine.sigmoid_scale * (engine.base_margin + candidates)
+            losses = np.logaddexp(0.0, np.where(y[:, None], -margin, margin)).mean(axis=0)
+        losses[~available] = np.inf
+        best = int(np.argmin(losses))
+        chosen.append(best)
+        available[best] = False
+        total += values[:, best]
+    return np.array(chosen, dtype=np.int64)
+
+
+def rebuild(engine, roots=None, max_depth=None):
+    """Copy the trees under ``roots`` into fresh tables, turning nodes at ``max_depth`` into leaves.
+
+    Nodes are renumbered level by level across all trees, which keeps siblings adjacent.
+    """
+    roots = engine.roots if roots is None else np.asarray(roots)
+    cap = engine.max_depth if max_depth is None else min(max_depth, engine.max_depth)
+    is_leaf = engine.leaf_mask
+
+    old_ids = [roots.astype(np.int64)]
+    new_left = []
+    frontier, next_id = old_ids[0], len(roots)
+    depth = 0
+    while len(frontier):
+        split = ~is_leaf[frontier] if depth < cap else np.zeros(len(frontier), dtype=bool)
+        parents = frontier[split]
+        lefts = np.full(len(frontier), -1, dtype=np.int64)
+        lefts[split] = next_id + 2 * np.arange(len(parents))
+        new_left.append(lefts)
+
+        frontier = np.empty(2 * len(parents), dtype=np.int64)
+        frontier[0::2] = engine.left[parents]
+        frontier[1::2] = engine.left[parents] + 1
+        next_id += len(frontier)
+        if len(frontier):
+            old_ids.append(frontier)
+        depth += 1
+    reached = depth - 1
+
+    old = np.concatenate(old_ids)
+    left = np.concatenate(new_left)
+    leaves = left < 0
+    left[leaves] = np.flatnonzero(leaves)
+    threshold = engine.threshold[old].astype(np.float32)
+    threshold[leaves] = np.inf
+    default_left = engine.default_left[old].copy()
+    default_left[leaves] = 1
+    feature = engine.feature[old].astype(np.int32)
+    feature[leaves] = 0
+    return TreeEnsemble(
+        feature=feature,
+        threshold=threshold,
+        left=left.astype(np.int32),
+        default_left=default_left,
+        value=engine.value[old].astype(np.float32),
+        roots=np.arange(len(roots), dtype=np.int32),
+        max_depth=min(reached, cap),
+        **{key: value for key, value in engine.metadata().items() if key != "max_depth"},
+    )
+
+
+def quantize(engine, mode, max_bins=MAX_BINS):
+    """Shrink the node tables: ``float16`` thresholds and values, or ``bins`` (bin-index thresholds).
+
+    In ``bins`` mode each feature keeps at most ``max_bins - 1`` distinct split points; features with
+    more are snapped to the nearest of ``max_bins - 1`` points spread over their sorted thresholds.
+    """
+    if mode not in QUANTIZE_MODES:
+        raise ValueError(f"Unknown quantization {mode!r}; expected one of {', '.join(QUANTIZE_MODES)}")
+    is_leaf = engine.leaf_mask
+    feature_dtype = np.uint8 if engine.n_features_in_ <= 256 else np.uint16
+    arrays = {
+        "feature": engine.feature.astype(feature_dtype),
+        "left": np.asarray(engine.left),
+        "default_left": np.asarray(engine.default_left),
+        "value": engine.value.astype(np.float16),
+        "roots": np.asarray(engine.roots),
+    }
+
+    if mode == "float16":
+        f16 = np.finfo(np.float16)
+        threshold = np.clip(engine.threshold, f16.min, f16.max).astype(np.float16)
+        threshold[is_leaf] = np.inf
+        arrays["threshold"] = threshold
+    else:
+        bin_dtype = np.uint8 if max_bins <= np.iinfo(np.uint8).max else np.uint16
+        if max_bins > np.iinfo(bin_dtype).max:
+            raise ValueError(f"max_bins must be at most {np.iinfo(np.uint16).max}")
+        threshold = np.full(engine.n_nodes, np.iinfo(bin_dtype).max, dtype=bin_dtype)  # leaves: always left
+        edges, offsets = [], [0]
+        for f in range(engine.n_features_in_):
+            nodes = np.flatnonzero((engine.feature == f) & ~is_leaf)
+            values = np.asarray(engine.threshold[nodes], dtype=np.float32)
+            points = np.unique(values)
+            if len(points) > max_bins - 1:
+                points = points[np.linspace(0, len(points) - 1, max_bins - 1).round().astype(np.int64)]
+            # Snap each threshold to its nearest kept split point; x <= points[j] iff bin(x) <= j
+            upper = np.clip(np.searchsorted(points, values), 0, max(len(points) - 1, 0))
+            lower = np.clip(upper - 1, 0, None)
+            nearest = np.where(np.abs(points[lower] - values) <= np.abs(points[upper] - values), lower, upper) \
+                if len(points) else upper
+            threshold[nodes] = nearest
+            edges.append(points)
+            offsets.append(offsets[-1] + len(points))
+        arrays["threshold"] = threshold
+        arrays["bin_edges"] = np.concatenate(edges).astype(np.float32)
+        arrays["bin_offsets"] = np.array(offsets, dtype=np.int64)
+
+    return TreeEnsemble(**arrays, **engine.metadata())
+
+
+def compress(engine, X_val=None, y_val=None, n_trees=None, max_depth=None, quantize_mode=None, max_bins=MAX_BINS):
+    """Apply tree selection (needs validation data), depth capping and quantization, in that order."""
+    roots = engine.roots
+    if n_trees and n_trees < engine.n_trees:
+        if X_val is None or y_val is None:
+            raise ValueError("Tree selection needs validation data")
+        roots = roots[select_trees(engine, X_val, y_val, n_trees)]
+    compact = rebuild(engine, roots, max_depth)
+    if quantize_mode:
+        compact = quantize(compact, quantize_mode, max_bins)
+    return compact
+
+
+def variant_name(base, n_trees=None, max_depth=None, quantize_mode=None):
+    """File stem for a compressed variant, e.g. ``RandomForestClassifier-t40-d12-bins``."""
+    parts = [f"t{n_trees}" if n_trees else "", f"d{max_depth}" if max_depth else "", quantize_mode or ""]
+    return "-".join([base] + ([part for part in parts if part] or ["compact"]))
+
+
+def evaluate(model, X, y, repeat=3, threshold=0.5):
+    """Precision and recall at ``threshold`` plus the best-of-``repeat`` batch throughput."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        probabilities = model.predict_proba(X)[:, 1]
+        timings.append(time.perf_counter() - start)
+    predictions = probabilities >= threshold
+    y = np.asarray(y).astype(bool)
+    true_positives = np.count_nonzero(predictions & y)
+    return {
+        "predictions": predictions,
+        "precision": true_positives / max(np.count_nonzero(predictions), 1),
+        "recall": true_positives / max(np.count_nonzero(y), 1),
+        "rows_per_second": len(X) / min(timings),
+    }
+
+
+def _timed_load(path):
+    import joblib
+
+    start = time.perf_counter()
+    model = load_engine(path) if path.endswith(ENGINE_SUFFIX) else joblib.load(path)
+    return model, time.perf_counter() - start
+
+
+def main(argv=None):
+    import pandas as pd
+
+    from utils.data_loader import FEATURES
+    from utils.training import RANDOM_STATE
+
+    parser = argparse.ArgumentParser(description="Write a compressed variant of a tree ensemble and report its cost.")
+    parser.add_argument("model", help="pickled classifier or compiled .trees engine")
+    parser.add_argument("--trees", type=int, help="number of trees to keep, chosen by validation contribution")
+    parser.add_argument("--max-depth", type=int, help="cut every tree at this depth")
+    parser.add_argument("--quantize", choices=QUANTIZE_MODES, help="store thresholds/values as float16 or bin indices")
+    parser.add_argument("--max-bins", type=int, default=MAX_BINS, help="bins per feature for --quantize bins (default: %(default)s)")
+    parser.add_argument("--x-test", default=X_TEST_PATH, help="processed test features (default: %(default)s)")
+    parser.add_argument("--y-test", default=Y_TEST_PATH, help="test labels (default: %(default)s)")
+    parser.add_argument("--output", help="where to write the variant (default: next to the model)")
+    parser.add_argument("--report", help="also write the comparison as JSON to this path")
+    args = parser.parse_args(argv)
+
+    X = pd.read_csv(args.x_test)[FEATURES].to_numpy(np.float32)
+    y = pd.read_csv(args.y_test).iloc[:, 0].to_numpy()
+
+    # Trees are selected on part of the test split and every model is compared on the rest
+    order = np.random.default_rng(RANDOM_STATE).permutation(len(X))
+    selection = order[:min(SELECTION_ROWS, len(X) // 2)] if args.trees else order[:0]
+    holdout = np.setdiff1d(order, selection)
+    X_val, y_val, X_eval, y_eval = X[selection], y[selection], X[holdout], y[holdout]
+
+    original, original_load = _timed_load(args.model)
+    engine = original if isinstance(original, TreeEnsemble) else compile_model(original)
+    variant = compress(engine, X_val, y_val, args.trees, args.max_depth, args.quantize, args.max_bins)
+
+    base = os.path.splitext(os.path.basename(args.model))[0].split("-")[0]
+    output = args.output or os.path.join(os.path.dirname(args.model),
+                                         variant_name(base, args.trees, args.max_depth, args.quantize) + ENGINE_SUFFIX)
+    variant.save(output)
+
+    candidates = [("original", args.model, original, original_load)]
+    compiled_path = engine_path(args.model)
+    if not isinstance(original, TreeEnsemble) and os.path.exists(compiled_path):
+        candidates.append(("compiled", compiled_path, *_timed_load(compiled_path)))
+    candidates.append(("variant", output, *_timed_load(output)))
+
+    rows = []
+    baseline = None
+    for label, path, model, load_seconds in candidates:
+        result = evaluate(model, X_eval, y_eval)
+        baseline = baseline or result
+        rows.append({
+            "model": label,
+            "path": path,
+            "trees": getattr(model, "n_trees", None) or len(getattr(model, "estimators_", [])) or None,
+            "size_bytes": os.path.getsize(path),
+            "load_seconds": load_seconds,
+            "rows_per_second": result["rows_per_second"],
+            "precision": result["precision"],
+            "recall": result["recall"],
+            "precision_delta": result["precision"] - baseline["precision"],
+            "recall_delta": result["recall"] - baseline["recall"],
+            "agreement": float(np.mean(result["predictions"] == baseline["predictions"])),
+        })
+
+    print(f"Compared on {len(X_eval):,} held-out test rows" + (f" ({len(X_val):,} used for tree selection)" if len(X_val) else ""))
+    print(f"{'model':<9} {'size MiB':>9} {'load ms':>9} {'rows/s':>12} {'precision':>10} {'recall':>8} {'dP':>8} {'dR':>8} {'agree':>7}")
+    for row in rows:
+        print(f"{row['model']:<9} {row['size_bytes'] / 2**20:9.2f} {row['load_seconds'] * 1000:9.1f} {row['rows_per_second']:12,.0f} "
+              f"{row['precision']:10.4f} {row['recall']:8.4f} {row['precision_delta']:+8.4f} {row['recall_delta']:+8.4f} {row['agreement']:7.2%}")
+    print(f"Wrote {output}")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
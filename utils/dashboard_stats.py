@@ -0,0 +1,136 @@
+import os
+import threading
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from utils.data_loader import CACHE_DIR, file_fingerprint, load_dataset
+
+CHUNK_ROWS = 65_536
+QUANTILES = (0.25, 0.5, 0.75)
+
+_lock = threading.Lock()
+_stats = {}
+
+
+class MomentAccumulator:
+    """Running per-column counts, sums, min/max and pairwise cross-products, updated chunk by chunk.
+
+    Values are shifted by the first chunk's column means before accumulating so variances and
+    covariances stay accurate in float64. NaNs are excluded pairwise, matching ``DataFrame.corr``.
+    """
+
+    def __init__(self, columns):
+        k = len(columns)
+        self.columns = list(columns)
+        self.shift = None
+        self.rows = 0
+        self.pair_counts = np.zeros((k, k))   # rows where both columns are present
+        self.pair_sums = np.zeros((k, k))     # sum of column i over rows where column j is present
+        self.pair_squares = np.zeros((k, k))  # sum of column i squared over rows where column j is present
+        self.cross = np.zeros((k, k))         # sum of column i times column j
+        self.minimum = np.full(k, np.inf)
+        self.maximum = np.full(k, -np.inf)
+
+    def update(self, block):
+        block = np.asarray(block, dtype=np.float64)
+        if not len(block):
+            return
+        present = ~np.isnan(block)
+        if self.shift is None:
+            with np.errstate(invalid="ignore"):
+                self.shift = np.nan_to_num(np.nanmean(block, axis=0))
+        centred = np.where(present, block - self.shift, 0.0)
+        weights = present.astype(np.float64)
+
+        self.rows += len(block)
+        self.pair_counts += weights.T @ weights
+        self.pair_sums += centred.T @ weights
+        self.pair_squares += (centred * centred).T @ weights
+        self.cross += centred.T @ centred
+        self.minimum = np.fmin(self.minimum, np.nanmin(np.where(present, block, np.inf), axis=0))
+        self.maximum = np.fmax(self.maximum, np.nanmax(np.where(present, block, -np.inf), axis=0))
+
+    def counts(self):
+        return np.diag(self.pair_counts)
+
+    def means(self):
+        shift = self.shift if self.shift is not None else 0.0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return shift + np.diag(self.pair_sums) / self.counts()
+
+    def stds(self):
+        n = self.counts()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            variance = (np.diag(self.pair_squares) - np.diag(self.pair_sums) ** 2 / n) / (n - 1)
+        return np.sqrt(np.maximum(variance, 0.0))
+
+    def correlation(self):
+        n = self.pair_counts
+        with np.errstate(invalid="ignore", divide="ignore"):
+            covariance = self.cross - self.pair_sums * self.pair_sums.T / n
+            variance = np.maximum(self.pair_squares - self.pair_sums ** 2 / n, 0.0)
+            corr = covariance / np.sqrt(variance * variance.T)
+        return np.clip(corr, -1.0, 1.0)
+
+
+def build_dashboard_stats(data, label_column="Class"):
+    """Compute every aggregate the Dashboard page shows in one chunked pass over ``data``."""
+    numeric = data.select_dtypes(include="number").columns.tolist()
+    accumulator = MomentAccumulator(numeric)
+    missing = pd.Series(0, index=data.columns, dtype=np.int64)
+    for start in range(0, len(data), CHUNK_ROWS):
+        chunk = data.iloc[start:start + CHUNK_ROWS]
+        missing += chunk.isnull().sum()
+        accumulator.update(chunk[numeric].to_numpy(dtype=np.float64))
+
+    # Exact quartiles need an order statistic, computed with a linear-time partition per column
+    quartiles = np.nanpercentile(data[numeric].to_numpy(dtype=np.float64), [q * 100 for q in QUANTILES], axis=0) \
+        if len(data) else np.full((len(QUANTILES), len(numeric)), np.nan)
+
+    describe = pd.DataFrame(
+        np.vstack([
+            accumulator.counts(),
+            accumulator.means(),
+            accumulator.stds(),
+            accumulator.minimum,
+            quartiles,
+            accumulator.maximum,
+        ]),
+        index=["count", "mean", "std", "min", "25%", "50%", "75%", "max"],
+        columns=numeric,
+    )
+
+    class_counts = data[label_column].value_counts() if label_column in data.columns else pd.Series(dtype=np.int64)
+    return {
+        "n_rows": int(len(data)),
+        "n_columns": int(data.shape[1]),
+        "missing": missing,
+        "describe": describe,
+        "class_counts": class_counts,
+        "corr": pd.DataFrame(accumulator.correlation(), index=numeric, columns=numeric),
+    }
+
+
+def stats_path(path):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(CACHE_DIR, f"{stem}.{file_fingerprint(path)}.stats.pkl")
+
+
+def load_dashboard_stats(path, delimiter=","):
+    """Dashboard aggregates for the CSV at ``path``, persisted next to its Arrow cache.
+
+    Results are keyed on the source file's fingerprint, so they are computed once per dataset
+    version and then served from memory (or disk after a restart).
+    """
+    key = stats_path(path)
+    with _lock:
+        if key not in _stats:
+            if os.path.exists(key):
+                _stats[key] = joblib.load(key)
+            else:
+                _stats[key] = build_dashboard_stats(load_dataset(path, delimiter))
+                os.makedirs(CACHE_DIR, exist_ok=True)
+                joblib.dump(_stats[key], key)
+        return _stats[key]
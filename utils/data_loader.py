@@ -0,0 +1,114 @@
+import os
+import hashlib
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.feather as feather
+
+# The 29 model features (PCA components + transaction amount)
+FEATURES = [f"V{i}" for i in range(1, 29)] + ["Amount"]
+
+CACHE_DIR = os.path.join("data", "cache")
+
+# Process-wide caches shared by every Streamlit session and rerun
+_lock = threading.Lock()
+_frames = {}
+_permutations = {}
+
+
+def file_fingerprint(path):
+    """Cheap identity of a file's current content, derived from its size and mtime."""
+    stat = os.stat(path)
+    key = f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def _read_header(path, delimiter):
+    with open(path, newline="") as f:
+        return [name.strip().strip('"') for name in f.readline().rstrip("\r\n").split(delimiter)]
+
+
+def convert_to_arrow(path, delimiter=",", fingerprint=None, cache_dir=None):
+    """Convert a CSV once into an uncompressed Arrow IPC file (float32 features) and return its path."""
+    cache_dir = cache_dir or CACHE_DIR
+    fingerprint = fingerprint or file_fingerprint(path)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    arrow_path = os.path.join(cache_dir, f"{stem}.{fingerprint}.arrow")
+    if os.path.exists(arrow_path):
+        return arrow_path
+
+    os.makedirs(cache_dir, exist_ok=True)
+    column_types = {name: pa.float32() for name in _read_header(path, delimiter) if name in FEATURES}
+    table = pv.read_csv(
+        path,
+        parse_options=pv.ParseOptions(delimiter=delimiter),
+        convert_options=pv.ConvertOptions(column_types=column_types),
+    )
+
+    # One record batch per file keeps every column a single contiguous buffer that NumPy can view.
+    # Write to a temporary file first so a concurrent reader never sees a partial cache
+    tmp_path = f"{arrow_path}.{os.getpid()}.tmp"
+    feather.write_feather(table.combine_chunks(), tmp_path, compression="uncompressed", chunksize=max(table.num_rows, 1))
+    os.replace(tmp_path, arrow_path)
+
+    # Drop caches left behind by older versions of the same CSV
+    for name in os.listdir(cache_dir):
+        if name.startswith(f"{stem}.") and name.endswith(".arrow") and name != os.path.basename(arrow_path):
+            try:
+                os.remove(os.path.join(cache_dir, name))
+            except OSError:
+                pass
+    return arrow_path
+
+
+def load_table(path, delimiter=",", cache_dir=None):
+    """Return the memory-mapped Arrow table for a CSV, converting it on first use."""
+    return feather.read_table(convert_to_arrow(path, delimiter, cache_dir=cache_dir), memory_map=True)
+
+
+def frame_from_table(table):
+    """DataFrame whose columns are read-only NumPy views over a (memory-mapped) Arrow table.
+
+    Single-chunk numeric columns without nulls are not copied, so a frame over a memory-mapped file
+    costs no private memory and every process mapping the same file shares its pages. Other columns
+    fall back to a regular conversion.
+    """
+    columns = {}
+    for name in table.column_names:
+        column = table.column(name)
+        try:
+            columns[name] = column.chunk(0).to_numpy(zero_copy_only=True) if column.num_chunks == 1 else column.to_numpy()
+        except (pa.ArrowInvalid, NotImplementedError):
+            columns[name] = column.to_pandas()
+    return pd.DataFrame(columns, copy=False)
+
+
+def load_dataset(path, delimiter=","):
+    """Load a CSV as a DataFrame of zero-copy views over its memory-mapped Arrow cache.
+
+    The frame is built once per process for a given file version and then shared, so callers must
+    treat it as read-only and copy before mutating.
+    """
+    key = os.path.abspath(path)
+    fingerprint = file_fingerprint(path)
+    with _lock:
+        cached = _frames.get(key)
+        if cached is None or cached[0] != fingerprint:
+            table = feather.read_table(convert_to_arrow(path, delimiter, fingerprint), memory_map=True)
+            _frames[key] = (fingerprint, frame_from_table(table))
+        return _frames[key][1]
+
+
+def shuffled_index(n_rows, seed=42):
+    """Cached random permutation of ``range(n_rows)``, used instead of shuffling a copy of the data."""
+    key = (n_rows, seed)
+    with _lock:
+        order = _permutations.get(key)
+        if order is None:
+            order = np.random.default_rng(seed).permutation(n_rows)
+            order.flags.writeable = False
+            _permutations[key] = order
+        return order
@@ -0,0 +1,410 @@
+"""Feature and score drift of scored traffic, measured against a reference profile from training time.
+
+The reference profile (``models/drift_profile.json``) holds, for every feature, the training data's
+decile-style bin edges and bin shares, plus the share of rows outside the winsorization bounds (the
+rows ``preprocess_data`` would clip). It also holds a histogram of each model's test-set fraud
+probabilities. ``python -m train`` builds it. ``python -m utils.drift build`` builds it for models
+trained elsewhere.
+
+Scoring only adds counts. Each batch is binned in O(rows) into per-feature counters and a
+probability counter, and those counters are merged into a per-model state under
+``data/cache/drift``, under a file lock shared by every process that scores. No rows are kept. The Population Stability Index and a binned
+Kolmogorov-Smirnov distance compare the accumulated counts with the reference, and the Dashboard
+raises alerts for drifted features, rising clip rates and shifted scores.
+
+Usage:
+    python -m utils.drift build [--data data/raw/creditcard_2023.csv]
+    python -m utils.drift report [--model LightGBMClassifier]
+    python -m utils.drift reset [--model LightGBMClassifier]
+"""
+import os
+import json
+import time
+import argparse
+import threading
+import contextlib
+
+import numpy as np
+
+from utils.data_loader import CACHE_DIR, FEATURES, file_fingerprint
+from utils.training import MODELS_DIR
+
+DRIFT_PROFILE_PATH = os.path.join(MODELS_DIR, "drift_profile.json")
+DRIFT_STATE_DIR = os.path.join(CACHE_DIR, "drift")
+FEATURE_BINS = 20
+SCORE_BINS = 20
+PSI_WARNING = 0.1
+PSI_ALERT = 0.25
+CLIP_RATE_MARGIN = 0.01  # alert when the clip rate exceeds twice the reference plus this margin
+MIN_ROWS = 1000  # fewer scored rows than this are too noisy to alert on
+SHARE_FLOOR = 1e-4  # empty bins count as this share so PSI stays finite
+
+_lock = threading.Lock()
+_profiles = {}
+_states = {}
+
+
+def bin_counts(block, edges):
+    """Per-column histogram counts of ``block`` for the interior bin ``edges`` (one row per column).
+
+    Returns ``(columns, bins + 1)`` counts whose last column counts missing values.
+    """
+    block = np.asarray(block)
+    edges = np.atleast_2d(edges)
+    n_bins = edges.shape[1] + 1
+    counts = np.zeros((block.shape[1], n_bins + 1), dtype=np.int64)
+    for j in range(block.shape[1]):
+        column = block[:, j]
+        index = np.searchsorted(edges[j], column, side="right")
+        index[np.isnan(column)] = n_bins
+        counts[j] = np.bincount(index, minlength=n_bins + 1)
+    return counts
+
+
+def score_edges(n_bins=SCORE_BINS):
+    return np.linspace(0.0, 1.0, n_bins + 1)[1:-1]
+
+
+def psi(expected_shares, actual_counts):
+    """Population Stability Index of observed counts against reference shares, per row."""
+    expected = np.maximum(np.asarray(expected_shares, dtype=np.float64), SHARE_FLOOR)
+    actual = np.asarray(actual_counts, dtype=np.float64)
+    totals = actual.sum(axis=-1, keepdims=True)
+    actual = np.maximum(np.divide(actual, totals, out=np.zeros_like(actual), where=totals > 0), SHARE_FLOOR)
+    return np.sum((actual - expected) * np.log(actual / expected), axis=-1)
+
+
+def binned_ks(expected_shares, actual_counts):
+    """Largest gap between the reference and observed cumulative distributions over the bins, per row."""
+    expected = np.cumsum(expected_shares, axis=-1)
+    actual = np.asarray(actual_counts, dtype=np.float64)
+    totals = actual.sum(axis=-1, keepdims=True)
+    actual = np.cumsum(np.divide(actual, totals, out=np.zeros_like(actual), where=totals > 0), axis=-1)
+    return np.max(np.abs(actual - expected), axis=-1)
+
+
+def build_profile(frame, bounds, scores=None, n_bins=FEATURE_BINS):
+    """Reference profile of the raw features in ``frame`` and of each model's probabilities in ``scores``."""
+    values = frame[FEATURES].to_numpy(dtype=np.float64)
+    edges = np.nanquantile(values, np.linspace(0.0, 1.0, n_bins + 1)[1:-1], axis=0).T
+    lower = np.array([bounds[col][0] for col in FEATURES])
+    upper = np.array([bounds[col][1] for col in FEATURES])
+    # Shares are of the winsorized values the models see; out-of-range values are tracked as clip rates
+    counts = bin_counts(np.clip(values, lower, upper), edges)[:, :n_bins]
+    profile = {
+        "features": FEATURES,
+        "rows": len(values),
+        "edges": edges.tolist(),
+        "shares": (counts / np.maximum(counts.sum(axis=1, keepdims=True), 1)).tolist(),
+        "lower": lower.tolist(),
+        "upper": upper.tolist(),
+        "clip_rate": ((values < lower) | (values > upper)).mean(axis=0).tolist(),
+        "scores": {},
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    for name, probabilities in (scores or {}).items():
+        score_counts = bin_counts(np.asarray(probabilities, dtype=np.float64)[:, None], score_edges())[0, :SCORE_BINS]
+        profile["scores"][name] = (score_counts / max(score_counts.sum(), 1)).tolist()
+    return profile
+
+
+def save_profile(profile, path=DRIFT_PROFILE_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(profile, f)
+    os.replace(tmp_path, path)
+
+
+def load_profile(path=DRIFT_PROFILE_PATH):
+    """The reference profile at ``path`` (``None`` if there is none), reread only when the file changes."""
+    if not os.path.exists(path):
+        return None
+    fingerprint = file_fingerprint(path)
+    with _lock:
+        cached = _profiles.get(path)
+        if cached is None or cached[0] != fingerprint:
+            with open(path) as f:
+                profile = json.load(f)
+            profile["fingerprint"] = fingerprint
+            _profiles[path] = cached = (fingerprint, profile)
+        return cached[1]
+
+
+class DriftMonitor:
+    """Streaming bin counters for one model's scored rows, compared with the reference profile."""
+
+    def __init__(self, profile, model_name):
+        self.profile = profile
+        self.model_name = model_name
+        self.edges = np.asarray(profile["edges"])
+        self.lower = np.asarray(profile["lower"])
+        self.upper = np.asarray(profile["upper"])
+        n_bins = self.edges.shape[1] + 1
+        self.feature_counts = np.zeros((len(FEATURES), n_bins + 1), dtype=np.int64)
+        self.clipped = np.zeros(len(FEATURES), dtype=np.int64)
+        self.score_counts = np.zeros(SCORE_BINS + 1, dtype=np.int64)
+        self.rows = 0
+        self.scored = 0
+
+    @property
+    def score_reference(self):
+        scores = self.profile["scores"]
+        return scores.get(self.model_name) or scores.get(self.model_name.split("-")[0])
+
+    def observe_features(self, block, transformer=None):
+        """Count a ``(rows, features)`` block of raw values.
+
+        Values are binned after winsorization, like the reference shares, and the values outside the
+        bounds are counted separately. An already preprocessed block is passed with the
+        ``transformer`` that produced it; the reference edges are then mapped into its scaled units,
+        and values sitting on a winsorization bound are counted as clipped.
+        """
+        edges, lower, upper = self.edges, self.lower, self.upper
+        if transformer is not None:
+            mean = transformer.mean.astype(np.float64)
+            inv_scale = transformer.inv_scale.astype(np.float64)
+            edges = (edges - mean[:, None]) * inv_scale[:, None]
+            lower, upper = (lower - mean) * inv_scale, (upper - mean) * inv_scale
+            tolerance = 1e-5 * np.maximum(np.abs(lower), np.abs(upper)) + 1e-6
+            clipped = (block <= lower + tolerance) | (block >= upper - tolerance)
+        else:
+            clipped = (block < lower) | (block > upper)
+            block = np.clip(block, lower, upper)
+        self.feature_counts += bin_counts(block, edges)
+        self.clipped += np.count_nonzero(clipped, axis=0)
+        self.rows += len(block)
+
+    def observe_scores(self, probabilities):
+        probabilities = np.asarray(probabilities, dtype=np.float64)
+        self.score_counts += bin_counts(probabilities[:, None], score_edges())[0]
+        self.scored += len(probabilities)
+
+    def merge(self, other):
+        self.feature_counts += other.feature_counts
+        self.clipped += other.clipped
+        self.score_counts += other.score_counts
+        self.rows += other.rows
+        self.scored += other.scored
+
+    def state(self):
+        return {
+            "model": self.model_name,
+            "profile": self.profile.get("fingerprint"),
+            "feature_counts": self.feature_counts.tolist(),
+            "clipped": self.clipped.tolist(),
+            "score_counts": self.score_counts.tolist(),
+            "rows": self.rows,
+            "scored": self.scored,
+        }
+
+    @classmethod
+    def from_state(cls, profile, state):
+        monitor = cls(profile, state["model"])
+        monitor.feature_counts = np.asarray(state["feature_counts"], dtype=np.int64)
+        monitor.clipped = np.asarray(state["clipped"], dtype=np.int64)
+        monitor.score_counts = np.asarray(state["score_counts"], dtype=np.int64)
+        monitor.rows = state["rows"]
+        monitor.scored = state["scored"]
+        return monitor
+
+    def report(self):
+        """Per-feature PSI, binned KS and clip rates against the reference, plus the same for scores."""
+        shares = np.asarray(self.profile["shares"])
+        counts = self.feature_counts[:, :-1]
+        features = []
+        feature_psi = psi(shares, counts)
+        feature_ks = binned_ks(shares, counts)
+        for j, name in enumerate(FEATURES):
+            present = counts[j].sum()
+            features.append({
+                "feature": name,
+                "psi": float(feature_psi[j]),
+                "ks": float(feature_ks[j]),
+                "clip_rate": float(self.clipped[j] / self.rows) if self.rows else 0.0,
+                "reference_clip_rate": float(self.profile["clip_rate"][j]),
+                "missing_rate": float(self.feature_counts[j, -1] / self.rows) if self.rows else 0.0,
+                "rows": int(present),
+            })
+        scores = None
+        if self.score_reference is not None and self.scored:
+            reference = np.asarray(self.score_reference)
+            scores = {
+                "psi": float(psi(reference, self.score_counts[:-1])),
+                "ks": float(binned_ks(reference, self.score_counts[:-1])),
+                "histogram": (self.score_counts[:-1] / self.scored).tolist(),
+                "reference": reference.tolist(),
+            }
+        return {"model": self.model_name, "rows": self.rows, "scored": self.scored, "features": features, "scores": scores}
+
+    def alerts(self, report=None):
+        """``(level, message)`` pairs, level ``"error"`` or ``"warning"``; empty below :data:`MIN_ROWS` rows."""
+        report = report or self.report()
+        if report["rows"] < MIN_ROWS:
+            return []
+        alerts = []
+        for row in report["features"]:
+            if row["psi"] >= PSI_WARNING:
+                level = "error" if row["psi"] >= PSI_ALERT else "warning"
+                alerts.append((level, f"{row['feature']} has drifted (PSI {row['psi']:.3f}, KS {row['ks']:.3f})"))
+            if row["clip_rate"] > 2 * row["reference_clip_rate"] + CLIP_RATE_MARGIN:
+                alerts.append(("warning", f"{row['feature']}: {row['clip_rate']:.1%} of values fall outside the winsorization "
+                                          f"bounds (training: {row['reference_clip_rate']:.1%}) and are clipped"))
+        scores = report["scores"]
+        if scores is not None and report["scored"] >= MIN_ROWS and scores["psi"] >= PSI_WARNING:
+            level = "error" if scores["psi"] >= PSI_ALERT else "warning"
+            alerts.append((level, f"Fraud probabilities of {report['model']} have shifted (PSI {scores['psi']:.3f}, KS {scores['ks']:.3f})"))
+        return alerts
+
+
+def new_monitor(model_name, profile_path=DRIFT_PROFILE_PATH):
+    """Empty counters for one scoring run of ``model_name``, or ``None`` without a reference profile."""
+    profile = load_profile(profile_path)
+    return DriftMonitor(profile, model_name) if profile is not None else None
+
+
+def _state_path(model_name, state_dir):
+    return os.path.join(state_dir, f"{model_name}.json")
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """Exclusive lock on ``path`` across processes (the Streamlit server, ``fraud_score``, job workers).
+
+    The lock is held on ``<path>.lock`` and released by the operating system if its holder dies.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(f"{path}.lock", "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+
+            # LK_LOCK gives up after about ten seconds of retrying, so keep asking until it is granted
+            while True:
+                try:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _read_state(profile, model_name, path):
+    monitor = DriftMonitor(profile, model_name)
+    if os.path.exists(path):
+        with open(path) as f:
+            state = json.load(f)
+        # Counts recorded against an older profile are not comparable with this one
+        if state.get("profile") == profile["fingerprint"]:
+            monitor = DriftMonitor.from_state(profile, state)
+    return monitor
+
+
+def monitor_for(model_name, profile_path=DRIFT_PROFILE_PATH, state_dir=DRIFT_STATE_DIR):
+    """Everything recorded for ``model_name`` since the reference profile was built (``None`` without a profile).
+
+    The state is reread when another process (e.g. ``fraud_score``) has recorded to it.
+    """
+    profile = load_profile(profile_path)
+    if profile is None:
+        return None
+    path = _state_path(model_name, state_dir)
+    fingerprint = file_fingerprint(path) if os.path.exists(path) else None
+    with _lock:
+        cached = _states.get(path)
+        if cached is None or cached[0] != fingerprint or cached[1].profile is not profile:
+            _states[path] = cached = (fingerprint, _read_state(profile, model_name, path))
+        return cached[1]
+
+
+def record(monitor, profile_path=DRIFT_PROFILE_PATH, state_dir=DRIFT_STATE_DIR):
+    """Add the counts of a finished scoring run to its model's persisted state.
+
+    The state is reread and rewritten under the file lock, so runs finishing at the same time in
+    different processes all keep their counts.
+    """
+    if monitor is None or not monitor.rows:
+        return
+    profile = load_profile(profile_path)
+    if profile is None:
+        return
+    path = _state_path(monitor.model_name, state_dir)
+    with _lock, file_lock(path):
+        total = _read_state(profile, monitor.model_name, path)
+        total.merge(monitor)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(total.state(), f)
+        os.replace(tmp_path, path)
+        _states[path] = (file_fingerprint(path), total)
+
+
+def reset(model_name, state_dir=DRIFT_STATE_DIR):
+    path = _state_path(model_name, state_dir)
+    with _lock, file_lock(path):
+        if os.path.exists(path):
+            os.remove(path)
+        _states.pop(path, None)
+
+
+def monitored_models(state_dir=DRIFT_STATE_DIR):
+    """Names of the models with recorded drift state."""
+    if not os.path.isdir(state_dir):
+        return []
+    return sorted(os.path.splitext(f)[0] for f in os.listdir(state_dir) if f.endswith(".json"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the drift reference profile or report drift of scored data.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="build models/drift_profile.json from the raw data and the current models")
+    build.add_argument("--data", default=os.path.join("data", "raw", "creditcard_2023.csv"), help="raw transactions CSV (default: %(default)s)")
+    for name in ("report", "reset"):
+        command = commands.add_parser(name, help=f"{name} the recorded drift of a model")
+        command.add_argument("--model", help="model name (default: every monitored model)")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        from utils.evaluation import load_test_split
+        from utils.model_registry import registry
+        from utils.training import load_raw
+
+        X, _ = load_test_split()
+        scores = {name: registry.classifier(name).predict_proba(X)[:, 1] for name in registry.classifiers() if "-" not in name}
+        save_profile(build_profile(load_raw(args.data), registry.get("winsorization_bounds"), scores))
+        print(f"Wrote {DRIFT_PROFILE_PATH} with score references for {', '.join(scores)}")
+        return
+
+    for name in [args.model] if args.model else monitored_models():
+        if args.command == "reset":
+            reset(name)
+            print(f"Cleared drift counters of {name}")
+            continue
+        monitor = monitor_for(name)
+        if monitor is None:
+            parser.error(f"no reference profile at {DRIFT_PROFILE_PATH}; run `python -m utils.drift build` first")
+        report = monitor.report()
+        print(f"{name}: {report['rows']:,} rows")
+        for row in sorted(report["features"], key=lambda row: -row["psi"])[:10]:
+            print(f"  {row['feature']:<7} PSI {row['psi']:.4f}  KS {row['ks']:.4f}  clipped {row['clip_rate']:.2%} "
+                  f"(training {row['reference_clip_rate']:.2%})")
+        if report["scores"]:
+            print(f"  scores  PSI {report['scores']['psi']:.4f}  KS {report['scores']['ks']:.4f}")
+        for level, message in monitor.alerts(report):
+            print(f"  [{level}] {message}")
+
+
+if __name__ == "__main__":
+    main()
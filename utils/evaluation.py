@@ -0,0 +1,177 @@
+"""Held-out evaluation of every model in ``models/``, computed once per model and test-set version.
+
+Each model scores the processed test split with one batched ``predict_proba``. The scores are then
+sorted once, and cumulative sums of positives and negatives over that order give every threshold's
+confusion counts at the same time. The ROC and precision-recall curves, their areas and the
+confusion matrix at the operating threshold are all read off those sums.
+
+Results are keyed on the fingerprints of the model file and both test files, and persisted under
+``data/cache/evaluation``. A new or retrained model therefore costs one evaluation, and unchanged
+models are served from memory (or from disk after a restart).
+
+Usage:
+    python -m utils.evaluation [--models XGBClassifier LightGBMClassifier] [--threshold 0.5]
+"""
+import os
+import time
+import hashlib
+import argparse
+import threading
+
+import joblib
+import numpy as np
+
+from utils.compression import X_TEST_PATH, Y_TEST_PATH
+from utils.data_loader import CACHE_DIR, FEATURES, file_fingerprint, load_dataset
+from utils.model_registry import artifact_fingerprint
+
+EVALUATION_DIR = os.path.join(CACHE_DIR, "evaluation")
+CURVE_POINTS = 500
+DEFAULT_THRESHOLD = 0.5
+RESULT_VERSION = 2  # bump when the stored result layout changes
+
+_lock = threading.Lock()
+_results = {}
+
+
+def threshold_counts(y_true, scores):
+    """Distinct thresholds (descending) with the true and false positives of ``score >= threshold``.
+
+    One sort plus two cumulative sums give the counts at every threshold at once.
+    """
+    y_true = np.asarray(y_true).astype(bool)
+    scores = np.asarray(scores, dtype=np.float64)
+    order = np.argsort(-scores, kind="stable")
+    scores, y_true = scores[order], y_true[order]
+
+    # Last position of every run of equal scores: the rows flagged when the threshold is that score
+    last = np.r_[np.flatnonzero(np.diff(scores)), len(scores) - 1]
+    true_positives = np.cumsum(y_true)[last]
+    false_positives = (last + 1) - true_positives
+    return scores[last], true_positives, false_positives
+
+
+def confusion_at(thresholds, true_positives, false_positives, positives, negatives, threshold):
+    """``[[tn, fp], [fn, tp]]`` for ``score >= threshold``, looked up from :func:`threshold_counts`."""
+    flagged = np.searchsorted(-thresholds, -threshold, side="right")
+    tp = int(true_positives[flagged - 1]) if flagged else 0
+    fp = int(false_positives[flagged - 1]) if flagged else 0
+    return np.array([[negatives - fp, fp], [positives - tp, tp]])
+
+
+def _thin(*curves, points=CURVE_POINTS):
+    """Keep about ``points`` evenly spaced samples of each curve (always the first and last)."""
+    n = len(curves[0])
+    if n <= points:
+        return curves
+    keep = np.unique(np.r_[np.linspace(0, n - 1, points).astype(np.int64), n - 1])
+    return tuple(curve[keep] for curve in curves)
+
+
+def summarize(y_true, scores, threshold=DEFAULT_THRESHOLD):
+    """Metrics at ``threshold``, the confusion matrix, ROC AUC, average precision and both curves.
+
+    ``counts`` keeps the full :func:`threshold_counts` output so other thresholds can be analysed
+    later (see :mod:`utils.operating_point`) without scoring the test set again.
+    """
+    y_true = np.asarray(y_true).astype(bool)
+    positives = int(np.count_nonzero(y_true))
+    negatives = len(y_true) - positives
+    thresholds, tp, fp = threshold_counts(y_true, scores)
+
+    # Curves start at the "flag nothing" point, as in sklearn
+    tpr = np.r_[0.0, tp / max(positives, 1)]
+    fpr = np.r_[0.0, fp / max(negatives, 1)]
+    precision = np.r_[1.0, tp / (tp + fp)]
+    recall = tpr
+    roc_auc = float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+    average_precision = float(np.sum(np.diff(recall) * precision[1:]))
+
+    confusion = confusion_at(thresholds, tp, fp, positives, negatives, threshold)
+    (tn, fp_at), (fn, tp_at) = confusion
+    flagged = tp_at + fp_at
+    precision_at = tp_at / flagged if flagged else 0.0
+    recall_at = tp_at / positives if positives else 0.0
+
+    fpr, tpr = _thin(fpr, tpr)
+    recall, precision = _thin(recall, precision)
+    return {
+        "threshold": threshold,
+        "rows": len(y_true),
+        "accuracy": (tp_at + tn) / len(y_true),
+        "precision": precision_at,
+        "recall": recall_at,
+        "f1": 2 * precision_at * recall_at / (precision_at + recall_at) if precision_at + recall_at else 0.0,
+        "roc_auc": roc_auc,
+        "average_precision": average_precision,
+        "confusion": confusion,
+        "roc": {"fpr": fpr, "tpr": tpr},
+        "pr": {"recall": recall, "precision": precision},
+        "counts": {"thresholds": thresholds, "true_positives": tp, "false_positives": fp,
+                   "positives": positives, "negatives": negatives},
+    }
+
+
+def result_path(model_path, x_path=X_TEST_PATH, y_path=Y_TEST_PATH, threshold=DEFAULT_THRESHOLD):
+    """Where the evaluation of ``model_path`` on the current test files is (or will be) stored."""
+    key = ":".join([str(RESULT_VERSION), artifact_fingerprint(model_path), file_fingerprint(x_path), file_fingerprint(y_path), repr(threshold)])
+    name = os.path.splitext(os.path.basename(model_path))[0]
+    return os.path.join(EVALUATION_DIR, f"{name}.{hashlib.sha1(key.encode()).hexdigest()[:16]}.pkl")
+
+
+def load_test_split(x_path=X_TEST_PATH, y_path=Y_TEST_PATH):
+    X = load_dataset(x_path)[FEATURES].to_numpy(dtype=np.float32)
+    y = load_dataset(y_path).iloc[:, 0].to_numpy()
+    return X, y
+
+
+def evaluate_models(registry, names=None, x_path=X_TEST_PATH, y_path=Y_TEST_PATH, threshold=DEFAULT_THRESHOLD):
+    """Evaluation of each model in ``names`` (default: every classifier), computing only the missing ones.
+
+    The test split is loaded only if at least one result is not cached yet.
+    """
+    names = registry.classifiers() if names is None else names
+    results = {}
+    split = None
+    with _lock:
+        for name in names:
+            key = result_path(registry.path(name), x_path, y_path, threshold)
+            if key not in _results:
+                if os.path.exists(key):
+                    _results[key] = joblib.load(key)
+                else:
+                    if split is None:
+                        split = load_test_split(x_path, y_path)
+                    X, y = split
+                    model = registry.classifier(name)
+                    start = time.perf_counter()
+                    scores = model.predict_proba(X)[:, 1]
+                    elapsed = time.perf_counter() - start
+                    result = summarize(y, scores, threshold)
+                    result.update(model=name, predict_seconds=elapsed, rows_per_second=len(X) / elapsed)
+                    os.makedirs(EVALUATION_DIR, exist_ok=True)
+                    joblib.dump(result, key)
+                    _results[key] = result
+            results[name] = _results[key]
+    return results
+
+
+def main(argv=None):
+    from utils.model_registry import registry
+
+    parser = argparse.ArgumentParser(description="Evaluate the trained models on the held-out test split.")
+    parser.add_argument("--models", nargs="+", help="models to evaluate (default: every classifier in models/)")
+    parser.add_argument("--x-test", default=X_TEST_PATH, help="processed test features (default: %(default)s)")
+    parser.add_argument("--y-test", default=Y_TEST_PATH, help="test labels (default: %(default)s)")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="probability cut-off for the fraud label")
+    args = parser.parse_args(argv)
+
+    results = evaluate_models(registry, args.models, args.x_test, args.y_test, args.threshold)
+    print(f"{'model':<34} {'accuracy':>9} {'precision':>10} {'recall':>8} {'f1':>8} {'roc_auc':>8} {'avg_prec':>9}")
+    for name, result in results.items():
+        print(f"{name:<34} {result['accuracy']:9.4f} {result['precision']:10.4f} {result['recall']:8.4f} "
+              f"{result['f1']:8.4f} {result['roc_auc']:8.4f} {result['average_precision']:9.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+"""Schema-checked, typed CSV ingestion for uploaded and batch-scored transaction files.
+
+Files are checked against :data:`SCHEMA` before any parsing. Every feature (V1-V28, Amount) is
+required and parsed as float64, so columns passed through to the output keep the file's values
+(models score a float32 copy). ``id`` and ``Class`` are optional. Columns are selected and ordered
+by name, and other columns are ignored. A header missing a required column fails at once, naming
+the columns. A file with exactly 29 columns but other names (or no header at all) is read
+positionally, as before.
+
+The input is read in line-aligned byte blocks. Each block goes through the multithreaded pyarrow
+CSV reader with explicit column types. Blocks that parse cleanly (nearly all of them) come out as
+typed columns without any per-value Python work. A block with a malformed row (wrong field count,
+unparseable or missing value) is parsed again as text, and its bad rows are set aside with their
+line numbers and a reason. With ``on_error="quarantine"`` they go to :attr:`IngestReport.quarantine`
+and an optional CSV. With ``on_error="reject"`` the first one raises :class:`IngestionError`.
+Either way, a file with more than ``max_bad_fraction`` bad rows is rejected early instead of being
+scored, once at least :data:`MIN_ROWS_FOR_FRACTION` rows have been read (a fraction of a handful of
+rows says nothing about the file, so small files only quarantine their bad rows).
+
+Line numbers count physical lines, so they assume no quoted field spans lines, which is true of
+numeric transaction files.
+
+Usage:
+    python -m utils.ingestion upload.csv [--quarantine bad_rows.csv] [--reject]
+"""
+import io
+import os
+import csv
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pv
+
+from utils.data_loader import FEATURES
+from utils.profiling import span
+
+SCHEMA = {name: pa.float64() for name in FEATURES}
+OPTIONAL_COLUMNS = {"id": pa.int64(), "Class": pa.int8()}
+COLUMN_ORDER = ["id", *FEATURES, "Class"]
+DEFAULT_BLOCK_BYTES = 32 * 1024 * 1024
+FIRST_BLOCK_BYTES = 1024 * 1024
+MAX_BAD_FRACTION = 0.05
+MIN_ROWS_FOR_FRACTION = 1000  # rows seen before the bad-row fraction is trusted enough to abort on
+QUARANTINE_KEEP = 1000  # bad rows kept in memory; the quarantine file gets all of them
+
+
+class IngestionError(ValueError):
+    """The file does not match the schema or has too many malformed rows."""
+
+
+class IngestReport:
+    """Ingestion policy and running counters, updated as blocks are parsed.
+
+    ``quarantine`` holds the first :data:`QUARANTINE_KEEP` bad rows as ``(line, reason, text)``.
+    When ``quarantine_path`` is set, every bad row is also appended there as CSV.
+    """
+
+    def __init__(self, on_error="quarantine", max_bad_fraction=MAX_BAD_FRACTION, quarantine_path=None):
+        if on_error not in ("quarantine", "reject"):
+            raise ValueError(f"on_error must be 'quarantine' or 'reject', not {on_error!r}")
+        self.on_error = on_error
+        self.max_bad_fraction = max_bad_fraction
+        self.quarantine_path = quarantine_path
+        self.columns = []
+        self.extra_columns = []
+        self.positional = False
+        self.headerless = False
+        self.rows = 0
+        self.bad_rows = 0
+        self.lines = 0
+        self.bytes = 0
+        self.blocks = 0
+        self.salvaged_blocks = 0
+        self.seconds = 0.0
+        self.quarantine = []
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    @property
+    def mb_per_second(self):
+        return self.bytes / 1e6 / self.seconds if self.seconds else 0.0
+
+    def _set_aside(self, bad):
+        """Record ``(line, reason, text)`` rows, writing them to the quarantine file if there is one."""
+        if not bad:
+            return
+        self.bad_rows += len(bad)
+        room = QUARANTINE_KEEP - len(self.quarantine)
+        if room > 0:
+            self.quarantine.extend(bad[:room])
+        if self.quarantine_path:
+            new_file = not os.path.exists(self.quarantine_path) or os.path.getsize(self.quarantine_path) == 0
+            with open(self.quarantine_path, "a", newline="") as f:
+                writer = csv.writer(f)
+                if new_file:
+                    writer.writerow(["line", "reason", "text"])
+                writer.writerows(bad)
+        if self.on_error == "reject":
+            raise IngestionError(f"Malformed row at {_describe(bad[0])}")
+
+    def _check_fraction(self):
+        seen = self.rows + self.bad_rows
+        if self.max_bad_fraction is None or not self.bad_rows or seen < MIN_ROWS_FOR_FRACTION:
+            return
+        if self.bad_rows > self.max_bad_fraction * seen:
+            examples = "; ".join(_describe(row) for row in self.quarantine[:3])
+            raise IngestionError(
+                f"{self.bad_rows:,} of the first {seen:,} rows are malformed (over {self.max_bad_fraction:.0%}); "
+                f"is this the right file? {examples}"
+            )
+
+
+def _describe(row):
+    line, reason, _ = row
+    return f"line {line}: {reason}" if line is not None else reason
+
+
+def _split_header(line):
+    text = line.decode("utf-8-sig").rstrip("\r\n")
+    return [name.strip() for name in next(csv.reader([text]))] if text else []
+
+
+def _is_numeric(fields):
+    try:
+        [float(field) for field in fields]
+    except ValueError:
+        return False
+    return bool(fields)
+
+
+def resolve_columns(names):
+    """The columns to parse and their types for a header, or :class:`IngestionError` if it cannot be scored.
+
+    Returns ``(column_names, selected, positional)``: the names given to every field, the subset to
+    keep in :data:`COLUMN_ORDER`, and whether the features were matched by position.
+    """
+    if all(name in names for name in FEATURES):
+        selected = [name for name in COLUMN_ORDER if name in names]
+        return names, selected, False
+    if len(names) == len(FEATURES):
+        return list(FEATURES), list(FEATURES), True
+    missing = [name for name in FEATURES if name not in names]
+    raise IngestionError(
+        f"The uploaded file must have the {len(FEATURES)} feature columns (V1-V28, Amount). "
+        f"Missing: {', '.join(missing)}; found {len(names)} column(s)."
+    )
+
+
+class _InvalidRows:
+    """``invalid_row_handler`` that skips rows with the wrong number of fields and remembers them."""
+
+    def __init__(self):
+        self.rows = []
+
+    def __call__(self, row):
+        self.rows.append((row.text, f"expected {row.expected_columns} fields, found {row.actual_columns}"))
+        return "skip"
+
+
+def _to_frame(table):
+    return pd.DataFrame({name: table.column(name).to_numpy() for name in table.column_names}, copy=False)
+
+
+class _BlockParser:
+    def __init__(self, column_names, selected):
+        self.column_names = column_names
+        self.selected = selected
+        self.types = {name: {**SCHEMA, **OPTIONAL_COLUMNS}[name] for name in selected}
+
+    def _read(self, data, types, use_threads=True):
+        invalid = _InvalidRows()
+        table = pv.read_csv(
+            io.BytesIO(data),
+            read_options=pv.ReadOptions(column_names=self.column_names, use_threads=use_threads),
+            parse_options=pv.ParseOptions(invalid_row_handler=invalid),
+            convert_options=pv.ConvertOptions(column_types=types, include_columns=self.selected, strings_can_be_null=True),
+        )
+        return table, invalid.rows
+
+    def parse(self, data, first_line):
+        """``(frame, bad rows)`` for a block of whole lines whose first line is ``first_line``."""
+        try:
+            table, invalid = self._read(data, self.types)
+            if not invalid and not any(table.column(name).null_count for name in self.selected):
+                return _to_frame(table), []
+        except pa.ArrowInvalid:
+            pass
+        return self.salvage(data, first_line)
+
+    def salvage(self, data, first_line):
+        """Parse a block with a malformed row as text and split it into good rows and bad ones."""
+        table, invalid = self._read(data, {name: pa.string() for name in self.selected}, use_threads=False)
+
+        # The reader drops empty lines and hands rows with the wrong field count to the handler, in
+        # order; walking the lines in step with both recovers every row's line number
+        lines = data.split(b"\n")
+        row_lines, bad = [], []
+        pending = iter(invalid)
+        next_invalid = next(pending, None)
+        for offset, raw in enumerate(lines):
+            text = raw.rstrip(b"\r").decode("utf-8", "replace")
+            if not text:
+                continue
+            if next_invalid is not None and text == next_invalid[0]:
+                bad.append((first_line + offset, next_invalid[1], text))
+                next_invalid = next(pending, None)
+            else:
+                row_lines.append(first_line + offset)
+        if len(row_lines) != table.num_rows:
+            row_lines = [None] * table.num_rows
+            bad = [(None, reason, text) for text, reason in invalid]
+
+        good = np.ones(table.num_rows, dtype=bool)
+        reasons = [None] * table.num_rows
+        columns = {}
+        for name in self.selected:
+            raw = table.column(name).to_pandas()
+            values = pd.to_numeric(raw, errors="coerce")
+            dtype = np.dtype(self.types[name].to_pandas_dtype())
+            problem = values.isna().to_numpy()
+            if dtype.kind == "i":
+                info = np.iinfo(dtype)
+                problem = problem | ~((values % 1 == 0) & values.between(info.min, info.max)).to_numpy()
+            for i in np.flatnonzero(problem & good):
+                reasons[i] = f"{name}: missing value" if pd.isna(raw.iloc[i]) else f"{name}: invalid value {raw.iloc[i]!r}"
+            good &= ~problem
+            columns[name] = values
+        for i in np.flatnonzero(~good):
+            line = row_lines[i]
+            text = lines[line - first_line].rstrip(b"\r").decode("utf-8", "replace") if line is not None else ""
+            bad.append((line, reasons[i], text))
+        bad.sort(key=lambda row: (row[0] is None, row[0] or 0))
+
+        frame = pd.DataFrame({
+            name: values.to_numpy()[good].astype(self.types[name].to_pandas_dtype()) for name, values in columns.items()
+        })
+        return frame, bad
+
+
+def _iter_blocks(f, block_bytes, limit=None):
+    """Successive byte blocks of ``f`` that end on a line boundary, stopping after ``limit`` bytes.
+
+    The first block is small so that a malformed file is rejected before much of it is read.
+    """
+    remaining = limit
+    size = min(block_bytes, FIRST_BLOCK_BYTES)
+    while remaining is None or remaining > 0:
+        data = f.read(size if remaining is None else min(size, remaining))
+        size = block_bytes
+        if not data:
+            return
+        if not data.endswith(b"\n") and (remaining is None or len(data) < remaining):
+            data += f.readline() if remaining is None else f.readline(remaining - len(data))
+        if remaining is not None:
+            remaining -= len(data)
+        yield data
+
+
+def read_chunks(source, report=None, chunk_rows=None, block_bytes=DEFAULT_BLOCK_BYTES, header=None, start=None,
+                end=None, first_line=None):
+    """Typed DataFrame chunks of a transaction CSV (a path or binary file object), checked against :data:`SCHEMA`.
+
+    ``chunk_rows`` sizes blocks by rows instead of bytes, using the length of the first data line.
+    A byte range of the file can be read by passing the ``header`` line and ``start``/``end`` offsets
+    (see :func:`utils.batch_scoring.plan_shards`). Line numbers then count from ``first_line``, which
+    defaults to the line after the header for whole files and to 1 for ranges.
+    """
+    report = report if report is not None else IngestReport()
+    f = open(source, "rb") if isinstance(source, (str, os.PathLike)) else source
+    try:
+        if header is None:
+            header = f.readline()
+            start = start if start is not None else len(header)
+        if start is not None:
+            f.seek(start)
+        if end is not None and f.tell() >= end:
+            return
+        names = _split_header(header)
+        if not names:
+            return
+        column_names, selected, positional = resolve_columns(names)
+        headerless = positional and _is_numeric(names)
+        report.columns = selected
+        report.extra_columns = [name for name in names if name not in selected] if not positional else []
+        report.positional = positional
+        report.headerless = headerless
+        if first_line is None:
+            first_line = 2 if start == len(header) else 1
+        if headerless and start == len(header):
+            # The "header" is the first data row
+            first_line -= 1
+        parser = _BlockParser(column_names, selected)
+
+        if chunk_rows:
+            first = f.readline()
+            block_bytes = max(chunk_rows * max(len(first), 1), 64 * 1024)
+            prefix = (header if headerless and start == len(header) else b"") + first
+        else:
+            prefix = header if headerless and start == len(header) else b""
+        limit = None if end is None else end - f.tell()
+
+        line = first_line
+        for data in _iter_blocks(f, block_bytes, limit):
+            if prefix:
+                data, prefix = prefix + data, b""
+            begin = time.perf_counter()
+            with span("ingest.parse"):
+                frame, bad = parser.parse(data, line)
+            report.seconds += time.perf_counter() - begin
+            report.bytes += len(data)
+            report.blocks += 1
+            report.salvaged_blocks += bool(bad)
+            lines = data.count(b"\n") + (not data.endswith(b"\n"))
+            report.lines += lines
+            line += lines
+            report.rows += len(frame)
+            report._set_aside(bad)
+            report._check_fraction()
+            if len(frame):
+                yield frame
+        if prefix:
+            # A file whose only data line was consumed while sizing the blocks
+            frame, bad = parser.parse(prefix, line)
+            report.bytes += len(prefix)
+            report.lines += prefix.count(b"\n") + (not prefix.endswith(b"\n"))
+            report.rows += len(frame)
+            report._set_aside(bad)
+            if len(frame):
+                yield frame
+        report._check_fraction()
+    finally:
+        if f is not source:
+            f.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check a transaction CSV against the scoring schema and report parse throughput.")
+    parser.add_argument("input", help="CSV with the 29 features (V1-V28, Amount) and optional id/Class")
+    parser.add_argument("--quarantine", help="write malformed rows, with line numbers, to this CSV")
+    parser.add_argument("--reject", action="store_true", help="fail on the first malformed row instead of setting it aside")
+    parser.add_argument("--max-bad-fraction", type=float, default=MAX_BAD_FRACTION, help="reject the file above this share of malformed rows (default: %(default)s)")
+    parser.add_argument("--block-mb", type=int, default=DEFAULT_BLOCK_BYTES // (1024 * 1024), help="bytes parsed per block (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    report = IngestReport("reject" if args.reject else "quarantine", args.max_bad_fraction, args.quarantine)
+    try:
+        for _ in read_chunks(args.input, report, block_bytes=args.block_mb * 1024 * 1024):
+            pass
+    except IngestionError as e:
+        parser.exit(1, f"error: {e}\n")
+    print(f"{report.rows:,} rows in {report.seconds:.2f}s ({report.rows_per_second:,.0f} rows/s, {report.mb_per_second:,.0f} MB/s)")
+    print(f"columns: {', '.join(report.columns)}{' (by position)' if report.positional else ''}")
+    if report.extra_columns:
+        print(f"ignored: {', '.join(report.extra_columns)}")
+    print(f"malformed rows: {report.bad_rows:,}")
+    for row in report.quarantine[:10]:
+        print(f"  {_describe(row)}")
+
+
+if __name__ == "__main__":
+    main()
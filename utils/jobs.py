@@ -0,0 +1,477 @@
+"""Background batch-scoring jobs: an on-disk job store served by a bounded set of worker processes.
+
+:meth:`JobQueue.submit` saves the input in the job's directory under ``data/cache/jobs`` and
+returns the job id at once. The job is scored in its own worker process (``python -m utils.jobs
+run``) with the same streamed pipeline as before (:func:`utils.batch_scoring.score_stream`). The worker writes its progress to the job's
+``job.json``, so any rerun, page or session can read it back with :meth:`JobQueue.get`.
+Everything a job produced (predictions, skipped rows, preview, counts) stays on disk until the
+job expires.
+
+Scheduling:
+
+- Queued jobs are grouped by owner (one browser session), and free workers take the next job
+  round-robin across owners. A user with ten queued uploads therefore does not hold up a user
+  with one.
+- A job with the same input bytes, model file and options as an existing queued, running or
+  finished job is not scored again; that job's id is returned instead, and the job is listed
+  under the new owner too.
+- Finished jobs expire after ``JOB_TTL_HOURS``; the queue prunes them when it starts and at most
+  every ``PRUNE_INTERVAL`` seconds while it runs.
+- Jobs left queued or running by a stopped server are queued again when the next queue starts
+  (unless their worker is still alive and finishing them). Each job records the queue that
+  dispatches it, and queues recover one at a time under a lock on the store, so a job is never
+  taken over from a queue that is still running, nor requeued by two queues at once.
+
+Workers are started as fresh interpreters rather than through ``multiprocessing``. Streamlit runs
+the app script as ``__main__``, so spawned ``multiprocessing`` children would re-run the whole
+page.
+
+Usage:
+    python -m utils.jobs [list | prune --hours 24]
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import argparse
+import threading
+import subprocess
+import collections
+
+import psutil
+
+from utils.data_loader import CACHE_DIR, file_fingerprint
+
+JOBS_DIR = os.path.join(CACHE_DIR, "jobs")
+JOB_TTL_HOURS = 24
+PRUNE_INTERVAL = 600  # seconds between prunes of expired jobs while the queue runs
+PROGRESS_INTERVAL = 0.5  # seconds between progress writes
+PREVIEW_ROWS = 20
+QUARANTINE_SHOWN = 100
+ACTIVE = ("queued", "running")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _process_identity():
+    """Pid and start time of this process; together they never describe another process."""
+    process = psutil.Process()
+    return {"pid": process.pid, "created": process.create_time()}
+
+
+def _alive(identity):
+    """Whether the process from :func:`_process_identity` still runs (a reused pid does not count)."""
+    if not identity:
+        return False
+    try:
+        process = psutil.Process(identity["pid"])
+        return process.create_time() == identity["created"] and process.status() != psutil.STATUS_ZOMBIE
+    except psutil.Error:
+        return False
+
+
+def _take(path):
+    """Move ``path`` to a name private to this call and return it, or None if another caller took it first."""
+    taken = f"{path}.{uuid.uuid4().hex}"
+    try:
+        os.rename(path, taken)
+    except OSError:
+        return None
+    return taken
+
+
+def run_job(job_dir):
+    """Score the job stored in ``job_dir`` (in a worker process), leaving its drift counts in ``drift.json``.
+
+    The parent folds the drift counts into the model's monitor, so concurrent jobs never race on it.
+    """
+    from utils.batch_scoring import iter_csv_chunks, score_stream
+    from utils.drift import new_monitor
+    from utils.ingestion import IngestReport
+    from utils.model_registry import registry
+    from utils.score_cache import cached_model
+
+    job_path = os.path.join(job_dir, "job.json")
+    job = _read_json(job_path)
+    options = job["options"]
+    job.update(status="running", started_at=time.time(), worker=_process_identity())
+    _write_json(job_path, job)
+
+    cancel_path = os.path.join(job_dir, "cancel")
+    input_bytes = max(job["input_bytes"], 1)
+    last_write = [0.0]
+
+    def report_progress(summary):
+        if os.path.exists(cancel_path):
+            raise JobCancelled()
+        now = time.perf_counter()
+        if now - last_write[0] >= PROGRESS_INTERVAL:
+            last_write[0] = now
+            job["progress"] = {"rows": summary.rows, "fraction": min(ingest.bytes / input_bytes, 1.0)}
+            _write_json(job_path, job)
+
+    drift = None
+    try:
+        model = registry.classifier(job["model"])
+        scorer = cached_model(registry, job["model"], model) if options["use_cache"] else model
+        ingest = IngestReport("quarantine" if options["skip_malformed"] else "reject",
+                              quarantine_path=os.path.join(job_dir, "quarantine.csv"))
+        drift = new_monitor(job["model"])
+        suffix = ".parquet" if options["output_format"] == "parquet" else ".csv"
+        summary = score_stream(
+            iter_csv_chunks(job["input"], report=ingest),
+            scorer,
+            output_path=os.path.join(job_dir, f"predictions{suffix}"),
+            output_format=options["output_format"],
+            preprocess=options["preprocess"],
+            progress=report_progress,
+            preview_rows=PREVIEW_ROWS,
+            threshold=options["threshold"],
+            drift=drift,
+        )
+        if summary.preview is not None:
+            summary.preview.to_parquet(os.path.join(job_dir, "preview.parquet"), index=False)
+        job["result"] = {
+            "output_path": summary.output_path,
+            "rows": summary.rows,
+            "fraud": summary.fraud_count,
+            "normal": summary.normal_count,
+            "seconds": summary.seconds,
+            "rows_per_second": summary.rows_per_second,
+            "cache": scorer.stats() if options["use_cache"] else None,
+            # Cascades (utils/cascade.py) only send uncertain rows to the heavy model
+            "forwarded_fraction": getattr(model, "forwarded_fraction", None),
+            "ingest": {
+                "rows_per_second": ingest.rows_per_second,
+                "mb_per_second": ingest.mb_per_second,
+                "positional": ingest.positional,
+                "extra_columns": ingest.extra_columns,
+                "bad_rows": ingest.bad_rows,
+                "quarantine_path": ingest.quarantine_path if ingest.bad_rows else None,
+                "quarantine": ingest.quarantine[:QUARANTINE_SHOWN],
+            },
+        }
+        job.update(status="done", progress={"rows": summary.rows, "fraction": 1.0})
+    except JobCancelled:
+        job["status"] = "cancelled"
+        drift = None
+    except Exception as e:  # the job records the failure; the worker stays usable
+        job.update(status="failed", error=str(e) or type(e).__name__)
+        drift = None
+    if drift is not None:
+        _write_json(os.path.join(job_dir, "drift.json"), drift.state())
+    job["finished_at"] = time.time()
+    _write_json(job_path, job)
+
+
+def job_key(input_digest, model_name, model_path, options):
+    """Identity of a job's work: the same key always produces the same predictions."""
+    from utils.model_registry import artifact_fingerprint
+    key = json.dumps([input_digest, model_name, artifact_fingerprint(model_path), options], sort_keys=True)
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+class JobStore:
+    """Job records and files, one directory per job under ``jobs_dir``."""
+
+    def __init__(self, jobs_dir=JOBS_DIR):
+        self.jobs_dir = jobs_dir
+        os.makedirs(jobs_dir, exist_ok=True)
+
+    def job_dir(self, job_id):
+        return os.path.join(self.jobs_dir, job_id)
+
+    def get(self, job_id):
+        """The job's record, or None if it does not exist (or has expired)."""
+        job = _read_json(os.path.join(self.job_dir(job_id), "job.json"))
+        if job is not None:
+            job["owners"] = _read_json(os.path.join(self.job_dir(job_id), "owners.json")) or [job["owner"]]
+        return job
+
+    def share(self, job_id, owner):
+        """List the job under ``owner`` as well as the owner who submitted it.
+
+        The owners live in their own file, which the worker never writes, so an owner added while the
+        job runs is not lost when the worker saves its progress.
+        """
+        owners = self.get(job_id)["owners"]
+        if owner not in owners:
+            _write_json(os.path.join(self.job_dir(job_id), "owners.json"), [*owners, owner])
+
+    def save(self, job):
+        _write_json(os.path.join(self.job_dir(job["id"]), "job.json"), job)
+
+    def jobs(self, owner=None):
+        """Every stored job (or only those listed under ``owner``), newest first."""
+        jobs = [job for job in map(self.get, os.listdir(self.jobs_dir)) if job is not None]
+        if owner is not None:
+            jobs = [job for job in jobs if owner in job["owners"]]
+        return sorted(jobs, key=lambda job: job["created_at"], reverse=True)
+
+    def prune(self, max_age_hours=JOB_TTL_HOURS):
+        """Delete finished jobs older than ``max_age_hours``, with their inputs and outputs."""
+        cutoff = time.time() - max_age_hours * 3600
+        removed = 0
+        for job in self.jobs():
+            if job["status"] not in ACTIVE and job.get("finished_at", job["created_at"]) < cutoff:
+                shutil.rmtree(self.job_dir(job["id"]), ignore_errors=True)
+                removed += 1
+        return removed
+
+
+class JobQueue:
+    """Worker processes in front of a :class:`JobStore`, with round-robin scheduling across owners."""
+
+    def __init__(self, jobs_dir=JOBS_DIR, workers=None):
+        self.store = JobStore(jobs_dir)
+        self.workers = workers or int(os.environ.get("FRAUD_JOB_WORKERS", 0)) or max((os.cpu_count() or 1) // 2, 1)
+        self._lock = threading.Lock()
+        self._pending = collections.OrderedDict()  # owner -> deque of job ids, in round-robin order
+        self._running = 0
+        self._owners_running = collections.Counter()
+        self._keys = {}  # job key -> job id, for queued, running and finished jobs
+        self._identity = _process_identity()  # recorded in the jobs this queue dispatches
+        self._pruned_at = 0.0
+        with self._lock:
+            self._prune()
+        self._recover()
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def jobs(self, owner=None):
+        return self.store.jobs(owner)
+
+    def _prune(self):
+        """Delete expired jobs, at most once every ``PRUNE_INTERVAL`` seconds (caller holds ``_lock``)."""
+        now = time.time()
+        if now - self._pruned_at < PRUNE_INTERVAL:
+            return
+        self._pruned_at = now
+        if self.store.prune():
+            self._keys = {key: job_id for key, job_id in self._keys.items() if os.path.isdir(self.store.job_dir(job_id))}
+
+    def _recover(self):
+        """Index stored jobs, queue again those a stopped server left unfinished and merge their drift counts.
+
+        Queues opening the same store recover one at a time, and a job is only taken over when neither
+        the queue that dispatched it nor its worker is still alive.
+        """
+        from utils.drift import file_lock
+
+        with file_lock(os.path.join(self.store.jobs_dir, "recover")):
+            for job in sorted(self.jobs(), key=lambda job: job["created_at"]):
+                if job["status"] == "done":
+                    # Finished by a worker that outlived its server, which never merged the drift counts
+                    self._merge_drift(job)
+                elif job["status"] in ACTIVE and not _alive(job.get("worker")) and not _alive(job.get("queue")):
+                    job.update(status="queued", queue=self._identity, progress={"rows": 0, "fraction": 0.0})
+                    self.store.save(job)
+                    self._pending.setdefault(job["owner"], collections.deque()).append(job["id"])
+                if job["status"] in (*ACTIVE, "done"):
+                    self._keys[job["key"]] = job["id"]
+        with self._lock:
+            self._dispatch()
+
+    def _merge_drift(self, job):
+        """Fold a finished job's drift counts into the model's monitor, shown on the Dashboard (at most once)."""
+        from utils.drift import DriftMonitor, new_monitor, record
+
+        drift_path = _take(os.path.join(self.store.job_dir(job["id"]), "drift.json"))
+        if drift_path is None:
+            return
+        state = _read_json(drift_path)
+        drift = new_monitor(job["model"])
+        if drift is not None and state is not None:
+            drift.merge(DriftMonitor.from_state(drift.profile, state))
+            record(drift)
+        os.remove(drift_path)
+
+    def submit(self, owner, source, model_name, model_path, options, input_name=None):
+        """Queue a scoring job and return its id without waiting for it.
+
+        ``source`` is a CSV path (scored in place) or a binary file object (copied into the job's
+        directory). A job with the same input, model file and ``options`` is reused when it is queued,
+        running or finished, and is then listed under ``owner`` too.
+        """
+        job_id = uuid.uuid4().hex[:12]
+        job_dir = self.store.job_dir(job_id)
+        os.makedirs(job_dir)
+
+        if isinstance(source, (str, os.PathLike)):
+            input_path = os.path.abspath(source)
+            input_digest = file_fingerprint(input_path)
+        else:
+            # Hash the upload while copying it, so identical re-uploads map to the same job
+            input_path = os.path.join(job_dir, "input.csv")
+            digest = hashlib.sha1()
+            source.seek(0)
+            with open(input_path, "wb") as f:
+                for block in iter(lambda: source.read(1024 * 1024), b""):
+                    digest.update(block)
+                    f.write(block)
+            input_digest = digest.hexdigest()
+        key = job_key(input_digest, model_name, model_path, options)
+
+        with self._lock:
+            self._prune()
+            existing = self._keys.get(key)
+            if existing is not None:
+                job = self.get(existing)
+                if job is not None and job["status"] in (*ACTIVE, "done"):
+                    shutil.rmtree(job_dir, ignore_errors=True)
+                    self.store.share(existing, owner)
+                    return existing
+            job = {
+                "id": job_id,
+                "key": key,
+                "owner": owner,
+                "queue": self._identity,
+                "status": "queued",
+                "created_at": time.time(),
+                "model": model_name,
+                "options": options,
+                "input": input_path,
+                "input_name": input_name or os.path.basename(input_path),
+                "input_bytes": os.path.getsize(input_path),
+                "progress": {"rows": 0, "fraction": 0.0},
+            }
+            _write_json(os.path.join(job_dir, "job.json"), job)
+            self._keys[key] = job_id
+            if owner not in self._pending:
+                self._pending[owner] = collections.deque()
+                if not self._owners_running[owner]:
+                    # An owner with nothing running goes ahead of owners that already have a job scoring
+                    self._pending.move_to_end(owner, last=False)
+            self._pending[owner].append(job_id)
+            self._dispatch()
+        return job_id
+
+    def cancel(self, job_id):
+        """Drop a queued job, or ask a running one to stop after its current chunk."""
+        with self._lock:
+            for owner, queue in self._pending.items():
+                if job_id in queue:
+                    queue.remove(job_id)
+                    if not queue:
+                        del self._pending[owner]
+                    job = self.get(job_id)
+                    job.update(status="cancelled", finished_at=time.time())
+                    self.store.save(job)
+                    return
+        open(os.path.join(self.store.job_dir(job_id), "cancel"), "w").close()
+
+    def position(self, job_id):
+        """How many queued jobs will start before ``job_id`` under round-robin scheduling (None if not queued)."""
+        with self._lock:
+            queues = [list(queue) for queue in self._pending.values()]
+        ahead = 0
+        for depth in range(max(map(len, queues), default=0)):
+            for queue in queues:
+                if depth < len(queue):
+                    if queue[depth] == job_id:
+                        return ahead
+                    ahead += 1
+        return None
+
+    def _dispatch(self):
+        """Start queued jobs on free workers, taking one per owner in turn (caller holds ``_lock``)."""
+        while self._running < self.workers and self._pending:
+            owner, queue = next(iter(self._pending.items()))
+            job_id = queue.popleft()
+            del self._pending[owner]
+            if queue:
+                self._pending[owner] = queue  # back of the line until every other owner had a turn
+            self._running += 1
+            self._owners_running[owner] += 1
+            job_dir = self.store.job_dir(job_id)
+            # Workers split the cores between them instead of each starting a thread per core
+            threads = str(max((os.cpu_count() or 1) // self.workers, 1))
+            env = dict(os.environ, OMP_NUM_THREADS=threads, OPENBLAS_NUM_THREADS=threads, MKL_NUM_THREADS=threads)
+            with open(os.path.join(job_dir, "worker.log"), "ab") as log:
+                process = subprocess.Popen([sys.executable, "-m", "utils.jobs", "run", job_dir], env=env,
+                                           stdout=log, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL)
+            threading.Thread(target=self._finished, args=(job_id, owner, process), daemon=True).start()
+
+    def _finished(self, job_id, owner, process):
+        """Wait for a job's worker, then record its outcome and start the next queued job."""
+        returncode = process.wait()
+        try:
+            job = self.get(job_id)
+            if job is not None and job["status"] in ACTIVE:
+                # The worker died before it could record the outcome
+                job.update(status="failed", error=f"worker exited with code {returncode}", finished_at=time.time())
+                self.store.save(job)
+            if job is not None:
+                self._merge_drift(job)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._owners_running[owner] -= 1
+                self._dispatch()
+                self._prune()
+
+
+_lock = threading.Lock()
+_queues = {}
+
+
+def get_job_queue(jobs_dir=JOBS_DIR):
+    """The process-wide queue for ``jobs_dir``, shared by every Streamlit session."""
+    with _lock:
+        if jobs_dir not in _queues:
+            _queues[jobs_dir] = JobQueue(jobs_dir)
+        return _queues[jobs_dir]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or clean up the background scoring job store.")
+    parser.add_argument("command", nargs="?", choices=["list", "prune", "run"], default="list")
+    parser.add_argument("job_dir", nargs="?", help="job to score (run; used by the job queue's workers)")
+    parser.add_argument("--jobs-dir", default=JOBS_DIR, help="job store (default: %(default)s)")
+    parser.add_argument("--hours", type=float, default=JOB_TTL_HOURS, help="prune jobs finished longer ago than this")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        if not args.job_dir:
+            parser.error("run needs a job directory")
+        run_job(args.job_dir)
+        return
+
+    if not os.path.isdir(args.jobs_dir):
+        print("No jobs")
+        return
+    # Read the store directly: starting a JobQueue here would also resume queued jobs
+    store = JobStore(args.jobs_dir)
+    if args.command == "prune":
+        print(f"Removed {store.prune(args.hours)} job(s)")
+        return
+    print(f"{'id':<13} {'status':<10} {'model':<34} {'rows':>10} {'created':<19} input")
+    for job in store.jobs():
+        rows = (job.get("result") or job["progress"])["rows"]
+        created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(job["created_at"]))
+        print(f"{job['id']:<13} {job['status']:<10} {job['model']:<34} {rows:>10,} {created:<19} {job['input_name']}")
+
+
+if __name__ == "__main__":
+    main()
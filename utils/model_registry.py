@@ -0,0 +1,197 @@
+import os
+import glob
+import json
+import hashlib
+import time
+import threading
+
+import joblib
+import pandas as pd
+
+from utils.data_loader import CACHE_DIR, FEATURES, file_fingerprint
+from utils.profiling import rss_bytes, span
+from utils.tree_engine import ENGINE_SUFFIX, compile_model, load_engine
+
+MODELS_DIR = "models"
+SHARED_DIR = os.path.join(CACHE_DIR, "shared")
+CASCADE_SUFFIX = ".cascade"
+ARTIFACT_SUFFIXES = (".pkl", ENGINE_SUFFIX, CASCADE_SUFFIX)
+
+# Artifacts under models/ that are part of preprocessing rather than classifiers
+PREPROCESSING_ARTIFACTS = ("scaler", "winsorization_bounds")
+
+
+def artifact_fingerprint(path):
+    """:func:`file_fingerprint` of a model artifact; a cascade's also covers the models it names.
+
+    Caches keyed on this (evaluations, scores, jobs, loaded models) are invalidated when either
+    stage of a cascade is retrained, not only when its spec file changes.
+    """
+    fingerprint = file_fingerprint(path)
+    if not path.endswith(CASCADE_SUFFIX):
+        return fingerprint
+    with open(path) as f:
+        spec = json.load(f)
+    components = ModelRegistry(os.path.dirname(path) or ".").path
+    key = ":".join([fingerprint] + [artifact_fingerprint(components(spec[stage])) for stage in ("fast", "heavy")])
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+class ModelRegistry:
+    """Discovers the pickles under ``models/`` and deserializes each one at most once per process.
+
+    Compiled tree engines (``*.trees``, see ``utils.tree_engine``) are listed alongside the pickles
+    and memory-mapped instead of unpickled; cascades (``*.cascade``, see ``utils.cascade``) are
+    assembled from the models they name. With ``shared`` on, :meth:`classifier` serves pickled
+    tree ensembles the same way (see :meth:`attach`).
+
+    An artifact is reloaded only when its file changes on disk, so retrained models are picked up
+    without restarting the server.
+    """
+
+    def __init__(self, models_dir=MODELS_DIR, shared=False, shared_dir=SHARED_DIR):
+        self.models_dir = models_dir
+        self.shared = shared
+        self.shared_dir = shared_dir
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._artifacts = {}
+        self._stats = {}
+        self.warmed_up = False
+
+    def path(self, name):
+        for suffix in ARTIFACT_SUFFIXES:
+            path = os.path.join(self.models_dir, f"{name}{suffix}")
+            if os.path.exists(path):
+                return path
+        return os.path.join(self.models_dir, f"{name}.pkl")
+
+    def discover(self):
+        """Names of every artifact available on disk."""
+        paths = [p for suffix in ARTIFACT_SUFFIXES for p in glob.glob(os.path.join(self.models_dir, f"*{suffix}"))]
+        return sorted({os.path.splitext(os.path.basename(p))[0] for p in paths})
+
+    def classifiers(self):
+        """Names of the classifier artifacts, excluding preprocessing state."""
+        return [name for name in self.discover() if name not in PREPROCESSING_ARTIFACTS]
+
+    def variants(self):
+        """Classifier names grouped by model, e.g. ``XGBClassifier`` with ``XGBClassifier-compiled``."""
+        groups = {}
+        for name in self.classifiers():
+            groups.setdefault(name.split("-")[0], []).append(name)
+        return groups
+
+    def get(self, name):
+        """Return the artifact called ``name``, loading it on first use."""
+        path = self.path(name)
+        fingerprint = artifact_fingerprint(path)
+        with self._lock:
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+
+        # A per-artifact lock lets different models load concurrently while a single model is never
+        # deserialized twice by racing sessions
+        with load_lock:
+            cached = self._artifacts.get(name)
+            if cached is not None and cached[0] == fingerprint:
+                return cached[1]
+
+            rss_before = rss_bytes()
+            start = time.perf_counter()
+            with span(f"model_load.{name}"):
+                if path.endswith(ENGINE_SUFFIX):
+                    artifact = load_engine(path)
+                elif path.endswith(CASCADE_SUFFIX):
+                    from utils.cascade import load_cascade
+                    artifact = load_cascade(path, self)
+                else:
+                    artifact = joblib.load(path)
+            elapsed = time.perf_counter() - start
+
+            self._artifacts[name] = (fingerprint, artifact)
+            self._stats[name] = {
+                "name": name,
+                "load_seconds": elapsed,
+                "file_bytes": os.path.getsize(path),
+                "resident_bytes": max(rss_bytes() - rss_before, 0),
+            }
+            return artifact
+
+    def attach(self, name):
+        """Return ``name`` as a read-only tree engine memory-mapped from a file shared by every process.
+
+        A pickled ensemble is compiled once into ``shared_dir``, keyed on the pickle's fingerprint;
+        later callers in any session or worker process map that file instead of unpickling a private
+        copy, so the model's pages exist once in memory however many processes use it. Models that
+        cannot be compiled are returned as loaded by :meth:`get`.
+        """
+        path = self.path(name)
+        if not path.endswith(".pkl"):
+            return self.get(name)
+        key = f"{name} (shared)"
+        fingerprint = file_fingerprint(path)
+        with self._lock:
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        with load_lock:
+            cached = self._artifacts.get(key)
+            if cached is not None and cached[0] == fingerprint:
+                return cached[1]
+
+            shared_path = os.path.join(self.shared_dir, f"{name}.{fingerprint}{ENGINE_SUFFIX}")
+            if not os.path.exists(shared_path):
+                try:
+                    with span(f"model_compile.{name}"):
+                        engine = compile_model(joblib.load(path))
+                except ValueError:
+                    return self.get(name)
+                os.makedirs(self.shared_dir, exist_ok=True)
+                engine.save(shared_path)
+                for stale in glob.glob(os.path.join(self.shared_dir, f"{name}.*{ENGINE_SUFFIX}")):
+                    if stale != shared_path:
+                        try:
+                            os.remove(stale)
+                        except OSError:
+                            pass
+
+            rss_before = rss_bytes()
+            start = time.perf_counter()
+            with span(f"model_load.{key}"):
+                artifact = load_engine(shared_path)
+            elapsed = time.perf_counter() - start
+
+            self._artifacts[key] = (fingerprint, artifact)
+            self._stats[key] = {
+                "name": key,
+                "load_seconds": elapsed,
+                "file_bytes": os.path.getsize(shared_path),
+                "resident_bytes": max(rss_bytes() - rss_before, 0),
+            }
+            return artifact
+
+    def classifier(self, name):
+        """The model to score with: the shared engine when ``shared`` is on, otherwise :meth:`get`."""
+        return self.attach(name) if self.shared else self.get(name)
+
+    def is_loaded(self, name):
+        return name in self._artifacts
+
+    def stats(self):
+        """Load time, file size and resident-memory growth for every artifact loaded so far."""
+        return [self._stats[name] for name in sorted(self._stats)]
+
+    def warm_up(self, names=None):
+        """Load the preprocessing artifacts and classifiers and run one dummy prediction through each."""
+        for name in PREPROCESSING_ARTIFACTS:
+            if os.path.exists(self.path(name)):
+                self.get(name)
+
+        dummy = pd.DataFrame([[0.0] * len(FEATURES)], columns=FEATURES)
+        for name in names or self.classifiers():
+            self.classifier(name).predict_proba(dummy)
+        self.warmed_up = True
+
+
+# Shared by every session of the Streamlit server (and any script importing it). FRAUD_SHARED_MODELS=1
+# serves tree ensembles from memory-mapped engines shared across server processes
+registry = ModelRegistry(shared=os.environ.get("FRAUD_SHARED_MODELS") == "1")
@@ -0,0 +1,172 @@
+"""Cost-based choice of the probability threshold at which a transaction is flagged as fraud.
+
+The sweep reuses the test-set scores that :mod:`utils.evaluation` already sorted and counted. At every
+distinct score, it computes precision, recall and expected cost as
+``missed frauds * missed_fraud_cost + false alarms * false_alarm_cost``. This gives one vectorized
+pass over thousands of thresholds, with no extra model call.
+
+The chosen operating point of each model is stored in ``models/operating_point.json``. Batch scoring
+(the Prediction page and ``fraud_score``), manual scoring and the scoring server then flag rows with
+``probability >= threshold`` instead of the default 0.5.
+
+Usage:
+    python -m utils.operating_point --model LightGBMClassifier --missed-fraud-cost 100 --false-alarm-cost 1 [--save]
+"""
+import os
+import re
+import json
+import time
+import argparse
+
+import numpy as np
+
+from utils.compression import QUANTIZE_MODES
+from utils.model_registry import CASCADE_SUFFIX
+from utils.training import MODELS_DIR
+
+OPERATING_POINTS_PATH = os.path.join(MODELS_DIR, "operating_point.json")
+DEFAULT_THRESHOLD = 0.5
+DEFAULT_MISSED_FRAUD_COST = 100.0
+DEFAULT_FALSE_ALARM_COST = 1.0
+# Name parts of compiled and compressed copies (utils.tree_engine, utils.compression), which share
+# the operating point of the model they were made from
+COPY_SUFFIXES = ("compiled", "compact", *QUANTIZE_MODES)
+
+
+def sweep(counts, missed_fraud_cost=DEFAULT_MISSED_FRAUD_COST, false_alarm_cost=DEFAULT_FALSE_ALARM_COST):
+    """Metrics at every distinct test-set score, from the ``counts`` stored by :func:`utils.evaluation.summarize`.
+
+    Row ``i`` describes flagging ``score >= threshold[i]``; the first row flags nothing. Expected cost
+    is per transaction.
+    """
+    thresholds = np.asarray(counts["thresholds"], dtype=np.float64)
+    positives, negatives = counts["positives"], counts["negatives"]
+    tp = np.r_[0, counts["true_positives"]].astype(np.float64)
+    fp = np.r_[0, counts["false_positives"]].astype(np.float64)
+    thresholds = np.r_[np.nextafter(thresholds[0], np.inf) if len(thresholds) else 1.0, thresholds]
+
+    flagged = tp + fp
+    with np.errstate(invalid="ignore", divide="ignore"):
+        precision = np.where(flagged > 0, tp / flagged, 1.0)
+    missed = positives - tp
+    return {
+        "threshold": thresholds,
+        "precision": precision,
+        "recall": tp / max(positives, 1),
+        "false_positive_rate": fp / max(negatives, 1),
+        "flagged_share": flagged / max(positives + negatives, 1),
+        "expected_cost": (missed * missed_fraud_cost + fp * false_alarm_cost) / max(positives + negatives, 1),
+    }
+
+
+def point_at(table, threshold):
+    """The sweep row in effect at ``threshold`` (the lowest swept threshold that is still >= it)."""
+    index = max(np.searchsorted(-table["threshold"], -threshold, side="right") - 1, 0)
+    return {key: float(values[index]) for key, values in table.items()} | {"threshold": float(threshold)}
+
+
+def best_point(table):
+    """The sweep row with the lowest expected cost (the highest threshold among ties)."""
+    index = int(np.argmin(table["expected_cost"]))
+    return {key: float(values[index]) for key, values in table.items()}
+
+
+def load_operating_points(path=OPERATING_POINTS_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def cascade_threshold(model_name, models_dir=MODELS_DIR):
+    """Threshold a cascade's band was calibrated for, or None if ``model_name`` is not a cascade."""
+    path = os.path.join(models_dir, f"{model_name}{CASCADE_SUFFIX}")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return float(json.load(f).get("threshold", DEFAULT_THRESHOLD))
+
+
+def check_threshold(model_name, threshold, models_dir=MODELS_DIR):
+    """Raise ``ValueError`` if ``model_name`` is a cascade calibrated for a threshold other than ``threshold``.
+
+    Outside its calibration threshold a cascade's band no longer sends every row whose label could
+    change to the heavy model, so its labels would silently stop matching the heavy model's.
+    """
+    calibrated = cascade_threshold(model_name, models_dir)
+    if calibrated is not None and not np.isclose(threshold, calibrated):
+        raise ValueError(f"{model_name} is calibrated for threshold {calibrated:.4f}; run "
+                         f"'python -m utils.cascade --threshold {threshold:.4f}' to flag at another")
+
+
+def base_model(model_name):
+    """The model ``model_name`` is a compiled or compressed copy of, else ``model_name`` itself.
+
+    Separately trained variants (``-tuned``, ``-ooc``) and cascades are models of their own.
+    """
+    base, _, suffix = model_name.partition("-")
+    if suffix and all(part in COPY_SUFFIXES or re.fullmatch(r"[td]\d+", part) for part in suffix.split("-")):
+        return base
+    return model_name
+
+
+def threshold_for(model_name, path=OPERATING_POINTS_PATH, default=DEFAULT_THRESHOLD):
+    """Saved threshold of ``model_name``, else of the model it is a copy of (:func:`base_model`), else ``default``.
+
+    A cascade always gets the threshold its band was calibrated for. Separately trained models only
+    get a threshold once one has been saved for them.
+    """
+    calibrated = cascade_threshold(model_name, os.path.dirname(path) or ".")
+    if calibrated is not None:
+        return calibrated
+    points = load_operating_points(path)
+    point = points.get(model_name) or points.get(base_model(model_name))
+    return point["threshold"] if point else default
+
+
+def save_operating_point(model_name, point, missed_fraud_cost, false_alarm_cost, path=OPERATING_POINTS_PATH):
+    """Record ``point`` (a :func:`point_at` / :func:`best_point` row) as the operating point of ``model_name``."""
+    check_threshold(model_name, point["threshold"], os.path.dirname(path) or ".")
+    points = load_operating_points(path)
+    points[model_name] = {
+        **point,
+        "missed_fraud_cost": missed_fraud_cost,
+        "false_alarm_cost": false_alarm_cost,
+        "chosen_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(points, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+    return points[model_name]
+
+
+def main(argv=None):
+    from utils.evaluation import evaluate_models
+    from utils.model_registry import registry
+
+    parser = argparse.ArgumentParser(description="Find the probability threshold with the lowest expected cost.")
+    parser.add_argument("--model", default="LightGBMClassifier", help="model to analyse (default: %(default)s)")
+    parser.add_argument("--missed-fraud-cost", type=float, default=DEFAULT_MISSED_FRAUD_COST, help="cost of a fraud that is not flagged (default: %(default)s)")
+    parser.add_argument("--false-alarm-cost", type=float, default=DEFAULT_FALSE_ALARM_COST, help="cost of flagging a normal transaction (default: %(default)s)")
+    parser.add_argument("--save", action="store_true", help=f"store the optimum in {OPERATING_POINTS_PATH}")
+    args = parser.parse_args(argv)
+
+    if args.model not in registry.classifiers():
+        parser.error(f"unknown model {args.model!r}; available: {', '.join(registry.classifiers())}")
+
+    table = sweep(evaluate_models(registry, [args.model])[args.model]["counts"], args.missed_fraud_cost, args.false_alarm_cost)
+    current = point_at(table, threshold_for(args.model))
+    best = best_point(table)
+    print(f"{len(table['threshold']):,} thresholds swept")
+    for label, point in (("current", current), ("best", best)):
+        print(f"{label:<8} threshold {point['threshold']:.4f}  precision {point['precision']:.4f}  "
+              f"recall {point['recall']:.4f}  expected cost {point['expected_cost']:.4f}/transaction")
+    if args.save:
+        save_operating_point(args.model, best, args.missed_fraud_cost, args.false_alarm_cost)
+        print(f"Saved to {OPERATING_POINTS_PATH}")
+
+
+if __name__ == "__main__":
+    main()
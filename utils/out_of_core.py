@@ -0,0 +1,365 @@
+"""Out-of-core training: classifiers fitted chunk by chunk on transaction history of any size.
+
+The raw CSVs are read in typed chunks (:func:`utils.ingestion.read_chunks`). Each chunk goes through
+the published winsorization bounds and scaler, the same preprocessing the app applies before
+scoring. A chunk is never held together with more than a few others, so memory depends on
+``--chunk-rows`` and not on how much history there is. Three learners support this:
+
+- ``SGDClassifier``: a logistic-loss linear model updated with ``partial_fit`` on each shuffled
+  batch, for ``--epochs`` passes over the data.
+- ``LightGBMClassifier``: continued training. Every batch adds a few boosting rounds to the model
+  fitted so far (``init_model``), spread evenly over the batches of all passes and capped so that
+  together they add at most ``n_estimators`` rounds. With more batches than rounds, some batches
+  add none.
+- ``XGBClassifier``: external memory. The chunks feed an ``ExtMemQuantileDMatrix`` whose pages are
+  kept on disk under ``data/cache/out_of_core``, and ``n_estimators`` rounds are boosted over it.
+
+Rows are held out by a hash of their raw features, so the split is the same on every pass and
+every run, and duplicated transactions fall on the same side. Batches mix a few chunks in a
+seeded shuffle buffer. Unlike the notebooks, duplicate rows are not dropped.
+
+Progress is checkpointed under ``models/checkpoints`` every ``--checkpoint-every`` batches (or
+boosting rounds for XGBoost), keyed on the data, preprocessing and settings. An interrupted run
+resumes from its last checkpoint unless ``--fresh`` is given. The finished model is scored on the
+holdout rows in one more streamed pass, then written to ``models/<Model>-ooc.pkl`` and recorded in
+the training manifest.
+
+Usage:
+    python -m utils.out_of_core data/raw/creditcard_2023.csv [more.csv ...] --model SGDClassifier [--chunk-rows 50000] [--epochs 3] [--checkpoint-every 10] [--fresh]
+"""
+import os
+import glob
+import json
+import math
+import time
+import shutil
+import argparse
+
+import joblib
+import numpy as np
+
+from utils.data_loader import CACHE_DIR, file_fingerprint
+from utils.ingestion import IngestionError, IngestReport, read_chunks
+from utils.model_registry import registry
+from utils.profiling import ResourceMonitor
+from utils.score_cache import row_hashes
+from utils.training import MANIFEST_NAME, MODEL_PARAMS, MODELS_DIR, RANDOM_STATE, TEST_SIZE, _digest
+from utils.transform import WinsorScaler
+
+OOC_CACHE_DIR = os.path.join(CACHE_DIR, "out_of_core")
+CHECKPOINT_DIR = os.path.join(MODELS_DIR, "checkpoints")
+DEFAULT_CHUNK_ROWS = 50_000
+DEFAULT_EPOCHS = 3
+DEFAULT_CHECKPOINT_EVERY = 10
+SHUFFLE_CHUNKS = 4  # chunks mixed in each shuffled batch
+HASH_BUCKETS = 10_000
+HOLDOUT_BINS = 10_000  # probability histogram resolution for the holdout metrics
+SAMPLE_BYTES = 1024 * 1024
+OOC_PARAMS = {
+    "SGDClassifier": {"loss": "log_loss", "alpha": 1e-4, "random_state": RANDOM_STATE},
+    "LightGBMClassifier": MODEL_PARAMS["LightGBMClassifier"],
+    "XGBClassifier": {"n_estimators": 100, "max_bin": 256, "random_state": RANDOM_STATE},
+}
+
+
+def estimate_rows(paths):
+    """Data rows in ``paths``, estimated from the line length of each file's first MiB."""
+    total = 0
+    for path in paths:
+        with open(path, "rb") as f:
+            sample = f.read(SAMPLE_BYTES)
+        lines = sample.count(b"\n")
+        if lines > 1:
+            total += int(os.path.getsize(path) * lines / len(sample)) - 1
+    return max(total, 0)
+
+
+def iter_labelled_chunks(paths, transformer, chunk_rows, test_size=TEST_SIZE):
+    """``(X, y, holdout)`` for each chunk of ``paths``: preprocessed features, labels and the holdout mask."""
+    for path in paths:
+        report = IngestReport()
+        for chunk in read_chunks(path, report, chunk_rows=chunk_rows):
+            if "Class" not in chunk:
+                raise IngestionError(f"{path} has no Class column to train on")
+            block = np.array(chunk[transformer.features], dtype=np.float32, order="C")
+            h1, _ = row_hashes(block)
+            holdout = h1 % np.uint64(HASH_BUCKETS) < int(test_size * HASH_BUCKETS)
+            yield transformer.transform_array(block), chunk["Class"].to_numpy(dtype=np.int8), holdout
+
+
+def iter_batches(chunks, rows, rng):
+    """Training rows of ``chunks`` regrouped into shuffled batches of about ``rows`` rows."""
+    blocks, labels, buffered = [], [], 0
+    for X, y, holdout in chunks:
+        blocks.append(X[~holdout])
+        labels.append(y[~holdout])
+        buffered += len(labels[-1])
+        if buffered >= rows:
+            order = rng.permutation(buffered)
+            yield np.concatenate(blocks)[order], np.concatenate(labels)[order]
+            blocks, labels, buffered = [], [], 0
+    if buffered:
+        order = rng.permutation(buffered)
+        yield np.concatenate(blocks)[order], np.concatenate(labels)[order]
+
+
+class HoldoutMetrics:
+    """Holdout metrics accumulated in a fixed-size probability histogram, so memory stays bounded.
+
+    ROC AUC and average precision are computed from the histogram, which is exact up to
+    ``1 / bins`` in the threshold; accuracy, precision, recall and log loss are exact at 0.5.
+    """
+
+    def __init__(self, bins=HOLDOUT_BINS):
+        self.bins = bins
+        self.positives = np.zeros(bins, dtype=np.int64)
+        self.negatives = np.zeros(bins, dtype=np.int64)
+        self.log_loss_sum = 0.0
+        self.tp = self.fp = self.tn = self.fn = 0
+
+    def update(self, y, probabilities):
+        y = np.asarray(y).astype(bool)
+        p = np.clip(probabilities, 1e-15, 1 - 1e-15)
+        index = np.minimum((probabilities * self.bins).astype(np.int64), self.bins - 1)
+        self.positives += np.bincount(index[y], minlength=self.bins)
+        self.negatives += np.bincount(index[~y], minlength=self.bins)
+        self.log_loss_sum -= float(np.sum(np.where(y, np.log(p), np.log1p(-p))))
+        flagged = probabilities >= 0.5
+        self.tp += int(np.count_nonzero(flagged & y))
+        self.fp += int(np.count_nonzero(flagged & ~y))
+        self.fn += int(np.count_nonzero(~flagged & y))
+        self.tn += int(np.count_nonzero(~flagged & ~y))
+
+    def result(self):
+        rows = self.tp + self.fp + self.tn + self.fn
+        positives, negatives = self.tp + self.fn, self.fp + self.tn
+        # Flag everything at or above each bin, highest bin first
+        tp = np.cumsum(self.positives[::-1])
+        fp = np.cumsum(self.negatives[::-1])
+        tpr = np.r_[0.0, tp / max(positives, 1)]
+        fpr = np.r_[0.0, fp / max(negatives, 1)]
+        precision = np.r_[1.0, tp / np.maximum(tp + fp, 1)]
+        precision_at = self.tp / (self.tp + self.fp) if self.tp + self.fp else 0.0
+        recall_at = self.tp / positives if positives else 0.0
+        return {
+            "rows": rows,
+            "accuracy": (self.tp + self.tn) / rows if rows else 0.0,
+            "precision": precision_at,
+            "recall": recall_at,
+            "f1": 2 * precision_at * recall_at / (precision_at + recall_at) if precision_at + recall_at else 0.0,
+            "roc_auc": float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2)),
+            "average_precision": float(np.sum(np.diff(tpr) * precision[1:])),
+            "log_loss": self.log_loss_sum / rows if rows else 0.0,
+        }
+
+
+def _save_atomic(value, path):
+    joblib.dump(value, f"{path}.{os.getpid()}.tmp")
+    os.replace(f"{path}.{os.getpid()}.tmp", path)
+
+
+class OutOfCoreTrainer:
+    """Fit one model over ``paths`` in bounded memory, checkpointing under ``checkpoint_dir``."""
+
+    def __init__(self, name, paths, chunk_rows=DEFAULT_CHUNK_ROWS, epochs=DEFAULT_EPOCHS,
+                 checkpoint_every=DEFAULT_CHECKPOINT_EVERY, n_jobs=None, test_size=TEST_SIZE,
+                 checkpoint_dir=CHECKPOINT_DIR, cache_dir=OOC_CACHE_DIR, log=print):
+        if name not in OOC_PARAMS:
+            raise ValueError(f"Unknown model {name!r}; expected one of {', '.join(OOC_PARAMS)}")
+        self.name = name
+        self.paths = list(paths)
+        self.params = OOC_PARAMS[name]
+        self.chunk_rows = chunk_rows
+        self.epochs = epochs
+        self.checkpoint_every = max(checkpoint_every, 1)
+        self.n_jobs = n_jobs or os.cpu_count() or 1
+        self.test_size = test_size
+        self.cache_dir = cache_dir
+        self.log = log
+        self.transformer = WinsorScaler.from_artifacts(registry.get("winsorization_bounds"), registry.get("scaler"))
+        self.key = _digest("ooc", [
+            name, self.params, [file_fingerprint(path) for path in self.paths],
+            file_fingerprint(registry.path("winsorization_bounds")), file_fingerprint(registry.path("scaler")),
+            chunk_rows, epochs, test_size,
+        ])
+        self.checkpoint_path = os.path.join(checkpoint_dir, f"{name}-ooc.{self.key}")
+        self.report = {"model": name, "key": self.key, "files": self.paths, "chunk_rows": chunk_rows}
+
+    def _chunks(self):
+        return iter_labelled_chunks(self.paths, self.transformer, self.chunk_rows, self.test_size)
+
+    def fit(self, fresh=False):
+        """Train (resuming from the last checkpoint unless ``fresh``) and return the fitted model."""
+        if fresh:
+            shutil.rmtree(self.checkpoint_path, ignore_errors=True)
+        os.makedirs(self.checkpoint_path, exist_ok=True)
+        with ResourceMonitor() as monitor:
+            model = self._fit_xgboost() if self.name == "XGBClassifier" else self._fit_incremental()
+        self.report.update({"train_seconds": monitor.seconds, "train_peak_rss": monitor.peak_rss})
+        self.log(f"[train] done in {monitor.seconds:.1f}s, peak RSS {monitor.peak_rss / 2**20:,.0f} MiB")
+        return model
+
+    def _fit_incremental(self):
+        """SGD and LightGBM: one update per shuffled batch, with the state saved every few batches."""
+        state_path = os.path.join(self.checkpoint_path, "state.joblib")
+        state = {"epoch": 0, "batch": 0, "rows": 0, "rounds": 0, "model": None}
+        if os.path.exists(state_path):
+            state = {"rounds": 0, **joblib.load(state_path)}
+            self.log(f"[resume] epoch {state['epoch'] + 1}, batch {state['batch']} ({state['rows']:,} rows trained)")
+
+        batch_rows = self.chunk_rows * SHUFFLE_CHUNKS
+        batches = max(math.ceil(estimate_rows(self.paths) * (1 - self.test_size) / batch_rows), 1)
+        total_rounds = self.params.get("n_estimators", 1)
+        model = state["model"]
+        for epoch in range(state["epoch"], self.epochs):
+            # The batches are rebuilt in the same order on resume, and those already trained are skipped
+            rng = np.random.default_rng(RANDOM_STATE + epoch)
+            start = time.perf_counter()
+            for batch, (X, y) in enumerate(iter_batches(self._chunks(), batch_rows, rng)):
+                if batch < state["batch"]:
+                    continue
+                # Boosting rounds due by the end of this batch; the row estimate can be off, so the
+                # target is capped and batches past the budget add no rounds
+                due = min(math.ceil(total_rounds * (epoch * batches + batch + 1) / (batches * self.epochs)), total_rounds)
+                rounds = due - state["rounds"]
+                if self.name == "SGDClassifier" or rounds > 0:
+                    model = self._update(model, X, y, rounds)
+                    state["rounds"] += max(rounds, 0)
+                state.update(batch=batch + 1, rows=state["rows"] + len(y), model=model)
+                if state["batch"] % self.checkpoint_every == 0:
+                    _save_atomic(state, state_path)
+                    self.log(f"[checkpoint] epoch {epoch + 1}, batch {state['batch']}, {state['rows']:,} rows trained")
+            state.update(epoch=epoch + 1, batch=0)
+            _save_atomic(state, state_path)
+            self.log(f"[epoch {epoch + 1}/{self.epochs}] done in {time.perf_counter() - start:.1f}s")
+        if model is None:
+            raise ValueError("No training rows in the input")
+        self.report.update({"epochs": self.epochs, "rows_trained": state["rows"]})
+        if self.name == "LightGBMClassifier":
+            self.report["rounds"] = state["rounds"]
+        return model
+
+    def _update(self, model, X, y, rounds):
+        if self.name == "SGDClassifier":
+            from sklearn.linear_model import SGDClassifier
+
+            model = model if model is not None else SGDClassifier(**self.params)
+            model.partial_fit(X, y, classes=np.array([0, 1]))
+            return model
+
+        from lightgbm import LGBMClassifier
+
+        # Continued training: the new rounds start from the previous model's predictions
+        booster = model.booster_ if model is not None else None
+        updated = LGBMClassifier(n_jobs=self.n_jobs, **{**self.params, "n_estimators": rounds})
+        updated.fit(X, y, init_model=booster)
+        return updated
+
+    def _fit_xgboost(self):
+        """Boost over an external-memory quantile matrix built from the training rows of every chunk."""
+        import xgboost
+
+        trainer = self
+
+        class Chunks(xgboost.DataIter):
+            def __init__(self, cache_prefix):
+                self._chunks = None
+                super().__init__(cache_prefix=cache_prefix)
+
+            def next(self, input_data):
+                if self._chunks is None:
+                    self._chunks = trainer._chunks()
+                for X, y, holdout in self._chunks:
+                    if np.all(holdout):
+                        continue
+                    input_data(data=X[~holdout], label=y[~holdout])
+                    return True
+                return False
+
+            def reset(self):
+                self._chunks = None
+
+        params = {key: value for key, value in self.params.items() if key not in ("n_estimators", "random_state")}
+        params.update(objective="binary:logistic", tree_method="hist", seed=self.params["random_state"], nthread=self.n_jobs)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        data = xgboost.ExtMemQuantileDMatrix(Chunks(os.path.join(self.cache_dir, self.key)), max_bin=params.pop("max_bin"))
+
+        checkpoints = glob.glob(os.path.join(self.checkpoint_path, "model_*.ubj"))
+        resume = None
+        if checkpoints:
+            latest = max(checkpoints, key=lambda path: int(path.rsplit("_", 1)[1].split(".")[0]))
+            resume = xgboost.Booster(model_file=latest)
+            self.log(f"[resume] {resume.num_boosted_rounds()} boosting rounds from {latest}")
+        done = resume.num_boosted_rounds() if resume is not None else 0
+        checkpoint = xgboost.callback.TrainingCheckPoint(directory=self.checkpoint_path, name="model", interval=self.checkpoint_every)
+        booster = xgboost.train(params, data, num_boost_round=max(self.params["n_estimators"] - done, 0),
+                                xgb_model=resume, callbacks=[checkpoint])
+        self.report.update({"rows_trained": int(data.num_row()), "rounds": booster.num_boosted_rounds()})
+        del data  # frees the matrix and removes its pages from the cache directory
+
+        # Hand the booster to the sklearn wrapper the app and the tree engine expect
+        model_path = os.path.join(self.checkpoint_path, "final.json")
+        booster.save_model(model_path)
+        model = xgboost.XGBClassifier(n_jobs=self.n_jobs)
+        model.load_model(model_path)
+        return model
+
+    def evaluate(self, model):
+        """Holdout metrics from one more streamed pass over the data."""
+        metrics = HoldoutMetrics()
+        with ResourceMonitor() as monitor:
+            for X, y, holdout in self._chunks():
+                if np.any(holdout):
+                    metrics.update(y[holdout], model.predict_proba(X[holdout])[:, 1])
+        result = metrics.result()
+        self.report.update({"holdout": result, "evaluate_seconds": monitor.seconds})
+        return result
+
+    def publish(self, model, models_dir=MODELS_DIR):
+        """Write ``models/<Model>-ooc.pkl`` and its manifest entry, then drop the checkpoints."""
+        ooc_name = f"{self.name}-ooc"
+        os.makedirs(models_dir, exist_ok=True)
+        target = os.path.join(models_dir, f"{ooc_name}.pkl")
+        _save_atomic(model, target)
+
+        manifest_path = os.path.join(models_dir, MANIFEST_NAME)
+        manifest = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        manifest.setdefault("artifacts", {})[ooc_name] = {
+            "file": f"{ooc_name}.pkl",
+            "key": self.key,
+            "written_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "params": self.params,
+            "training": self.report,
+        }
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f, indent=2, default=str)
+        shutil.rmtree(self.checkpoint_path, ignore_errors=True)
+        return target
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train a model chunk by chunk on CSVs of any size.")
+    parser.add_argument("paths", nargs="+", help="labelled transaction CSVs with the V1-V28, Amount and Class columns")
+    parser.add_argument("--model", choices=list(OOC_PARAMS), default="SGDClassifier", help="model to train (default: %(default)s)")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="rows parsed at a time (default: %(default)s)")
+    parser.add_argument("--epochs", type=int, default=DEFAULT_EPOCHS,
+                        help="passes over the data for SGD and LightGBM (default: %(default)s)")
+    parser.add_argument("--checkpoint-every", type=int, default=DEFAULT_CHECKPOINT_EVERY,
+                        help="batches (boosting rounds for XGBoost) between checkpoints (default: %(default)s)")
+    parser.add_argument("--jobs", type=int, default=None, help="threads for the boosters (default: all cores)")
+    parser.add_argument("--fresh", action="store_true", help="ignore existing checkpoints and start over")
+    args = parser.parse_args(argv)
+
+    trainer = OutOfCoreTrainer(args.model, args.paths, args.chunk_rows, args.epochs, args.checkpoint_every, args.jobs)
+    model = trainer.fit(fresh=args.fresh)
+    result = trainer.evaluate(model)
+    print(f"Holdout ({result['rows']:,} rows) " + "  ".join(
+        f"{key} {value:.4f}" for key, value in result.items() if key != "rows"))
+    print(f"Wrote {trainer.publish(model)}")
+
+
+if __name__ == "__main__":
+    main()
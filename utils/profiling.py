@@ -0,0 +1,235 @@
+import os
+import time
+import cProfile
+import functools
+import threading
+import contextlib
+import collections
+
+try:
+    import psutil
+except ImportError:  # psutil is optional; fall back to /proc on Linux
+    psutil = None
+
+
+def rss_bytes():
+    """Current resident set size of this process in bytes (0 if it cannot be determined)."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+class ResourceMonitor:
+    """Context manager recording wall time and peak RSS of a block.
+
+    RSS is sampled on a background thread every ``interval`` seconds, so short spikes between samples
+    can be missed; the figure is meant for comparing stages, not exact accounting.
+    """
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.seconds = 0.0
+        self.start_rss = 0
+        self.peak_rss = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak_rss = max(self.peak_rss, rss_bytes())
+
+    def __enter__(self):
+        self.start_rss = self.peak_rss = rss_bytes()
+        self._start = time.perf_counter()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_rss = max(self.peak_rss, rss_bytes())
+        self.seconds = time.perf_counter() - self._start
+        return False
+
+
+# Upper bounds (seconds) of the span duration histogram buckets, Prometheus style
+SPAN_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRICS_PATH = os.environ.get("FRAUD_METRICS_FILE", os.path.join("data", "cache", "metrics.prom"))
+PROFILE_DIR = os.path.join("data", "cache", "profiles")
+RECENT_SPANS = 200
+
+
+class SpanHistogram:
+    """Bucketed durations plus totals and resident-memory growth for one span name."""
+
+    def __init__(self, buckets=SPAN_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last bucket is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.rss_growth = 0
+
+    def observe(self, seconds, rss_delta=0):
+        index = next((i for i, bound in enumerate(self.buckets) if seconds <= bound), len(self.buckets))
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        self.maximum = max(self.maximum, seconds)
+        self.rss_growth += max(rss_delta, 0)
+
+    def quantile(self, q):
+        """Estimate a quantile by interpolating inside the bucket that holds it."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.maximum
+                return min(lower + (upper - lower) * (rank - seen) / count, self.maximum)
+            seen += count
+        return self.maximum
+
+
+def _escape_label(value):
+    """Escape a Prometheus label value (backslash, double quote and newline)."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Instrumentation:
+    """Named timing/RSS spans aggregated into histograms, shared by every session of the process.
+
+    ``with instrumentation.span("predict"):`` records the block's wall time and RSS change under
+    that name; spans opened inside another span also record it as their parent. The aggregates are
+    shown on the Diagnostics page and exported as Prometheus text.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.histograms = {}
+        self.recent = collections.deque(maxlen=RECENT_SPANS)
+
+    @contextlib.contextmanager
+    def span(self, name):
+        stack = self._local.__dict__.setdefault("stack", [])
+        parent = stack[-1] if stack else None
+        stack.append(name)
+        rss_before = rss_bytes()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            rss_after = rss_bytes()
+            stack.pop()
+            with self._lock:
+                self.histograms.setdefault(name, SpanHistogram()).observe(seconds, rss_after - rss_before)
+                self.recent.append({
+                    "span": name,
+                    "parent": parent,
+                    "started_at": time.strftime("%H:%M:%S", time.localtime(time.time() - seconds)),
+                    "seconds": seconds,
+                    "rss_delta_bytes": rss_after - rss_before,
+                    "rss_bytes": rss_after,
+                    "thread": threading.current_thread().name,
+                })
+
+    def timed(self, name):
+        """Decorator form of :meth:`span`."""
+        def decorate(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def summary(self):
+        """One row per span name: count, total/mean/p50/p95/max seconds and total RSS growth."""
+        with self._lock:
+            return [
+                {
+                    "span": name,
+                    "count": h.count,
+                    "total_seconds": h.total,
+                    "mean_seconds": h.total / h.count if h.count else 0.0,
+                    "p50_seconds": h.quantile(0.5),
+                    "p95_seconds": h.quantile(0.95),
+                    "max_seconds": h.maximum,
+                    "rss_growth_bytes": h.rss_growth,
+                }
+                for name, h in sorted(self.histograms.items())
+            ]
+
+    def recent_spans(self):
+        with self._lock:
+            return list(reversed(self.recent))
+
+    def prometheus_text(self, prefix="fraud_app"):
+        lines = [f"# TYPE {prefix}_span_seconds histogram"]
+        with self._lock:
+            for span_name, h in sorted(self.histograms.items()):
+                name = _escape_label(span_name)
+                cumulative = 0
+                for bound, count in zip(list(h.buckets) + ["+Inf"], h.counts):
+                    cumulative += count
+                    lines.append(f'{prefix}_span_seconds_bucket{{span="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}_span_seconds_sum{{span="{name}"}} {h.total:.6f}')
+                lines.append(f'{prefix}_span_seconds_count{{span="{name}"}} {h.count}')
+            lines.append(f"# TYPE {prefix}_span_rss_growth_bytes counter")
+            for span_name, h in sorted(self.histograms.items()):
+                lines.append(f'{prefix}_span_rss_growth_bytes{{span="{_escape_label(span_name)}"}} {h.rss_growth}')
+        lines.append(f"# TYPE {prefix}_resident_memory_bytes gauge")
+        lines.append(f"{prefix}_resident_memory_bytes {rss_bytes()}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path=METRICS_PATH):
+        """Write :meth:`prometheus_text` atomically, e.g. for a node-exporter textfile collector."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.recent.clear()
+
+
+@contextlib.contextmanager
+def profile_if_slow(label, threshold_seconds, directory=PROFILE_DIR):
+    """Run the block under cProfile and keep the stats in ``directory`` only if it took longer than
+    ``threshold_seconds``. A threshold of ``None`` disables profiling."""
+    if threshold_seconds is None:
+        yield
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:  # another profiler is already active (e.g. a concurrent rerun)
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        seconds = time.perf_counter() - start
+        if seconds > threshold_seconds:
+            os.makedirs(directory, exist_ok=True)
+            profiler.dump_stats(os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{label}-{seconds:.1f}s.prof"))
+
+
+# Shared by every session of the Streamlit server (and any script importing it)
+instrumentation = Instrumentation()
+span = instrumentation.span
+timed = instrumentation.timed
@@ -0,0 +1,283 @@
+"""Cache of fraud probabilities keyed on a hash of the preprocessed feature row and the model version.
+
+Batch uploads often re-submit transactions that were already scored. :class:`CachedModel` wraps a
+classifier so that ``predict_proba`` does the following:
+
+1. Hash every row of the float32 block, vectorized over whole columns.
+2. Score each distinct row once per batch.
+3. Look up the distinct rows in a bounded in-memory LRU, then in an on-disk SQLite store
+   (``data/cache/scores.sqlite``) shared by every process.
+4. Send only the rows found in neither to the model.
+
+Entries are keyed on the model file's fingerprint as well, so a retrained model never serves stale
+scores. Each wrapper counts its hits and misses and estimates the model time it saved.
+"""
+import os
+import time
+import sqlite3
+import threading
+import collections
+
+import numpy as np
+
+from utils.data_loader import CACHE_DIR
+
+SCORE_CACHE_PATH = os.path.join(CACHE_DIR, "scores.sqlite")
+MEMORY_ENTRIES = 200_000
+DISK_ROWS = 20_000_000
+LOOKUP_BATCH = 50_000
+
+# Two independent multiply-xorshift lanes give a 128-bit row key; the first lane indexes the
+# stores and the second verifies the match
+_SEEDS = (np.uint64(0x9E3779B97F4A7C15), np.uint64(0xC2B2AE3D27D4EB4F))
+_PRIMES = (np.uint64(0xFF51AFD7ED558CCD), np.uint64(0xC4CEB9FE1A85EC53))
+_SHIFTS = (np.uint64(29), np.uint64(31))
+
+
+def row_hashes(block):
+    """Two 64-bit hashes per row of a float32 ``(rows, features)`` block, computed column by column.
+
+    -0.0 and 0.0 hash alike, as do all NaNs, so rows that score the same share a key.
+    """
+    block = np.asarray(block, dtype=np.float32)
+    bits = np.ascontiguousarray(block + np.float32(0.0)).view(np.uint32)
+    bits[np.isnan(block)] = 0x7FC00000
+    lanes = []
+    for seed, prime, shift in zip(_SEEDS, _PRIMES, _SHIFTS):
+        h = np.full(len(block), seed, dtype=np.uint64)
+        for j in range(block.shape[1]):
+            h ^= bits[:, j]
+            h *= prime
+            h ^= h >> shift
+        lanes.append(h)
+    return lanes[0], lanes[1]
+
+
+class ScoreCache:
+    """Bounded LRU in front of a SQLite table of ``(model version, row hash) -> probability``."""
+
+    def __init__(self, path=SCORE_CACHE_PATH, memory_entries=MEMORY_ENTRIES, disk_rows=DISK_ROWS):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.disk_rows = disk_rows
+        self._lock = threading.Lock()
+        self._memory = collections.OrderedDict()
+        self._local = threading.local()
+        self._writes = 0
+        self._costs = {}  # version -> (model seconds, rows scored), for estimating time saved
+
+    def _connection(self):
+        # SQLite connections cannot be shared across threads; each thread opens its own
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS scores (version TEXT, h1 INTEGER, h2 INTEGER, probability REAL, "
+                "written_at REAL, PRIMARY KEY (version, h1)) WITHOUT ROWID"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS scores_written_at ON scores (written_at)")
+            connection.execute("CREATE TABLE IF NOT EXISTS costs (version TEXT PRIMARY KEY, seconds REAL, rows INTEGER)")
+            self._local.connection = connection
+        return connection
+
+    def lookup(self, version, h1, h2):
+        """Probabilities for the keys, NaN where absent; returns ``(probabilities, memory hits, disk hits)``."""
+        probabilities = np.full(len(h1), np.nan)
+        first, second = h1.tolist(), h2.tolist()
+        missing = []
+        with self._lock:
+            for i, (a, b) in enumerate(zip(first, second)):
+                entry = self._memory.get((version, a))
+                if entry is not None and entry[0] == b:
+                    self._memory.move_to_end((version, a))
+                    probabilities[i] = entry[1]
+                else:
+                    missing.append(i)
+        memory_hits = len(h1) - len(missing)
+        if not missing or not os.path.exists(self.path):
+            return probabilities, memory_hits, 0
+
+        # Look the rest up on disk through a temporary key table joined against the store. Filling the
+        # table opens a transaction, which is ended before returning: a connection left in one keeps
+        # its old snapshot, and its next write fails at once once another process has written
+        found = {}
+        connection = self._connection()
+        signed = np.asarray(h1[missing]).view(np.int64).tolist()
+        with connection:
+            for start in range(0, len(signed), LOOKUP_BATCH):
+                connection.execute("CREATE TEMP TABLE IF NOT EXISTS wanted (h1 INTEGER PRIMARY KEY)")
+                connection.execute("DELETE FROM wanted")
+                connection.executemany("INSERT OR IGNORE INTO wanted VALUES (?)", ((k,) for k in signed[start:start + LOOKUP_BATCH]))
+                for a, b, probability in connection.execute(
+                    "SELECT s.h1, s.h2, s.probability FROM scores s JOIN wanted w ON s.h1 = w.h1 WHERE s.version = ?", (version,)
+                ):
+                    found[a] = (b, probability)
+        disk_hits = []
+        h2_signed = np.asarray(h2[missing]).view(np.int64).tolist()
+        for i, a, b in zip(missing, signed, h2_signed):
+            entry = found.get(a)
+            if entry is not None and entry[0] == b:
+                probabilities[i] = entry[1]
+                disk_hits.append(i)
+        self._remember(version, h1[disk_hits], h2[disk_hits], probabilities[disk_hits])
+        return probabilities, memory_hits, len(disk_hits)
+
+    def store(self, version, h1, h2, probabilities):
+        self._remember(version, h1, h2, probabilities)
+        connection = self._connection()
+        now = time.time()
+        rows = zip(h1.view(np.int64).tolist(), h2.view(np.int64).tolist(), np.asarray(probabilities, dtype=np.float64).tolist())
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?, ?)", ((version, a, b, p, now) for a, b, p in rows)
+            )
+        self._writes += len(h1)
+        if self._writes >= self.disk_rows // 10:
+            self._writes = 0
+            self._prune(connection)
+
+    def _remember(self, version, h1, h2, probabilities):
+        with self._lock:
+            for a, b, p in zip(h1.tolist(), h2.tolist(), np.asarray(probabilities).tolist()):
+                self._memory[(version, a)] = (b, p)
+                self._memory.move_to_end((version, a))
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _prune(self, connection):
+        """Drop the oldest entries once the store holds more than ``disk_rows`` rows."""
+        (count,) = connection.execute("SELECT COUNT(*) FROM scores").fetchone()
+        if count > self.disk_rows:
+            with connection:
+                connection.execute(
+                    "DELETE FROM scores WHERE written_at <= (SELECT written_at FROM scores ORDER BY written_at LIMIT 1 OFFSET ?)",
+                    (count - self.disk_rows,),
+                )
+
+    def record_cost(self, version, seconds, rows):
+        """Add a model call to the version's cost, kept on disk so later processes can estimate savings."""
+        with self._lock:
+            total_seconds, total_rows = self._costs.get(version, (0.0, 0))
+            self._costs[version] = (total_seconds + seconds, total_rows + rows)
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT INTO costs VALUES (?, ?, ?) ON CONFLICT (version) DO UPDATE "
+                "SET seconds = seconds + excluded.seconds, rows = rows + excluded.rows",
+                (version, seconds, rows),
+            )
+
+    def seconds_per_row(self, version):
+        seconds, rows = self._costs.get(version, (0.0, 0))
+        if not rows and os.path.exists(self.path):
+            row = self._connection().execute("SELECT seconds, rows FROM costs WHERE version = ?", (version,)).fetchone()
+            seconds, rows = row or (0.0, 0)
+        return seconds / rows if rows else 0.0
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if os.path.exists(self.path):
+            with self._connection() as connection:
+                connection.execute("DELETE FROM scores")
+                connection.execute("DELETE FROM costs")
+
+
+class CachedModel:
+    """``predict_proba`` through a :class:`ScoreCache`, with hit and time-saved statistics for this wrapper.
+
+    ``predict`` flags rows whose fraud probability reaches ``threshold``.
+    """
+
+    def __init__(self, model, version, cache, threshold=0.5):
+        self.model = model
+        self.version = version
+        self.cache = cache
+        self.threshold = threshold
+        self.classes_ = getattr(model, "classes_", np.array([0, 1]))
+        self.rows = 0
+        self.unique_rows = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.model_rows = 0
+        self.model_seconds = 0.0
+        self.lookup_seconds = 0.0
+
+    def predict_proba(self, X):
+        start = time.perf_counter()
+        block = np.ascontiguousarray(X, dtype=np.float32)
+        h1, h2 = row_hashes(block)
+
+        # Duplicates inside the batch are looked up and scored once
+        _, first, inverse = np.unique(np.column_stack([h1, h2]), axis=0, return_index=True, return_inverse=True)
+        inverse = inverse.ravel()
+        probabilities, memory_hits, disk_hits = self.cache.lookup(self.version, h1[first], h2[first])
+        misses = np.flatnonzero(np.isnan(probabilities))
+        lookup = time.perf_counter() - start
+
+        if len(misses):
+            start = time.perf_counter()
+            probabilities[misses] = self.model.predict_proba(block[first[misses]])[:, 1]
+            elapsed = time.perf_counter() - start
+            self.cache.record_cost(self.version, elapsed, len(misses))
+            self.model_seconds += elapsed
+            self.model_rows += len(misses)
+            start = time.perf_counter()
+            self.cache.store(self.version, h1[first[misses]], h2[first[misses]], probabilities[misses])
+            lookup += time.perf_counter() - start
+
+        self.rows += len(block)
+        self.unique_rows += len(first)
+        self.memory_hits += memory_hits
+        self.disk_hits += disk_hits
+        self.lookup_seconds += lookup
+        fraud = probabilities[inverse]
+        return np.column_stack([1.0 - fraud, fraud])
+
+    def predict(self, X):
+        return (self.predict_proba(X)[:, 1] >= self.threshold).astype(np.int64)
+
+    def stats(self):
+        """Rows served without the model and the model time that saved, net of hashing and lookups.
+
+        The model's cost per row is averaged over every miss scored for the version, in any process.
+        """
+        served = self.rows - self.model_rows
+        per_row = self.cache.seconds_per_row(self.version)
+        return {
+            "rows": self.rows,
+            "duplicate_rows": self.rows - self.unique_rows,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "model_rows": self.model_rows,
+            "hit_rate": served / self.rows if self.rows else 0.0,
+            "model_seconds": self.model_seconds,
+            "cache_seconds": self.lookup_seconds,
+            "seconds_saved": served * per_row - self.lookup_seconds,
+        }
+
+
+_lock = threading.Lock()
+_caches = {}
+
+
+def get_score_cache(path=SCORE_CACHE_PATH):
+    """The process-wide cache stored at ``path``."""
+    with _lock:
+        if path not in _caches:
+            _caches[path] = ScoreCache(path)
+        return _caches[path]
+
+
+def cached_model(registry, name, model=None, path=SCORE_CACHE_PATH):
+    """``name``'s classifier wrapped in the shared score cache, versioned by its artifact's fingerprint.
+
+    ``predict`` uses ``name``'s saved operating point.
+    """
+    from utils.model_registry import artifact_fingerprint
+    from utils.operating_point import threshold_for
+    model = model if model is not None else registry.classifier(name)
+    version = f"{name}:{artifact_fingerprint(registry.path(name))}"
+    return CachedModel(model, version, get_score_cache(path), threshold_for(name))
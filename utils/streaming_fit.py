@@ -0,0 +1,269 @@
+"""Winsorization bounds and scaler statistics fitted chunk by chunk, without loading the data.
+
+The fit makes two passes over the input:
+
+1. Every feature goes through a mergeable t-digest, which estimates the 1%/99% bounds.
+2. Each chunk is clipped to those bounds, and its mean and variance are accumulated with
+   Welford/Chan updates.
+
+Both passes split the input CSVs into line-aligned byte-range shards. The shards are processed
+in parallel and their partial states are merged. Memory therefore depends on the chunk size and
+the number of workers, never on the amount of history. The results are saved in the same format
+as the notebooks' ``winsorization_bounds.pkl`` and ``scaler.pkl``.
+
+Unlike the notebooks, duplicate rows are not dropped, and the scaler is fitted on every row
+rather than on an 80% train split. The artifacts are therefore written to a scratch directory by
+default: the shipped ``models/`` copies are the ones every pickled classifier was trained against,
+and artifacts already in any other directory are only replaced with ``--force``.
+
+Usage:
+    python -m utils.streaming_fit data/raw/creditcard_2023.csv [more.csv ...] [--output-dir data/cache/streaming_fit] [--force] [--check]
+"""
+import os
+import time
+import argparse
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+
+from utils.batch_scoring import DEFAULT_CHUNK_ROWS, iter_shard_chunks, plan_shards
+from utils.data_loader import CACHE_DIR, FEATURES
+from utils.training import WINSOR_QUANTILES
+
+DIGEST_COMPRESSION = 1000
+DEFAULT_SHARD_MB = 64
+DEFAULT_OUTPUT_DIR = os.path.join(CACHE_DIR, "streaming_fit")
+ARTIFACT_FILES = ("winsorization_bounds.pkl", "scaler.pkl")
+
+
+class TDigest:
+    """Mergeable quantile sketch: weighted centroids that are finest near the tails.
+
+    Centroids are limited by the arcsine scale function ``k(q) = d / (2 pi) * asin(2q - 1)``. Each
+    centroid covers at most one unit of ``k``, so roughly ``d * pi / 2`` of them are kept, and those
+    near q = 0 and q = 1 hold only a handful of points. Updates and merges sort the combined
+    centroids and regroup them in a single vectorized pass.
+    """
+
+    def __init__(self, compression=DIGEST_COMPRESSION):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.minimum = np.inf
+        self.maximum = -np.inf
+
+    @property
+    def count(self):
+        return float(self.weights.sum())
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values):
+            self.minimum = min(self.minimum, values.min())
+            self.maximum = max(self.maximum, values.max())
+            self._absorb(values, np.ones(len(values)))
+
+    def merge(self, other):
+        if len(other.means):
+            self.minimum = min(self.minimum, other.minimum)
+            self.maximum = max(self.maximum, other.maximum)
+            self._absorb(other.means, other.weights)
+
+    def _absorb(self, means, weights):
+        means = np.concatenate([self.means, means])
+        weights = np.concatenate([self.weights, weights])
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+
+        total = weights.sum()
+        cumulative = np.cumsum(weights)
+        q = (cumulative - weights / 2) / total
+        k = self.compression / (2 * np.pi) * np.arcsin(np.clip(2 * q - 1, -1.0, 1.0))
+        groups = np.floor(k).astype(np.int64)
+        starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+
+        self.weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / self.weights
+
+    def quantile(self, q):
+        """Linearly interpolated quantile, matching ``Series.quantile`` when no centroid is merged."""
+        if not len(self.means):
+            return np.nan
+        total = self.weights.sum()
+        centres = np.cumsum(self.weights) - self.weights / 2
+        target = q * (total - 1) + 0.5
+        positions = np.r_[0.0, centres, total]
+        values = np.r_[self.minimum, self.means, self.maximum]
+        return float(np.interp(target, positions, values))
+
+
+class RunningMoments:
+    """Per-column count, mean and sum of squared deviations, merged with Chan et al.'s update."""
+
+    def __init__(self, n_columns):
+        self.count = np.zeros(n_columns)
+        self.mean = np.zeros(n_columns)
+        self.m2 = np.zeros(n_columns)
+
+    def update(self, block):
+        block = np.asarray(block, dtype=np.float64)
+        present = ~np.isnan(block)
+        count = present.sum(axis=0).astype(np.float64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(count > 0, np.nansum(block, axis=0) / count, 0.0)
+        m2 = np.nansum(np.where(present, block - mean, 0.0) ** 2, axis=0)
+        self._combine(count, mean, m2)
+
+    def merge(self, other):
+        self._combine(other.count, other.mean, other.m2)
+
+    def _combine(self, count, mean, m2):
+        total = self.count + count
+        with np.errstate(invalid="ignore", divide="ignore"):
+            delta = mean - self.mean
+            self.mean = np.where(total > 0, self.mean + delta * count / total, 0.0)
+            self.m2 = self.m2 + m2 + np.where(total > 0, delta ** 2 * self.count * count / total, 0.0)
+        self.count = total
+
+    def variance(self):
+        """Population variance (``ddof=0``), as ``StandardScaler`` uses."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.m2 / self.count
+
+
+def _clean_chunks(path, header, start, end, chunk_rows):
+    # Like the notebooks, rows with any missing value are dropped before fitting
+    for chunk in iter_shard_chunks(path, header, start, end, chunk_rows):
+        yield chunk.dropna()[FEATURES].to_numpy(dtype=np.float64)
+
+
+def _sketch_shard(path, header, start, end, chunk_rows, compression):
+    digests = [TDigest(compression) for _ in FEATURES]
+    for block in _clean_chunks(path, header, start, end, chunk_rows):
+        for digest, column in zip(digests, block.T):
+            digest.update(column)
+    return digests
+
+
+def _moments_shard(path, header, start, end, chunk_rows, lower, upper):
+    moments = RunningMoments(len(FEATURES))
+    for block in _clean_chunks(path, header, start, end, chunk_rows):
+        moments.update(np.clip(block, lower, upper))
+    return moments
+
+
+def make_scaler(moments):
+    """A fitted ``StandardScaler`` built from streamed moments, interchangeable with ``scaler.pkl``."""
+    from sklearn.preprocessing import StandardScaler
+
+    variance = moments.variance()
+    scale = np.sqrt(variance)
+    scale[~(scale > 10 * np.finfo(np.float64).eps)] = 1.0  # constant columns are left unscaled, as in sklearn
+    scaler = StandardScaler()
+    scaler.mean_ = moments.mean.copy()
+    scaler.var_ = variance
+    scaler.scale_ = scale
+    scaler.n_samples_seen_ = int(moments.count.max()) if np.all(moments.count == moments.count.max()) else moments.count.astype(np.int64)
+    scaler.n_features_in_ = len(FEATURES)
+    scaler.feature_names_in_ = np.array(FEATURES, dtype=object)
+    return scaler
+
+
+def fit_streaming(paths, workers=None, shard_mb=DEFAULT_SHARD_MB, chunk_rows=DEFAULT_CHUNK_ROWS,
+                  quantiles=WINSOR_QUANTILES, compression=DIGEST_COMPRESSION, log=print):
+    """Fit the winsorization bounds and scaler over ``paths``; returns ``(bounds, scaler, report)``."""
+    shards = []
+    for path in paths:
+        header, ranges = plan_shards(path, shard_mb * 1024 * 1024)
+        shards.extend((path, header, start, end) for start, end in ranges)
+    if not shards:
+        raise ValueError("No data rows to fit on")
+    workers = min(workers or os.cpu_count() or 1, len(shards))
+    log(f"{len(paths)} file(s), {len(shards)} shard(s), {workers} worker(s)")
+
+    report = {"files": list(paths), "shards": len(shards), "workers": workers}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        start = time.perf_counter()
+        digests = [TDigest(compression) for _ in FEATURES]
+        sketch = partial(_sketch_shard, chunk_rows=chunk_rows, compression=compression)
+        for shard_digests in pool.map(sketch, *zip(*shards)):
+            for digest, other in zip(digests, shard_digests):
+                digest.merge(other)
+        bounds = {col: (digest.quantile(quantiles[0]), digest.quantile(quantiles[1])) for col, digest in zip(FEATURES, digests)}
+        report["rows"] = int(digests[0].count)
+        report["quantile_seconds"] = time.perf_counter() - start
+        log(f"[bounds] {report['rows']:,} rows sketched in {report['quantile_seconds']:.1f}s")
+
+        start = time.perf_counter()
+        lower = np.array([bounds[col][0] for col in FEATURES])
+        upper = np.array([bounds[col][1] for col in FEATURES])
+        moments = RunningMoments(len(FEATURES))
+        accumulate = partial(_moments_shard, chunk_rows=chunk_rows, lower=lower, upper=upper)
+        for shard_moments in pool.map(accumulate, *zip(*shards)):
+            moments.merge(shard_moments)
+        report["moments_seconds"] = time.perf_counter() - start
+        log(f"[scaler] moments accumulated in {report['moments_seconds']:.1f}s")
+
+    return bounds, make_scaler(moments), report
+
+
+def compare_exact(paths, bounds, scaler, quantiles=WINSOR_QUANTILES):
+    """Errors against the in-memory fit on the same rows (loads every file, so for validation only).
+
+    Bound errors are measured in rank: how far the share of rows outside each bound is from the
+    target quantile. Mean and scale errors are relative to the exact standard deviation.
+    """
+    import pandas as pd
+
+    df = pd.concat([pd.read_csv(path) for path in paths], ignore_index=True).dropna()
+    values = df[FEATURES].to_numpy(dtype=np.float64)
+    lower = np.array([bounds[col][0] for col in FEATURES])
+    upper = np.array([bounds[col][1] for col in FEATURES])
+    rank_error = np.maximum(np.abs((values < lower).mean(axis=0) - quantiles[0]),
+                            np.abs((values > upper).mean(axis=0) - (1 - quantiles[1])))
+
+    exact = df[FEATURES].quantile(list(quantiles))
+    clipped = np.clip(values, exact.iloc[0].to_numpy(), exact.iloc[1].to_numpy())
+    std = clipped.std(axis=0)
+    return {
+        "max_bound_rank_error": float(rank_error.max()),
+        "max_mean_error_in_std": float(np.max(np.abs(scaler.mean_ - clipped.mean(axis=0)) / std)),
+        "max_scale_relative_error": float(np.max(np.abs(scaler.scale_ - std) / std)),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit winsorization bounds and the scaler by streaming over CSV files.")
+    parser.add_argument("paths", nargs="+", help="transaction CSVs with the V1-V28 and Amount columns")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR, help="where to write the artifacts (default: %(default)s)")
+    parser.add_argument("--force", action="store_true",
+                        help="replace existing artifacts in --output-dir (e.g. the models/ copies the classifiers were trained with)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: all cores)")
+    parser.add_argument("--shard-mb", type=int, default=DEFAULT_SHARD_MB, help="shard size in MiB (default: %(default)s)")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="rows parsed at a time (default: %(default)s)")
+    parser.add_argument("--compression", type=int, default=DIGEST_COMPRESSION, help="t-digest size parameter (default: %(default)s)")
+    parser.add_argument("--check", action="store_true", help="compare with the exact in-memory fit (loads every file)")
+    args = parser.parse_args(argv)
+
+    # The scratch directory is always rewritten; anywhere else (models/ above all) needs --force
+    scratch = os.path.abspath(args.output_dir) == os.path.abspath(DEFAULT_OUTPUT_DIR)
+    existing = [name for name in ARTIFACT_FILES if os.path.exists(os.path.join(args.output_dir, name))]
+    if existing and not scratch and not args.force:
+        parser.error(f"{', '.join(existing)} already in {args.output_dir}; pass --force to replace them")
+
+    bounds, scaler, report = fit_streaming(args.paths, args.workers, args.shard_mb, args.chunk_rows, compression=args.compression)
+    os.makedirs(args.output_dir, exist_ok=True)
+    for name, artifact in zip(ARTIFACT_FILES, (bounds, scaler)):
+        joblib.dump(artifact, os.path.join(args.output_dir, name))
+    print(f"Wrote {' and '.join(ARTIFACT_FILES)} to {args.output_dir}")
+
+    if args.check:
+        for name, value in compare_exact(args.paths, bounds, scaler).items():
+            print(f"{name}: {value:.3g}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+import os
+import json
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from utils.data_loader import FEATURES, file_fingerprint, load_table
+from utils.profiling import ResourceMonitor
+
+RAW_DATA_PATH = os.path.join("data", "raw", "creditcard_2023.csv")
+PROCESSED_DIR = os.path.join("data", "processed")
+PIPELINE_CACHE_DIR = os.path.join("data", "cache", "pipeline")
+MODELS_DIR = "models"
+MANIFEST_NAME = "manifest.json"
+
+# Same settings as the training notebooks
+WINSOR_QUANTILES = (0.01, 0.99)
+TEST_SIZE = 0.2
+RANDOM_STATE = 42
+MODEL_PARAMS = {
+    "XGBClassifier": {"random_state": RANDOM_STATE},
+    "RandomForestClassifier": {"random_state": RANDOM_STATE},
+    "LightGBMClassifier": {
+        "boosting_type": "gbdt",
+        "num_leaves": 31,
+        "learning_rate": 0.05,
+        "n_estimators": 500,
+        "random_state": RANDOM_STATE,
+        "verbose": -1,
+    },
+}
+
+
+def make_model(name, params, n_jobs=1):
+    """Instantiate one of the candidate classifiers with an explicit thread budget."""
+    if name == "XGBClassifier":
+        from xgboost import XGBClassifier
+        return XGBClassifier(n_jobs=n_jobs, **params)
+    if name == "RandomForestClassifier":
+        from sklearn.ensemble import RandomForestClassifier
+        return RandomForestClassifier(n_jobs=n_jobs, **params)
+    if name == "LightGBMClassifier":
+        from lightgbm import LGBMClassifier
+        return LGBMClassifier(n_jobs=n_jobs, **params)
+    raise ValueError(f"Unknown model {name!r}; expected one of {', '.join(MODEL_PARAMS)}")
+
+
+def _digest(*parts):
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def load_raw(path):
+    """Load the raw CSV, drop the id column, missing rows and duplicates."""
+    df = load_table(path).to_pandas()
+    df = df.drop(columns=["id"], errors="ignore").dropna()
+    return df.drop_duplicates().reset_index(drop=True)
+
+
+def winsorization_bounds(df, quantiles=WINSOR_QUANTILES):
+    """1%/99% bounds for every feature, computed in one vectorized quantile call."""
+    q = df[FEATURES].quantile(list(quantiles))
+    return {col: (q[col].iloc[0], q[col].iloc[1]) for col in FEATURES}
+
+
+def winsorize(df, bounds):
+    lower = pd.Series({col: bounds[col][0] for col in FEATURES})
+    upper = pd.Series({col: bounds[col][1] for col in FEATURES})
+    clipped = df.copy()
+    clipped[FEATURES] = df[FEATURES].clip(lower=lower, upper=upper, axis=1)
+    return clipped.drop_duplicates().reset_index(drop=True)
+
+
+def split_and_scale(df, test_size=TEST_SIZE, random_state=RANDOM_STATE):
+    from sklearn.model_selection import train_test_split
+    from sklearn.preprocessing import StandardScaler
+
+    X_train, X_test, y_train, y_test = train_test_split(
+        df[FEATURES], df["Class"], test_size=test_size, random_state=random_state
+    )
+    scaler = StandardScaler()
+    return {
+        "scaler": scaler,
+        "X_train": scaler.fit_transform(X_train).astype(np.float32),
+        "X_test": scaler.transform(X_test).astype(np.float32),
+        "y_train": y_train.to_numpy(),
+        "y_test": y_test.to_numpy(),
+    }
+
+
+def fit_model(name, params, n_jobs, split_path, output_path):
+    """Fit one classifier on the cached split (memory-mapped, not copied) and save it.
+
+    Runs in a worker process; returns the stage timings measured inside that process.
+    """
+    from threadpoolctl import threadpool_limits
+
+    with ResourceMonitor() as monitor, threadpool_limits(limits=n_jobs):
+        split = joblib.load(split_path, mmap_mode="r")
+        model = make_model(name, params, n_jobs)
+        model.fit(split["X_train"], split["y_train"])
+        probabilities = model.predict_proba(split["X_test"])[:, 1]
+        joblib.dump(model, output_path)
+
+    predictions = (probabilities >= 0.5).astype(int)
+    y_test = np.asarray(split["y_test"])
+    return {
+        "seconds": monitor.seconds,
+        "peak_rss": monitor.peak_rss,
+        "accuracy": float(np.mean(predictions == y_test)),
+    }
+
+
+class TrainingPipeline:
+    """The notebook training workflow as cached, resumable stages.
+
+    Every stage is keyed on a hash of its parameters and its upstream stage's key, with the raw CSV's
+    fingerprint at the root. A stage whose key already has an output under ``cache_dir`` is skipped
+    and its output is only loaded if a later stage actually needs it, so an interrupted run resumes
+    where it stopped and an unchanged run does no work at all.
+    """
+
+    def __init__(self, raw_path=RAW_DATA_PATH, models_dir=MODELS_DIR, cache_dir=PIPELINE_CACHE_DIR,
+                 processed_dir=PROCESSED_DIR, models=None, n_jobs=None, force=False, log=print):
+        self.raw_path = raw_path
+        self.models_dir = models_dir
+        self.cache_dir = cache_dir
+        self.processed_dir = processed_dir
+        self.models = list(models or MODEL_PARAMS)
+        self.n_jobs = n_jobs or os.cpu_count() or 1
+        self.force = force
+        self.log = log
+        self.report = []
+        self._values = {}
+
+    def _path(self, name, key):
+        return os.path.join(self.cache_dir, f"{name}-{key}.joblib")
+
+    def _stage(self, name, key_parts, fn):
+        """Run ``fn`` unless an output for this stage's key exists; return the key."""
+        key = _digest(name, key_parts)
+        path = self._path(name, key)
+        if os.path.exists(path) and not self.force:
+            self.report.append({"stage": name, "key": key, "cached": True, "seconds": 0.0, "peak_rss": 0})
+            self.log(f"[{name}] up to date ({key})")
+            return key
+
+        with ResourceMonitor() as monitor:
+            value = fn()
+            os.makedirs(self.cache_dir, exist_ok=True)
+            joblib.dump(value, f"{path}.tmp")
+            os.replace(f"{path}.tmp", path)
+        self._values[(name, key)] = value
+        self.report.append({"stage": name, "key": key, "cached": False, "seconds": monitor.seconds, "peak_rss": monitor.peak_rss})
+        self.log(f"[{name}] done in {monitor.seconds:.1f}s, peak RSS {monitor.peak_rss / 2**20:,.0f} MiB")
+        return key
+
+    def _value(self, name, key):
+        if (name, key) not in self._values:
+            self._values[(name, key)] = joblib.load(self._path(name, key))
+        return self._values[(name, key)]
+
+    def prepare(self):
+        """Run (or reuse) the data stages up to the scaled split; returns ``(bounds_key, split_key)``."""
+        load_key = self._stage("load", [file_fingerprint(self.raw_path)], lambda: load_raw(self.raw_path))
+        bounds_key = self._stage("bounds", [load_key, WINSOR_QUANTILES],
+                                 lambda: winsorization_bounds(self._value("load", load_key)))
+        clean_key = self._stage("winsorize", [load_key, bounds_key],
+                                lambda: winsorize(self._value("load", load_key), self._value("bounds", bounds_key)))
+        split_key = self._stage("split", [clean_key, TEST_SIZE, RANDOM_STATE],
+                                lambda: split_and_scale(self._value("winsorize", clean_key)))
+        self.load_key = load_key
+        return bounds_key, split_key
+
+    def split_path(self, split_key):
+        return self._path("split", split_key)
+
+    def run(self):
+        bounds_key, split_key = self.prepare()
+        model_keys = self._train_models(split_key)
+        profile_key = self._stage("profile", [self.load_key, bounds_key, split_key, model_keys],
+                                  lambda: self._drift_profile(bounds_key, split_key, model_keys))
+        self._publish(bounds_key, split_key, model_keys, profile_key)
+        return self.report
+
+    def _drift_profile(self, bounds_key, split_key, model_keys):
+        """Reference distributions of the raw features and of every model's test-set probabilities."""
+        from utils.drift import build_profile
+
+        X_test = self._value("split", split_key)["X_test"]
+        scores = {name: joblib.load(self._path(name, key)).predict_proba(X_test)[:, 1] for name, key in model_keys.items()}
+        return build_profile(self._value("load", self.load_key), self._value("bounds", bounds_key), scores)
+
+    def _train_models(self, split_key):
+        """Fit every candidate model whose output is missing, in parallel across cores."""
+        keys = {name: _digest("train", [split_key, name, MODEL_PARAMS[name]]) for name in self.models}
+        todo = [name for name in self.models if self.force or not os.path.exists(self._path(name, keys[name]))]
+        for name in self.models:
+            if name not in todo:
+                self.report.append({"stage": f"train:{name}", "key": keys[name], "cached": True, "seconds": 0.0, "peak_rss": 0})
+                self.log(f"[train:{name}] up to date ({keys[name]})")
+        if not todo:
+            return keys
+
+        # Split the core budget between concurrently trained models
+        workers = min(len(todo), self.n_jobs)
+        threads = max(self.n_jobs // workers, 1)
+        split_path = self.split_path(split_key)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                name: pool.submit(fit_model, name, MODEL_PARAMS[name], threads, split_path, self._path(name, keys[name]))
+                for name in todo
+            }
+            for name, future in futures.items():
+                result = future.result()
+                self.report.append({"stage": f"train:{name}", "key": keys[name], "cached": False, **result})
+                self.log(f"[train:{name}] done in {result['seconds']:.1f}s with {threads} threads, "
+                         f"peak RSS {result['peak_rss'] / 2**20:,.0f} MiB, test accuracy {result['accuracy']:.4f}")
+        return keys
+
+    def _publish(self, bounds_key, split_key, model_keys, profile_key):
+        """Write artifacts into ``models/`` and the processed splits, plus a manifest of what was written."""
+        manifest_path = os.path.join(self.models_dir, MANIFEST_NAME)
+        manifest = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        artifacts = manifest.get("artifacts", {})
+
+        def publish(name, key, value_fn):
+            target = os.path.join(self.models_dir, f"{name}.pkl")
+            if artifacts.get(name, {}).get("key") == key and os.path.exists(target) and not self.force:
+                return
+            joblib.dump(value_fn(), target)
+            artifacts[name] = {"file": f"{name}.pkl", "key": key, "written_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+            self.log(f"[publish] wrote {target}")
+
+        os.makedirs(self.models_dir, exist_ok=True)
+        publish("winsorization_bounds", bounds_key, lambda: self._value("bounds", bounds_key))
+        publish("scaler", split_key, lambda: self._value("split", split_key)["scaler"])
+        for name, key in model_keys.items():
+            publish(name, key, lambda key=key, name=name: joblib.load(self._path(name, key)))
+            artifacts[name]["params"] = MODEL_PARAMS[name]
+
+        if artifacts.get("drift_profile", {}).get("key") != profile_key or self.force:
+            from utils.drift import DRIFT_PROFILE_PATH, save_profile
+
+            target = os.path.join(self.models_dir, os.path.basename(DRIFT_PROFILE_PATH))
+            save_profile(self._value("profile", profile_key), target)
+            artifacts["drift_profile"] = {"file": os.path.basename(target), "key": profile_key,
+                                          "written_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+            self.log(f"[publish] wrote {target}")
+
+        if manifest.get("processed_key") != split_key or self.force:
+            split = self._value("split", split_key)
+            os.makedirs(self.processed_dir, exist_ok=True)
+            pd.DataFrame(split["X_train"], columns=FEATURES).to_csv(os.path.join(self.processed_dir, "X_train.csv"), index=False)
+            pd.DataFrame(split["X_test"], columns=FEATURES).to_csv(os.path.join(self.processed_dir, "X_test.csv"), index=False)
+            pd.Series(split["y_train"], name="Class").to_csv(os.path.join(self.processed_dir, "y_train.csv"), index=False)
+            pd.Series(split["y_test"], name="Class").to_csv(os.path.join(self.processed_dir, "y_test.csv"), index=False)
+            self.log(f"[publish] wrote processed splits to {self.processed_dir}")
+
+        manifest = {
+            "raw_data": self.raw_path,
+            "raw_fingerprint": file_fingerprint(self.raw_path),
+            "processed_key": split_key,
+            "artifacts": artifacts,
+            "stages": self.report,
+        }
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f, indent=2)
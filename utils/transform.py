@@ -0,0 +1,72 @@
+import threading
+
+import numpy as np
+
+from utils.data_loader import FEATURES
+from utils.model_registry import registry
+
+# Rows per in-place pass; 8192 x 29 float32 values (~1 MB) stay resident in L2 cache
+DEFAULT_CHUNK_ROWS = 8192
+
+
+class WinsorScaler:
+    """Winsorization followed by standard scaling, fused into one in-place pass over a float32 block.
+
+    Bounds, means and reciprocal scales are held as contiguous float32 vectors ordered like
+    ``features`` so that each chunk is clipped, centred and scaled while it is still in cache.
+    """
+
+    def __init__(self, features, lower, upper, mean, scale):
+        self.features = list(features)
+        self.lower = np.ascontiguousarray(lower, dtype=np.float32)
+        self.upper = np.ascontiguousarray(upper, dtype=np.float32)
+        self.mean = np.ascontiguousarray(mean, dtype=np.float32)
+        self.inv_scale = np.ascontiguousarray(1.0 / np.asarray(scale, dtype=np.float64), dtype=np.float32)
+
+    @classmethod
+    def from_artifacts(cls, winsorization_bounds, scaler):
+        """Build the transformer from the saved bounds dict and fitted ``StandardScaler``."""
+        features = list(getattr(scaler, "feature_names_in_", FEATURES))
+        n_features = len(features)
+        lower = [winsorization_bounds[col][0] for col in features]
+        upper = [winsorization_bounds[col][1] for col in features]
+        mean = scaler.mean_ if getattr(scaler, "with_mean", True) and scaler.mean_ is not None else np.zeros(n_features)
+        scale = scaler.scale_ if getattr(scaler, "with_std", True) and scaler.scale_ is not None else np.ones(n_features)
+        return cls(features, lower, upper, mean, scale)
+
+    def transform_array(self, block, chunk_rows=DEFAULT_CHUNK_ROWS):
+        """Clip and scale a C-contiguous float32 ``(rows, features)`` block in place and return it."""
+        if block.dtype != np.float32 or not block.flags.c_contiguous:
+            raise ValueError("transform_array expects a C-contiguous float32 block")
+        if block.ndim != 2 or block.shape[1] != len(self.features):
+            raise ValueError(f"Expected a 2-D block with {len(self.features)} columns, got shape {block.shape}")
+
+        chunk_rows = chunk_rows or block.shape[0]
+        for start in range(0, block.shape[0], chunk_rows):
+            view = block[start:start + chunk_rows]
+            np.clip(view, self.lower, self.upper, out=view)
+            view -= self.mean
+            view *= self.inv_scale
+        return block
+
+    def transform(self, df, chunk_rows=DEFAULT_CHUNK_ROWS):
+        """Return the preprocessed float32 matrix for a DataFrame holding the model features."""
+        # np.array always copies, so the caller's frame is never modified
+        block = np.array(df[self.features], dtype=np.float32, order="C")
+        return self.transform_array(block, chunk_rows)
+
+
+_lock = threading.Lock()
+_cached = {}
+
+
+def get_transformer():
+    """Transformer built from the registry's current bounds and scaler, rebuilt only when they change."""
+    bounds = registry.get("winsorization_bounds")
+    scaler = registry.get("scaler")
+    with _lock:
+        # The artifacts themselves are kept and compared by identity: an id() alone can be reused by a
+        # reloaded artifact once the old one is freed
+        if _cached.get("bounds") is not bounds or _cached.get("scaler") is not scaler:
+            _cached.update(transformer=WinsorScaler.from_artifacts(bounds, scaler), bounds=bounds, scaler=scaler)
+        return _cached["transformer"]
@@ -0,0 +1,273 @@
+"""Hyperparameter search for the training models, using successive halving across a process pool.
+
+Each round samples configurations from the model's search space and fits them on a small
+subsample of the training split. Every rung keeps the best ``1/eta`` of the configurations by
+validation average precision and gives the survivors ``eta`` times more rows, until the last rung
+trains on the full fitting rows. ``--hyperband`` runs several such brackets, which trade the number
+of configurations against their starting budget.
+
+The validation rows are a fixed 20% of the pipeline's training split; the test split is not used
+until the winner is reported. Every finished trial is stored under ``data/cache/tuning`` and keyed on
+the split, model, parameters and row budget. An interrupted search therefore resumes from the
+trials already done.
+
+The winner is refitted on the whole training split and written to ``models/<Model>-tuned.pkl``,
+next to its search log ``models/<Model>-tuned.search.json``, and recorded in the training manifest.
+It uses the same preprocessing as the models published by ``python -m train``.
+
+Usage:
+    python -m utils.tuning --model LightGBMClassifier [--configs 27] [--eta 3] [--min-rows 2000] [--hyperband] [--jobs 8]
+"""
+import os
+import json
+import math
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+
+from utils.profiling import ResourceMonitor
+from utils.training import MANIFEST_NAME, MODEL_PARAMS, MODELS_DIR, RANDOM_STATE, TrainingPipeline, _digest, make_model
+
+TUNING_CACHE_DIR = os.path.join("data", "cache", "tuning")
+VALIDATION_FRACTION = 0.2
+DEFAULT_CONFIGS = 27
+DEFAULT_ETA = 3
+DEFAULT_MIN_ROWS = 2000
+
+# (kind, ...) per parameter: ("int", low, high), ("float", low, high), ("log", low, high) or ("choice", [values])
+SEARCH_SPACES = {
+    "XGBClassifier": {
+        "n_estimators": ("choice", [100, 200, 400]),
+        "max_depth": ("int", 3, 10),
+        "learning_rate": ("log", 0.01, 0.3),
+        "subsample": ("float", 0.6, 1.0),
+        "colsample_bytree": ("float", 0.6, 1.0),
+        "min_child_weight": ("log", 1.0, 10.0),
+    },
+    "RandomForestClassifier": {
+        "n_estimators": ("choice", [100, 200, 400]),
+        "max_depth": ("choice", [None, 8, 16, 32]),
+        "min_samples_leaf": ("int", 1, 10),
+        "max_features": ("choice", ["sqrt", "log2", 0.5]),
+    },
+    "LightGBMClassifier": {
+        "n_estimators": ("choice", [200, 500, 1000]),
+        "num_leaves": ("int", 15, 127),
+        "learning_rate": ("log", 0.01, 0.2),
+        "min_child_samples": ("int", 5, 100),
+        "subsample": ("float", 0.6, 1.0),
+        "subsample_freq": ("choice", [1]),
+        "colsample_bytree": ("float", 0.6, 1.0),
+    },
+}
+
+
+def sample_configs(name, n, rng):
+    """``n`` random configurations from the model's search space, on top of its notebook parameters."""
+    configs = []
+    for _ in range(n):
+        params = dict(MODEL_PARAMS[name])
+        for param, (kind, *spec) in SEARCH_SPACES[name].items():
+            if kind == "int":
+                params[param] = int(rng.integers(spec[0], spec[1] + 1))
+            elif kind == "float":
+                params[param] = round(float(rng.uniform(spec[0], spec[1])), 4)
+            elif kind == "log":
+                params[param] = round(float(np.exp(rng.uniform(np.log(spec[0]), np.log(spec[1])))), 5)
+            else:
+                params[param] = spec[0][rng.integers(len(spec[0]))]
+        configs.append(params)
+    return configs
+
+
+def fitting_order(n_rows, validation_fraction=VALIDATION_FRACTION, random_state=RANDOM_STATE):
+    """``(fitting rows, validation rows)`` of the training split; rung subsamples are prefixes of the first."""
+    order = np.random.default_rng(random_state).permutation(n_rows)
+    n_validation = int(n_rows * validation_fraction)
+    return order[n_validation:], order[:n_validation]
+
+
+def run_trial(name, params, rows, split_path, n_jobs):
+    """Fit one configuration on the first ``rows`` fitting rows and score it on the validation rows.
+
+    Runs in a worker process.
+    """
+    from threadpoolctl import threadpool_limits
+
+    from utils.evaluation import summarize
+
+    with ResourceMonitor() as monitor, threadpool_limits(limits=n_jobs):
+        split = joblib.load(split_path, mmap_mode="r")
+        fitting, validation = fitting_order(len(split["y_train"]))
+        subsample = np.sort(fitting[:rows])
+        model = make_model(name, params, n_jobs)
+        model.fit(split["X_train"][subsample], split["y_train"][subsample])
+        probabilities = model.predict_proba(split["X_train"][validation])[:, 1]
+    result = summarize(split["y_train"][validation], probabilities)
+    return {
+        "average_precision": result["average_precision"],
+        "roc_auc": result["roc_auc"],
+        "seconds": monitor.seconds,
+        "peak_rss": monitor.peak_rss,
+    }
+
+
+class SuccessiveHalving:
+    """Successive halving (and Hyperband) over one model's search space, with an on-disk trial cache."""
+
+    def __init__(self, name, split_path, split_key, n_jobs=None, cache_dir=TUNING_CACHE_DIR, log=print):
+        self.name = name
+        self.split_path = split_path
+        self.split_key = split_key
+        self.n_jobs = n_jobs or os.cpu_count() or 1
+        self.cache_dir = cache_dir
+        self.log = log
+        self.trials = []
+        n_rows = len(joblib.load(split_path, mmap_mode="r")["y_train"])
+        self.max_rows = len(fitting_order(n_rows)[0])
+
+    def _trial_path(self, params, rows):
+        key = _digest("trial", [self.split_key, self.name, params, rows, VALIDATION_FRACTION, RANDOM_STATE])
+        return os.path.join(self.cache_dir, f"{self.name}-{key}.json")
+
+    def evaluate(self, configs, rows, bracket=0, rung=0):
+        """Scores of ``configs`` trained on ``rows`` rows; cached trials are read, the rest run in parallel."""
+        results = [None] * len(configs)
+        todo = []
+        for i, params in enumerate(configs):
+            path = self._trial_path(params, rows)
+            if os.path.exists(path):
+                with open(path) as f:
+                    results[i] = {**json.load(f), "cached": True}
+            else:
+                todo.append(i)
+
+        if todo:
+            # Split the core budget between concurrent trials
+            workers = min(len(todo), self.n_jobs)
+            threads = max(self.n_jobs // workers, 1)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {i: pool.submit(run_trial, self.name, configs[i], rows, self.split_path, threads) for i in todo}
+                for i, future in futures.items():
+                    result = future.result()
+                    path = self._trial_path(configs[i], rows)
+                    with open(f"{path}.tmp", "w") as f:
+                        json.dump(result, f)
+                    os.replace(f"{path}.tmp", path)
+                    results[i] = {**result, "cached": False}
+
+        for params, result in zip(configs, results):
+            self.trials.append({"bracket": bracket, "rung": rung, "rows": rows, "params": params, **result})
+        cached = len(configs) - len(todo)
+        best = max(result["average_precision"] for result in results)
+        self.log(f"[bracket {bracket} rung {rung}] {len(configs)} configs on {rows:,} rows "
+                 f"({cached} cached), best average precision {best:.4f}")
+        return [result["average_precision"] for result in results]
+
+    def bracket(self, configs, min_rows, eta=DEFAULT_ETA, bracket=0):
+        """Run one successive-halving bracket; returns ``(best params, its score)`` at the full budget."""
+        rungs = max(math.ceil(math.log(max(self.max_rows / min_rows, 1), eta)), 0)
+        for rung in range(rungs + 1):
+            # A lone survivor goes straight to the full budget
+            final = rung == rungs or len(configs) == 1
+            rows = self.max_rows if final else min(int(min_rows * eta ** rung), self.max_rows)
+            scores = self.evaluate(configs, rows, bracket, rung)
+            order = np.argsort(scores)[::-1]
+            if final:
+                return configs[order[0]], scores[order[0]]
+            configs = [configs[i] for i in order[:max(len(configs) // eta, 1)]]
+
+    def search(self, n_configs=DEFAULT_CONFIGS, min_rows=DEFAULT_MIN_ROWS, eta=DEFAULT_ETA, hyperband=False,
+               random_state=RANDOM_STATE):
+        """Best ``(params, score)`` over one bracket of ``n_configs``, or over all Hyperband brackets."""
+        rng = np.random.default_rng(random_state)
+        min_rows = min(min_rows, self.max_rows)
+        if not hyperband:
+            return self.bracket(sample_configs(self.name, n_configs, rng), min_rows, eta)
+
+        # Hyperband: bracket s starts with fewer configurations on eta**s times the rows of the most aggressive one
+        s_max = max(math.ceil(math.log(max(self.max_rows / min_rows, 1), eta)), 0)
+        best = None
+        for s in range(s_max + 1):
+            n = max(math.ceil(n_configs / eta ** s), 1)
+            candidate = self.bracket(sample_configs(self.name, n, rng), min(int(min_rows * eta ** s), self.max_rows), eta, bracket=s)
+            if best is None or candidate[1] > best[1]:
+                best = candidate
+        return best
+
+
+def publish_winner(name, params, search, split_path, split_key, n_jobs, models_dir=MODELS_DIR):
+    """Refit ``params`` on the full training split, report test metrics and write the model, log and manifest entry."""
+    from utils.evaluation import summarize
+
+    split = joblib.load(split_path, mmap_mode="r")
+    with ResourceMonitor() as monitor:
+        model = make_model(name, params, n_jobs)
+        model.fit(split["X_train"], split["y_train"])
+    test = summarize(split["y_test"], model.predict_proba(split["X_test"])[:, 1])
+
+    tuned_name = f"{name}-tuned"
+    os.makedirs(models_dir, exist_ok=True)
+    joblib.dump(model, os.path.join(models_dir, f"{tuned_name}.pkl"))
+    log = {
+        "model": name,
+        "params": params,
+        "split_key": split_key,
+        "validation_fraction": VALIDATION_FRACTION,
+        "refit_seconds": monitor.seconds,
+        "test": {key: float(test[key]) for key in ["accuracy", "precision", "recall", "f1", "roc_auc", "average_precision"]},
+        "trials": search.trials,
+    }
+    log_path = os.path.join(models_dir, f"{tuned_name}.search.json")
+    with open(log_path, "w") as f:
+        json.dump(log, f, indent=2, default=str)
+
+    manifest_path = os.path.join(models_dir, MANIFEST_NAME)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    manifest.setdefault("artifacts", {})[tuned_name] = {
+        "file": f"{tuned_name}.pkl",
+        "key": _digest("tuned", [split_key, name, params]),
+        "written_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "params": params,
+        "search_log": os.path.basename(log_path),
+    }
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return log
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tune a model's hyperparameters with successive halving.")
+    parser.add_argument("--model", choices=list(SEARCH_SPACES), default="LightGBMClassifier", help="model to tune (default: %(default)s)")
+    parser.add_argument("--configs", type=int, default=DEFAULT_CONFIGS, help="configurations sampled for the first rung (default: %(default)s)")
+    parser.add_argument("--eta", type=int, default=DEFAULT_ETA, help="keep 1/eta of the configurations per rung (default: %(default)s)")
+    parser.add_argument("--min-rows", type=int, default=DEFAULT_MIN_ROWS, help="training rows of the first rung (default: %(default)s)")
+    parser.add_argument("--hyperband", action="store_true", help="run every Hyperband bracket instead of a single one")
+    parser.add_argument("--jobs", type=int, default=None, help="total cores shared by concurrent trials (default: all)")
+    parser.add_argument("--seed", type=int, default=RANDOM_STATE, help="seed for sampling configurations (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    pipeline = TrainingPipeline(n_jobs=args.jobs)
+    _, split_key = pipeline.prepare()
+    split_path = pipeline.split_path(split_key)
+
+    search = SuccessiveHalving(args.model, split_path, split_key, n_jobs=args.jobs)
+    start = time.perf_counter()
+    params, score = search.search(args.configs, args.min_rows, args.eta, args.hyperband, args.seed)
+    print(f"Best validation average precision {score:.4f} after {len(search.trials)} trials "
+          f"in {time.perf_counter() - start:.1f}s with {params}")
+
+    log = publish_winner(args.model, params, search, split_path, split_key, search.n_jobs)
+    print("Test " + "  ".join(f"{key} {value:.4f}" for key, value in log["test"].items()))
+    print(f"Wrote {os.path.join(MODELS_DIR, args.model + '-tuned.pkl')} and its search log")
+
+
+if __name__ == "__main__":
+    main()